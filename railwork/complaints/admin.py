@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
+from django.urls import reverse
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import City, Station, LocationType, PlatformLocation, Complaint, ComplaintPhoto, OTPVerification, UserProfile, QRScanAttempt, SupportRequest
+from .models import City, Station, LocationType, PlatformLocation, Complaint, ComplaintPhoto, OTPVerification, UserProfile, QRScanAttempt, SupportRequest, SMSOutbox
 
 class CityAdmin(admin.ModelAdmin):
     list_display = ('name', 'code', 'admin')
@@ -28,8 +29,9 @@ class PlatformLocationInline(admin.TabularInline):
 
     def qr_code_preview(self, obj):
         if obj.qr_code:
-            return format_html('<a href="{}" target="_blank"><img src="{}" width="100" height="100" /></a>', 
-                             obj.qr_code.url, obj.qr_code.url)
+            # Media is not published under MEDIA_URL; location_qr_code serves it to signed-in staff
+            url = reverse('location_qr_code', args=[obj.id])
+            return format_html('<a href="{}" target="_blank"><img src="{}" width="100" height="100" /></a>', url, url)
         return "No QR code generated yet"
     qr_code_preview.short_description = _('QR Code')
 
@@ -117,6 +119,13 @@ class QRScanAttemptAdmin(admin.ModelAdmin):
             return qs.filter(platform_location__station__city__admin=request.user)
         return qs
 
+class SMSOutboxAdmin(admin.ModelAdmin):
+    list_display = ('phone_number', 'complaint', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('phone_number', 'complaint__complaint_number')
+    readonly_fields = ('created_at', 'sent_at', 'locked_until', 'last_error')
+    ordering = ['-created_at']
+
 class SupportRequestAdmin(admin.ModelAdmin):
     list_display = ('id', 'station', 'manager_name', 'issue_category', 'priority', 'status', 'created_at', 'assigned_to')
     list_filter = ('status', 'priority', 'issue_category', 'station__city', 'created_at')
@@ -140,3 +149,4 @@ admin.site.register(OTPVerification)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(QRScanAttempt, QRScanAttemptAdmin)
 admin.site.register(SupportRequest, SupportRequestAdmin)
+admin.site.register(SMSOutbox, SMSOutboxAdmin)
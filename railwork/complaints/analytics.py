@@ -0,0 +1,304 @@
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour, TruncMonth
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+from .models import Complaint, ComplaintHourlyRollup, QRScanAttempt
+from .station_cache import get_cached
+
+
+def status_counts(prefix=''):
+    """Conditional aggregates for total/pending/in_progress/resolved/closed counts"""
+    return {
+        f'{prefix}total': Count('id'),
+        f'{prefix}pending': Count('id', filter=Q(status='PENDING')),
+        f'{prefix}in_progress': Count('id', filter=Q(status='IN_PROGRESS')),
+        f'{prefix}resolved': Count('id', filter=Q(status='RESOLVED')),
+        f'{prefix}closed': Count('id', filter=Q(is_closed=True)),
+    }
+
+
+def rollup_status_counts(prefix=''):
+    """Same aggregates as status_counts(), summed over ComplaintHourlyRollup rows"""
+    return {
+        f'{prefix}total': Coalesce(Sum('complaint_count'), 0),
+        f'{prefix}pending': Coalesce(Sum('complaint_count', filter=Q(status='PENDING')), 0),
+        f'{prefix}in_progress': Coalesce(Sum('complaint_count', filter=Q(status='IN_PROGRESS')), 0),
+        f'{prefix}resolved': Coalesce(Sum('complaint_count', filter=Q(status='RESOLVED')), 0),
+        f'{prefix}closed': Coalesce(Sum('complaint_count', filter=Q(is_closed=True)), 0),
+    }
+
+
+def empty_counts():
+    return {'total': 0, 'pending': 0, 'in_progress': 0, 'resolved': 0, 'closed': 0}
+
+
+def get_station_timezone():
+    """Time zone that station days and hours are counted in (STATION_TIME_ZONE)"""
+    return ZoneInfo(settings.STATION_TIME_ZONE)
+
+
+def local_day_range(day, tzinfo):
+    """Aware [start, end) datetimes covering a calendar day in tzinfo"""
+    start = timezone.make_aware(datetime.combine(day, time.min), tzinfo)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tzinfo)
+    return start, end
+
+
+def time_series(queryset, unit, start, end, tzinfo, field='created_at', **aggregates):
+    """
+    Aggregate queryset per hour or day with a single GROUP BY query.
+
+    unit is 'hour' or 'day'. For days, start and end are dates and both are
+    included; for hours, they are aware datetimes and end is excluded. Buckets
+    are computed in the database in tzinfo and missing buckets are zero-filled,
+    so the result has one (bucket, values) pair for every hour/day in the range.
+    Aggregates default to a plain row count under 'count'.
+    """
+    aggregates = aggregates or {'count': Count('id')}
+    if unit == 'day':
+        range_start = local_day_range(start, tzinfo)[0]
+        range_end = local_day_range(end, tzinfo)[1]
+        trunc = TruncDate(field, tzinfo=tzinfo)
+    elif unit == 'hour':
+        range_start = timezone.localtime(start, tzinfo).replace(minute=0, second=0, microsecond=0)
+        range_end = end
+        trunc = TruncHour(field, tzinfo=tzinfo)
+    else:
+        raise ValueError(f"Unknown time series unit: {unit}")
+
+    rows = {
+        row['bucket']: row
+        for row in queryset.order_by().filter(**{f'{field}__gte': range_start, f'{field}__lt': range_end})
+        .annotate(bucket=trunc)
+        .values('bucket')
+        .annotate(**aggregates)
+    }
+
+    series = []
+    if unit == 'day':
+        bucket, step, stop = start, timedelta(days=1), end + timedelta(days=1)
+    else:
+        bucket, step, stop = range_start, timedelta(hours=1), range_end
+    while bucket < stop:
+        row = rows.get(bucket)
+        series.append((bucket, {key: row[key] if row else 0 for key in aggregates}))
+        bucket = bucket + step if unit == 'day' else timezone.localtime(bucket + step, tzinfo)
+    return series
+
+
+def calculate_change(today_val, yesterday_val):
+    """Percentage change from yesterday's value to today's value"""
+    if yesterday_val == 0:
+        return 100 if today_val > 0 else 0
+    return round(((today_val - yesterday_val) / yesterday_val) * 100, 1)
+
+
+def get_station_analytics(station):
+    """
+    Build the station analytics context using a handful of grouped queries.
+
+    Every breakdown (overall, daily, hourly, weekly, platform, location) is
+    computed with conditional aggregation, so the number of queries does not
+    depend on the number of days, platforms or locations of the station.
+    All-time totals are read from the hourly rollup table instead of the
+    complaints table.
+    """
+    complaints = Complaint.objects.filter(station=station).order_by()
+    rollups = ComplaintHourlyRollup.objects.filter(station=station).order_by()
+    tzinfo = get_station_timezone()
+    now = timezone.now()
+    today = timezone.localtime(now, tzinfo).date()
+    yesterday = today - timedelta(days=1)
+    thirty_days_ago = now - timedelta(days=30)
+    first_day = today - timedelta(days=29)
+    today_start, today_end = local_day_range(today, tzinfo)
+
+    # Overall statistics
+    overall = rollups.aggregate(**rollup_status_counts())
+
+    # Per-day statistics for the last 30 days (covers today, yesterday and the weekly pattern)
+    per_day = dict(time_series(complaints, 'day', first_day, today, tzinfo, **status_counts()))
+
+    def day_stats(date):
+        return dict(per_day.get(date) or empty_counts())
+
+    today_stats = day_stats(today)
+    yesterday_stats = day_stats(yesterday)
+
+    # Daily trend (last 30 days, oldest to newest)
+    daily_data = []
+    for date, counts in per_day.items():
+        daily_data.append({
+            'date': date.strftime('%Y-%m-%d'),
+            'date_display': date.strftime('%b %d'),
+            **counts,
+        })
+
+    # Hourly pattern analysis (today)
+    today_complaints = complaints.filter(created_at__gte=today_start, created_at__lt=today_end)
+    hourly_stats = [
+        {'hour': bucket.hour, 'hour_display': f"{bucket.hour:02d}:00", 'count': counts['count']}
+        for bucket, counts in time_series(complaints, 'hour', today_start, today_end, tzinfo)
+    ]
+
+    # Weekly pattern (last 7 days)
+    weekly_stats = []
+    for i in range(6, -1, -1):
+        date = today - timedelta(days=i)
+        weekly_stats.append({
+            'date': date,
+            'day_name': date.strftime('%A'),
+            'day_short': date.strftime('%a'),
+            'count': day_stats(date)['total'],
+        })
+
+    # Per-location statistics: all-time totals from the rollup, today's counts from the complaints
+    per_location = {
+        row['platform_location']: row
+        for row in rollups.filter(platform_location__isnull=False)
+        .values('platform_location')
+        .annotate(**rollup_status_counts())
+    }
+    per_location_today = {
+        row['platform_location']: row
+        for row in today_complaints.filter(platform_location__isnull=False)
+        .values('platform_location')
+        .annotate(**status_counts())
+    }
+    scan_attempts_today = dict(
+        QRScanAttempt.objects.filter(
+            platform_location__station=station,
+            last_attempt_at__gte=today_start,
+            last_attempt_at__lt=today_end
+        ).order_by().values_list('platform_location').annotate(total=Sum('attempt_count'))
+    )
+
+    today_location_stats = []
+    qr_location_stats = []
+    per_platform = {}
+    for location in station.platform_locations.all():
+        row = per_location.get(location.id, {})
+        today_row = per_location_today.get(location.id, {})
+        total_scan_attempts = scan_attempts_today.get(location.id, 0)
+        today_count = today_row.get('total', 0)
+
+        # Top complaint locations (daily)
+        if today_count > 0 or total_scan_attempts > 0:
+            today_location_stats.append({
+                'location': location,
+                'count': today_count,
+                'pending': today_row.get('pending', 0),
+                'resolved': today_row.get('resolved', 0),
+                'scan_attempts': total_scan_attempts,
+                'total_interest': today_count + total_scan_attempts,  # Combined metric
+            })
+
+        # QR Location-wise statistics
+        qr_location_stats.append({
+            'location': location,
+            'total': row.get('total', 0),
+            'pending': row.get('pending', 0),
+            'resolved': row.get('resolved', 0),
+        })
+
+        # Roll locations up into their platform
+        platform = per_platform.setdefault(location.platform_number, {'today': 0, **empty_counts()})
+        platform['today'] += today_count
+        for key in empty_counts():
+            platform[key] += row.get(key, 0)
+    today_location_stats.sort(key=lambda x: x['total_interest'], reverse=True)
+
+    # Platform-wise statistics
+    platform_stats = []
+    for platform_num in range(1, station.total_platforms + 1):
+        row = per_platform.get(platform_num, {})
+        platform_stats.append({
+            'platform_number': platform_num,
+            'total': row.get('total', 0),
+            'today': row.get('today', 0),
+            'pending': row.get('pending', 0),
+            'in_progress': row.get('in_progress', 0),
+            'resolved': row.get('resolved', 0),
+            'closed': row.get('closed', 0),
+        })
+
+    # Worker performance statistics
+    worker_stats = complaints.exclude(assigned_worker__isnull=True).exclude(assigned_worker='').values('assigned_worker').annotate(
+        total_assigned=Count('id'),
+        resolved_count=Count('id', filter=Q(status='RESOLVED')),
+        closed_count=Count('id', filter=Q(is_closed=True))
+    ).order_by('-resolved_count')
+
+    # Monthly trend (last 12 months)
+    monthly_data = complaints.filter(
+        created_at__range=[now - timedelta(days=365), now]
+    ).annotate(
+        month=TruncMonth('created_at', tzinfo=tzinfo)
+    ).values('month').annotate(
+        count=Count('id')
+    ).order_by('month')
+
+    # Status distribution for charts
+    status_distribution = {
+        'pending': overall['pending'],
+        'in_progress': overall['in_progress'],
+        'resolved': overall['resolved'],
+        'closed': overall['closed'],
+    }
+
+    # Recent activity (last 30 days)
+    recent_complaints = complaints.filter(created_at__gte=thirty_days_ago).order_by('-created_at')[:10]
+
+    daily_changes = {
+        'total': calculate_change(today_stats['total'], yesterday_stats['total']),
+        'pending': calculate_change(today_stats['pending'], yesterday_stats['pending']),
+        'in_progress': calculate_change(today_stats['in_progress'], yesterday_stats['in_progress']),
+        'resolved': calculate_change(today_stats['resolved'], yesterday_stats['resolved']),
+    }
+
+    return {
+        'station': station,
+        'total_complaints': overall['total'],
+        'pending_complaints': overall['pending'],
+        'in_progress_complaints': overall['in_progress'],
+        'resolved_complaints': overall['resolved'],
+        'closed_complaints': overall['closed'],
+
+        # Daily analytics
+        'today_stats': today_stats,
+        'yesterday_stats': yesterday_stats,
+        'daily_changes': daily_changes,
+        'daily_data': daily_data,
+        'hourly_stats': hourly_stats,
+        'weekly_stats': weekly_stats,
+        'today_location_stats': today_location_stats,
+
+        # Existing analytics
+        'platform_stats': platform_stats,
+        'qr_location_stats': qr_location_stats,
+        'worker_stats': worker_stats,
+        'monthly_data': monthly_data,
+        'status_distribution': status_distribution,
+        'recent_complaints': recent_complaints,
+    }
+
+
+def get_cached_station_analytics(station):
+    """
+    get_station_analytics() served from the per-station cache.
+
+    The cache key includes the current station-local date because the daily,
+    hourly and weekly windows move at midnight even when no complaint changes.
+    """
+    def build():
+        context = get_station_analytics(station)
+        del context['station']
+        for key in ('worker_stats', 'monthly_data', 'recent_complaints'):
+            context[key] = list(context[key])
+        return context
+
+    context = dict(get_cached(station.id, f'analytics:{timezone.localtime(timezone.now(), get_station_timezone()).date().isoformat()}', build))
+    context['station'] = station
+    return context
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_delete
 
 
 class ComplaintsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'complaints'
+
+    def ready(self):
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='complaints.configure_sqlite')
+        from .rollups import complaint_deleted
+        pre_delete.connect(complaint_deleted, sender=self.get_model('Complaint'), dispatch_uid='complaints.complaint_deleted')
@@ -0,0 +1,49 @@
+"""
+Per-connection database setup.
+
+SQLite keeps most tuning per connection, so configure_sqlite() runs on
+every new connection (ComplaintsConfig.ready connects it to
+connection_created) and applies the SQLITE_* settings:
+
+- journal_mode=WAL lets requests read while a complaint is being written;
+  with the default rollback journal every write blocks all readers.
+- synchronous=NORMAL only syncs the WAL at checkpoints instead of on every
+  commit. A power cut can lose the last commits, never corrupt the file.
+- busy_timeout makes a writer wait for the lock held by another one instead
+  of failing with "database is locked".
+- mmap_size reads the database through a memory map instead of read() calls.
+
+The journal mode is stored in the database file itself, so it is only
+changed when it differs; switching it needs the database to itself.
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        if cursor.fetchone()[0].upper() != settings.SQLITE_JOURNAL_MODE.upper():
+            cursor.execute(f'PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}')
+        cursor.execute(f'PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}')
+        cursor.execute(f'PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT)}')
+        cursor.execute(f'PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}')
+
+
+def describe_connection(connection):
+    """One line describing the database profile a connection runs with"""
+    settings_dict = connection.settings_dict
+    line = f"{connection.vendor}, CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}, health checks {'on' if settings_dict['CONN_HEALTH_CHECKS'] else 'off'}"
+    if connection.vendor != 'sqlite':
+        return line
+    pragmas = []
+    with connection.cursor() as cursor:
+        for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+            cursor.execute(f'PRAGMA {pragma}')
+            row = cursor.fetchone()
+            # In-memory databases have no mmap_size
+            if row is not None:
+                pragmas.append(f'{pragma}={row[0]}')
+    transaction_mode = settings_dict['OPTIONS'].get('transaction_mode') or 'DEFERRED'
+    return f"{line}, {', '.join(pragmas)}, {transaction_mode} transactions"
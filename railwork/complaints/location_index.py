@@ -0,0 +1,117 @@
+"""
+Cache-backed index of the complaint a QR location's duplicate scans go to.
+
+submit_complaint redirects a scan to the open, verified complaint created at
+the same location within DUPLICATE_WINDOW. The index keeps that complaint per
+platform_location_id so a burst of scans at one spot does not query the
+complaints table each time. Entries expire when the complaint leaves the
+window, are filled when a complaint is verified (or after a database lookup
+found one), refreshed when it is saved, and evicted when it is closed or
+changed in bulk. A missing entry only means "look in the database"; a hit
+still costs a primary-key lookup, which replaces the location scan.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .station_cache import get_cache
+
+DUPLICATE_WINDOW = timedelta(minutes=15)
+
+# Complaint attributes kept in an entry; enough to count a scan attempt and redirect
+ENTRY_FIELDS = ('id', 'station_id', 'platform_location_id', 'parent_complaint_id', 'status', 'is_closed', 'created_at')
+
+
+def location_key(location_id):
+    return f'hot-location:{location_id}'
+
+
+def _is_candidate(complaint):
+    return (
+        complaint.platform_location_id is not None
+        and complaint.is_verified
+        and not complaint.is_closed
+        and complaint.created_at is not None
+        and complaint.created_at > timezone.now() - DUPLICATE_WINDOW
+    )
+
+
+def get_active_complaint(location_id):
+    """
+    The indexed duplicate target of a location as an unsaved Complaint, or None.
+
+    A hit is confirmed with a primary-key lookup, since the complaint may have
+    been closed or changed by a process whose eviction this cache did not see;
+    an entry that no longer qualifies is dropped. The returned instance only
+    carries ENTRY_FIELDS; it is meant for redirects and scan attempt
+    bookkeeping, not for saving.
+    """
+    from .models import Complaint
+    cache = get_cache()
+    key = location_key(location_id)
+    entry = cache.get(key)
+    if entry is None or entry['created_at'] < timezone.now() - DUPLICATE_WINDOW:
+        return None
+    entry = Complaint.objects.filter(
+        pk=entry['id'], platform_location_id=location_id, is_verified=True, is_closed=False,
+    ).values(*ENTRY_FIELDS).first()
+    if entry is None:
+        cache.delete(key)
+        return None
+    complaint = Complaint(**entry)
+    complaint._state.adding = False
+    return complaint
+
+
+def remember(complaint, replace=False):
+    """
+    Index complaint as its location's duplicate target while it is in the window.
+
+    An existing entry for another complaint is kept unless replace is True.
+    Inside a transaction the entry is written once it commits.
+    """
+    if not _is_candidate(complaint):
+        return
+    entry = {field: getattr(complaint, field) for field in ENTRY_FIELDS}
+    transaction.on_commit(lambda: _store(entry, replace))
+
+
+def _store(entry, replace):
+    timeout = int((entry['created_at'] + DUPLICATE_WINDOW - timezone.now()).total_seconds())
+    if timeout <= 0:
+        return
+    cache = get_cache()
+    key = location_key(entry['platform_location_id'])
+    if replace:
+        cache.set(key, entry, timeout)
+    elif not cache.add(key, entry, timeout):
+        current = cache.get(key)
+        if current is not None and current['id'] == entry['id']:
+            cache.set(key, entry, timeout)
+
+
+def complaint_saved(complaint):
+    """Keep the index in step with a saved complaint"""
+    if complaint.platform_location_id is None:
+        return
+    if _is_candidate(complaint):
+        remember(complaint)
+        return
+    current = get_cache().get(location_key(complaint.platform_location_id))
+    if current is not None and current['id'] == complaint.id:
+        forget_locations([complaint.platform_location_id])
+
+
+def forget_locations(location_ids):
+    """
+    Drop the entries of these locations (after bulk updates or deletes).
+
+    Like invalidate_station(), this happens immediately and again on commit.
+    """
+    keys = [location_key(location_id) for location_id in location_ids if location_id is not None]
+    if not keys:
+        return
+    get_cache().delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
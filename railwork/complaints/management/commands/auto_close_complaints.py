@@ -1,7 +1,14 @@
-from django.core.management.base import BaseCommand
+import os
+import socket
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
 from django.utils import timezone
 from datetime import timedelta
-from complaints.models import Complaint
+from complaints.models import Complaint, JobLock
+from complaints.rollups import record_bulk_change
+
+LOCK_NAME = 'auto_close_complaints'
 
 
 class Command(BaseCommand):
@@ -13,34 +20,116 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be closed without actually closing',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Complaints closed per UPDATE and transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, closing stale complaints every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=300,
+            help='Seconds between runs in --loop mode (default: 300)',
+        )
+        parser.add_argument(
+            '--lock-timeout',
+            type=float,
+            default=600,
+            help='Seconds the run lock is held without renewal before another node may take it (default: 600)',
+        )
 
     def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['dry_run']:
+            self.report_stale()
+            return
+
+        owner = f'{socket.gethostname()}:{os.getpid()}'
+        try:
+            while True:
+                if JobLock.acquire(LOCK_NAME, owner, options['lock_timeout']):
+                    self.close_stale(options['batch_size'], owner, options['lock_timeout'])
+                else:
+                    self.stdout.write(self.style.WARNING('Another node is auto-closing complaints, skipping this run'))
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping')
+        finally:
+            JobLock.release(LOCK_NAME, owner)
+
+    def stale_complaints(self):
         # Get complaints older than 24 hours that are not closed
         twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-        
-        complaints_to_close = Complaint.objects.filter(
+        return Complaint.objects.filter(
             created_at__lte=twenty_four_hours_ago,
             is_closed=False
         )
 
+    def report_stale(self):
+        complaints_to_close = self.stale_complaints()
         count = complaints_to_close.count()
-        
-        if options['dry_run']:
-            self.stdout.write(
-                self.style.WARNING(f'Would close {count} complaints (dry run mode)')
+
+        self.stdout.write(
+            self.style.WARNING(f'Would close {count} complaints (dry run mode)')
+        )
+        for complaint in complaints_to_close[:10]:  # Show first 10
+            self.stdout.write(f'  - {complaint.complaint_number} ({complaint.status})')
+        if count > 10:
+            self.stdout.write(f'  ... and {count - 10} more')
+
+    def close_stale(self, batch_size, owner, lock_timeout):
+        """
+        Close stale complaints batch_size at a time with one UPDATE each.
+
+        Open daughter complaints of a closed parent are closed with it, as
+        when a parent is closed by hand. Every batch is its own transaction
+        and renews the run lock first; if another node has taken the lock
+        over in the meantime, the run stops and leaves the rest to it.
+        """
+        started = time.perf_counter()
+        closed = batches = 0
+        last_pk = 0
+        while True:
+            ids = list(
+                self.stale_complaints().filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
             )
-            for complaint in complaints_to_close[:10]:  # Show first 10
-                self.stdout.write(f'  - {complaint.complaint_number} ({complaint.status})')
-            if count > 10:
-                self.stdout.write(f'  ... and {count - 10} more')
-        else:
-            # Close the complaints
-            for complaint in complaints_to_close:
-                complaint.is_closed = True
-                complaint.closed_at = timezone.now()
-                complaint.closed_status = complaint.status
-                complaint.save()
-
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully auto-closed {count} complaints')
-            ) 
\ No newline at end of file
+            if not ids:
+                break
+            last_pk = ids[-1]
+
+            if not JobLock.acquire(LOCK_NAME, owner, lock_timeout):
+                self.stdout.write(self.style.WARNING(
+                    f'Lost the run lock to another node after {closed} closed, stopping this run'
+                ))
+                return
+            now = timezone.now()
+            with transaction.atomic():
+                batch = Complaint.objects.filter(
+                    models.Q(pk__in=ids) | models.Q(parent_complaint_id__in=ids),
+                    is_closed=False,
+                )
+                record_bulk_change(batch, is_closed=True)
+                closed += batch.update(
+                    is_closed=True,
+                    closed_at=now,
+                    closed_status=models.F('status'),
+                    updated_at=now,
+                )
+            batches += 1
+            self.stdout.write(f'  batch {batches}: {closed} closed ({time.perf_counter() - started:.1f}s)')
+
+        elapsed = time.perf_counter() - started
+        rate = f', {closed / elapsed:.0f}/s' if closed and elapsed else ''
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully auto-closed {closed} complaints in {batches} batches ({elapsed:.1f}s{rate})')
+        )
@@ -0,0 +1,113 @@
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from complaints.db import describe_connection
+from complaints.models import City, Complaint, PlatformLocation, Station
+from complaints.purge import Purger
+
+
+class Command(BaseCommand):
+    help = (
+        'Submit complaints from concurrent clients against the configured database and report throughput, '
+        'latency and errors. Run it once per profile, e.g. with DATABASE_ENGINE=postgresql or '
+        'SQLITE_JOURNAL_MODE=DELETE SQLITE_TRANSACTION_MODE=DEFERRED for the untuned SQLite defaults.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients (default: 8)')
+        parser.add_argument('--requests', type=int, default=25, help='Complaints submitted per client (default: 25)')
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['requests'] < 1:
+            raise CommandError('--threads and --requests must be at least 1')
+        self.stdout.write(f'Database profile: {describe_connection(connection)}')
+
+        # Scratch media for the QR image; no OTP SMS is queued for the fake numbers
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root, FAST2SMS_API_KEY='', ALLOWED_HOSTS=['testserver']):
+                city = City.objects.create(name='Submission Benchmark', code='BENCHSUB')
+                station = Station.objects.create(name='Benchmark Station', station_code='BENCHSUB', city=city)
+                location = PlatformLocation.objects.create(station=station, platform_number=1, location_description='Benchmark')
+                try:
+                    self.run_clients(station, location, options['threads'], options['requests'])
+                finally:
+                    purger = Purger()
+                    purger.delete_station(station)
+                    purger.finish()
+                    city.delete()
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def run_clients(self, station, location, threads, requests):
+        url = reverse('submit_complaint')
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def client(number):
+            browser = Client()
+            try:
+                for request in range(requests):
+                    data = {
+                        'station': station.id,
+                        'platform_location': location.id,
+                        # Unverified complaints are never treated as duplicates, so every one is stored
+                        'reporter_phone': f'9{number:04d}{request:05d}',
+                    }
+                    started = time.perf_counter()
+                    try:
+                        response = browser.post(url, data)
+                        error = None if response.status_code == 302 else f'HTTP {response.status_code}'
+                    except DatabaseError as e:
+                        error = f'{type(e).__name__}: {e}'
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        if error:
+                            errors[error] += 1
+                        else:
+                            latencies.append(elapsed)
+            finally:
+                # Each thread has its own connection
+                connection.close()
+
+        self.stdout.write(f'Submitting {threads * requests} complaints from {threads} concurrent clients...')
+        workers = [threading.Thread(target=client, args=(number,)) for number in range(threads)]
+        # Failed submissions are counted below instead of each logging a traceback
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        started = time.perf_counter()
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            request_logger.setLevel(level)
+        elapsed = time.perf_counter() - started
+
+        stored = Complaint.objects.filter(station=station).count()
+        latencies.sort()
+        if latencies:
+            def percentile(fraction):
+                return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+            self.stdout.write(
+                f'  latency p50 {percentile(0.5):.0f} ms, p95 {percentile(0.95):.0f} ms, max {latencies[-1] * 1000:.0f} ms'
+            )
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.WARNING(f'  {count} failed: {error}'))
+        style = self.style.SUCCESS if not errors else self.style.WARNING
+        self.stdout.write(style(
+            f'{stored} of {threads * requests} complaints stored in {elapsed:.1f}s ({stored / elapsed:.1f}/s)'
+        ))
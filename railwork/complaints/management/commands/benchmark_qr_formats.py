@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from complaints.qr import QR_FORMATS, render_qr
+
+
+class Command(BaseCommand):
+    help = 'Compare file size and render time of the QR code formats for a typical station'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platforms', type=int, default=20, help='Platforms per station (default: 20)')
+        parser.add_argument('--spots', type=int, default=10, help='QR locations per platform (default: 10)')
+        parser.add_argument('--domain', type=str, default=settings.QR_CODE_DOMAIN, help='Domain encoded in the QR codes')
+
+    def handle(self, *args, **options):
+        # Same payload shape as PlatformLocation.get_qr_code_data()
+        payloads = [
+            f"{settings.QR_CODE_SCHEME}://{options['domain']}/en/submit-complaint/?station=1&platform={platform}&location={platform * 100 + spot}"
+            for platform in range(1, options['platforms'] + 1)
+            for spot in range(1, options['spots'] + 1)
+        ]
+        self.stdout.write(f'Rendering {len(payloads)} QR codes per format')
+        self.stdout.write(f"  {'format':<8} {'total KiB':>10} {'avg bytes':>10} {'vs rgb-png':>10} {'ms/code':>8}")
+
+        baseline = None
+        for fmt in ('rgb-png', 'png', 'svg'):
+            started = time.perf_counter()
+            sizes = [len(render_qr(payload, fmt)) for payload in payloads]
+            elapsed = time.perf_counter() - started
+            total = sum(sizes)
+            baseline = baseline or total
+            self.stdout.write(
+                f'  {fmt:<8} {total / 1024:>10.1f} {total / len(sizes):>10.0f} {total / baseline:>10.2f} '
+                f'{elapsed / len(sizes) * 1000:>8.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS(f"Formats available for QR_CODE_FORMAT: {', '.join(QR_FORMATS)}"))
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from complaints.models import City, PlatformLocation, Station
+from complaints.onboarding import bulk_create_locations
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare creating station QR locations one by one with the bulk onboarding path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--platforms', type=int, default=20, help='Platforms per station (default: 20)')
+        parser.add_argument('--spots', type=int, default=10, help='QR locations per platform (default: 10)')
+        parser.add_argument('--workers', type=int, default=None, help='QR render processes for the bulk path (default: QR_RENDER_WORKERS)')
+
+    def handle(self, *args, **options):
+        payload = [
+            {'platform_number': platform, 'locations': [f'Spot {spot}' for spot in range(1, options['spots'] + 1)]}
+            for platform in range(1, options['platforms'] + 1)
+        ]
+        total = options['platforms'] * options['spots']
+        workers = options['workers'] or settings.QR_RENDER_WORKERS or os.cpu_count() or 1
+        self.stdout.write(
+            f"Creating {total} QR locations ({options['platforms']} platforms x {options['spots']} spots), "
+            f"bulk path renders with {workers} processes"
+        )
+
+        # QR images go to a scratch media directory and all rows are rolled back
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                one_by_one = self.measure('one by one', lambda station: self.create_one_by_one(station, payload))
+                bulk = self.measure('bulk', lambda station: bulk_create_locations(station, payload, options['workers']))
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        speedup = one_by_one / bulk if bulk else float('inf')
+        self.stdout.write(self.style.SUCCESS(f'Bulk path is {speedup:.1f}x faster'))
+
+    def create_one_by_one(self, station, payload):
+        """The original station_setup loop"""
+        for platform_data in payload:
+            for location_description in platform_data['locations']:
+                PlatformLocation.objects.create(
+                    station=station,
+                    platform_number=platform_data['platform_number'],
+                    location_description=location_description
+                )
+
+    def measure(self, label, create):
+        try:
+            with transaction.atomic():
+                city = City.objects.create(name='Onboarding Benchmark', code='BENCHOB')
+                station = Station.objects.create(name='Benchmark Station', station_code='BENCH', city=city)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    create(station)
+                    elapsed = time.perf_counter() - started
+                created = station.platform_locations.exclude(qr_code='').count()
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(f'  {label:<12} {elapsed * 1000:8.0f} ms  {len(queries):5d} queries  {created} QR codes')
+        return elapsed
@@ -0,0 +1,88 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from complaints.models import ComplaintPhoto, PhotoContent
+from complaints.photo_store import adopt_photos, hash_file, recount_contents
+
+
+def hash_photo(photo):
+    """(photo, sha256, size) of a stored photo, or None if its file is missing"""
+    try:
+        with photo.photo.open('rb') as file:
+            return (photo, *hash_file(file))
+    except OSError:
+        return None
+
+
+def remove_file(name):
+    """Delete a media file; returns the bytes freed"""
+    try:
+        size = default_storage.size(name)
+    except OSError:
+        return 0
+    default_storage.delete(name)
+    return size
+
+
+class Command(BaseCommand):
+    help = 'Store identical complaint photos uploaded before deduplication once, and repair photo reference counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Threads hashing and deleting files (default: 8)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Photos hashed and linked per batch (default: 500)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how much storage deduplication would free')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        dry_run = options['dry_run']
+
+        photos = ComplaintPhoto.objects.filter(content__isnull=True).exclude(photo='')
+        total = photos.count()
+        self.stdout.write(f'Hashing {total} complaint photos stored before deduplication...')
+
+        started = time.perf_counter()
+        checked = missing = duplicates = saved = 0
+        # Dry runs link nothing, so remember the images seen so far here
+        seen = set(PhotoContent.objects.values_list('sha256', flat=True)) if dry_run else None
+        last_pk = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # Keyset pagination: linked photos leave the queryset, so batches never shift
+                batch = list(photos.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                checked += len(batch)
+                hashed = [result for result in pool.map(hash_photo, batch) if result is not None]
+                missing += len(batch) - len(hashed)
+
+                if dry_run:
+                    for photo, digest, size in hashed:
+                        if digest in seen:
+                            duplicates += 1
+                            saved += size
+                        seen.add(digest)
+                else:
+                    linked, unused = adopt_photos(hashed)
+                    duplicates += linked
+                    saved += sum(pool.map(remove_file, unused))
+                self.stdout.write(
+                    f'  {checked}/{total} hashed, {duplicates} duplicates, {saved / 1024 / 1024:.1f} MB freed '
+                    f'({time.perf_counter() - started:.1f}s)'
+                )
+
+            if not dry_run:
+                fixed, orphaned = recount_contents()
+                saved += sum(pool.map(remove_file, orphaned))
+                if fixed or orphaned:
+                    self.stdout.write(f'Repaired {fixed} reference counts, removed {len(orphaned)} unused files')
+
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} photos have no file and were skipped'))
+        verb = 'Would free' if dry_run else 'Freed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{duplicates} of {checked} photos were duplicates. {verb} {saved / 1024 / 1024:.1f} MB'
+        ))
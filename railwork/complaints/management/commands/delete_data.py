@@ -1,6 +1,8 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from complaints.models import *
+from complaints.purge import Purger
+from complaints.station_cache import invalidate_station
 from django.db import transaction
 
 class Command(BaseCommand):
@@ -13,8 +15,14 @@ class Command(BaseCommand):
         parser.add_argument('--station', type=str, help='Delete specific station by code')
         parser.add_argument('--city', type=str, help='Delete specific city by code')
         parser.add_argument('--non-superusers', action='store_true', help='Delete all non-superuser accounts')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per batch and transaction (default: 1000)')
+        parser.add_argument('--media-workers', type=int, default=8, help='Threads removing photo and QR files (default: 8)')
 
     def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['media_workers'] < 1:
+            raise CommandError('--batch-size and --media-workers must be at least 1')
+        self.batch_size = options['batch_size']
+        self.media_workers = options['media_workers']
         if options['all_data']:
             self.delete_all_data()
         elif options['all_complaints']:
@@ -30,38 +38,57 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.ERROR('Please specify what to delete. Use --help for options.'))
 
+    def get_purger(self):
+        return Purger(self.batch_size, self.media_workers, self.stdout.write)
+
+    def report(self, purger):
+        rows, files, file_errors, elapsed = purger.finish()
+        total = sum(rows.values())
+        summary = ', '.join(f'{count} {label}' for label, count in rows.items()) or 'no rows'
+        self.stdout.write(
+            f'Deleted {summary} and {files} media files in {elapsed:.1f}s'
+            f' ({total / elapsed if elapsed else 0:.0f} rows/s)'
+        )
+        if file_errors:
+            self.stdout.write(self.style.WARNING(f'{file_errors} media files could not be removed'))
+
     def delete_all_data(self):
+        purger = self.get_purger()
         try:
+            station_ids = list(Station.objects.values_list('id', flat=True))
+            # Delete in correct order due to foreign keys
+            purger.delete_complaints(Complaint.objects.all())
+            purger.delete_locations(PlatformLocation.objects.all())
+            purger.delete_archives()
             with transaction.atomic():
-                # Delete in correct order due to foreign keys
-                ComplaintPhoto.objects.all().delete()
-                OTPVerification.objects.all().delete()
-                Complaint.objects.all().delete()
-                PlatformLocation.objects.all().delete()
+                ComplaintHourlyRollup.objects.all().delete()
                 UserProfile.objects.all().delete()
                 Station.objects.all().delete()
                 City.objects.all().delete()
-                
-                self.stdout.write(self.style.SUCCESS('All complaints app data deleted successfully!'))
+            for station_id in station_ids:
+                invalidate_station(station_id)
+
+            self.stdout.write(self.style.SUCCESS('All complaints app data deleted successfully!'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error deleting data: {str(e)}'))
+        self.report(purger)
 
     def delete_all_complaints(self):
+        purger = self.get_purger()
         try:
-            with transaction.atomic():
-                photo_count = ComplaintPhoto.objects.count()
-                otp_count = OTPVerification.objects.count()
-                complaint_count = Complaint.objects.count()
-                
-                ComplaintPhoto.objects.all().delete()
-                OTPVerification.objects.all().delete()
-                Complaint.objects.all().delete()
-                
-                self.stdout.write(self.style.SUCCESS(
-                    f'Deleted {complaint_count} complaints, {photo_count} photos, {otp_count} OTP records'
-                ))
+            photo_count = ComplaintPhoto.objects.count()
+            otp_count = OTPVerification.objects.count()
+            complaint_count = Complaint.objects.count()
+
+            purger.delete_complaints(Complaint.objects.all())
+            ComplaintHourlyRollup.objects.all().delete()
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {complaint_count} complaints, {photo_count} photos, {otp_count} OTP records'
+            ))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error deleting complaints: {str(e)}'))
+        self.report(purger)
 
     def delete_user(self, username):
         try:
@@ -74,26 +101,32 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f'Error deleting user: {str(e)}'))
 
     def delete_station(self, station_code):
+        purger = self.get_purger()
         try:
             station = Station.objects.get(station_code=station_code)
             station_name = station.name
-            station.delete()
+            purger.delete_station(station)
             self.stdout.write(self.style.SUCCESS(f'Station "{station_name}" ({station_code}) and all related data deleted!'))
         except Station.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'Station with code "{station_code}" not found'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error deleting station: {str(e)}'))
+        self.report(purger)
 
     def delete_city(self, city_code):
+        purger = self.get_purger()
         try:
             city = City.objects.get(code=city_code)
             city_name = city.name
+            for station in city.stations.all():
+                purger.delete_station(station)
             city.delete()
             self.stdout.write(self.style.SUCCESS(f'City "{city_name}" ({city_code}) and all related data deleted!'))
         except City.DoesNotExist:
             self.stdout.write(self.style.ERROR(f'City with code "{city_code}" not found'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error deleting city: {str(e)}'))
+        self.report(purger)
 
     def delete_non_superusers(self):
         try:
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from complaints.sms import claim_batch, coalesce, record_result
+from complaints.sms_gateway import get_gateway
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued SMS messages from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of messages sent in parallel (default: 4)')
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per round (default: 50)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty (default: 1)')
+        parser.add_argument('--once', action='store_true', help='Exit when no message is due instead of waiting for more')
+        parser.add_argument(
+            '--coalesce-window', type=int, default=None,
+            help='Milliseconds to gather messages before sending identical texts as one bulk call (default: SMS_COALESCE_WINDOW_MS, 0 = off)',
+        )
+
+    def handle(self, *args, **options):
+        gateway = get_gateway()
+        window = settings.SMS_COALESCE_WINDOW_MS if options['coalesce_window'] is None else options['coalesce_window']
+        sent = failed = 0
+        self.stdout.write(f"Dispatching SMS with {options['workers']} workers via {type(gateway).__name__}...")
+        try:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                while True:
+                    retry_after = gateway.breaker.retry_after()
+                    if retry_after:
+                        # The provider is down; leave the outbox alone until the breaker lets a trial through
+                        if options['once']:
+                            self.stdout.write(self.style.WARNING('SMS gateway circuit open, stopping'))
+                            break
+                        time.sleep(min(retry_after, options['poll_interval']))
+                        continue
+
+                    batch = claim_batch(options['batch_size'])
+                    if not batch:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    if window and len(batch) < options['batch_size']:
+                        # A surge arrives over a few milliseconds; wait for the rest of it
+                        time.sleep(window / 1000)
+                        batch += claim_batch(options['batch_size'] - len(batch))
+
+                    # Only the HTTP calls run in the pool; results are recorded on this thread's connection
+                    groups = coalesce(batch, settings.SMS_BULK_MAX_RECIPIENTS if window else 1)
+                    futures = {
+                        pool.submit(gateway.send_bulk, [message.phone_number for message in group], group[0].message): group
+                        for group in groups
+                    }
+                    for future in as_completed(futures):
+                        error = future.exception()
+                        for message in futures[future]:
+                            record_result(message, error)
+                            if error is None:
+                                sent += 1
+                            else:
+                                failed += 1
+                                self.stdout.write(self.style.WARNING(
+                                    f'SMS {message.pk} to {message.phone_number} failed (attempt {message.attempts}): {error}'
+                                ))
+        except KeyboardInterrupt:
+            # Claimed but unsent messages are picked up again once their lock times out
+            self.stdout.write('Interrupted')
+
+        self.stdout.write(f'Gateway stats: {gateway.stats.snapshot()}')
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} messages, {failed} failed attempts'))
@@ -0,0 +1,127 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from complaints.models import City, Complaint, PlatformLocation, QRScanAttempt, Station
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Print the database query plan of the hot complaint lookups against seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--complaints', type=int, default=20000, help='Number of complaints to seed (default: 20000)')
+        parser.add_argument('--stations', type=int, default=5, help='Number of stations to seed (default: 5)')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data instead of rolling it back')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                location = self.seed(options['stations'], options['complaints'])
+                self.explain_queries(location)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write(self.style.SUCCESS('Seeded data rolled back'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Seeded data kept (city code EXPLN)'))
+
+    def seed(self, station_count, complaint_count):
+        """Create stations, QR locations, complaints and scan attempts; returns one seeded location"""
+        self.stdout.write(f'Seeding {station_count} stations and {complaint_count} complaints...')
+        city = City.objects.create(name='Explain Benchmark', code='EXPLN')
+        stations = Station.objects.bulk_create([
+            Station(name=f'Benchmark Station {i}', station_code=f'BM{i}', city=city, total_platforms=4)
+            for i in range(station_count)
+        ])
+        locations = PlatformLocation.objects.bulk_create([
+            PlatformLocation(station=station, platform_number=platform, location_description=f'Spot {spot}', hash_id=f'({platform}/{spot})')
+            for station in stations
+            for platform in range(1, 5)
+            for spot in range(1, 6)
+        ])
+
+        rng = random.Random(0)
+        now = timezone.now()
+        complaints = []
+        created = []
+        for i in range(complaint_count):
+            location = rng.choice(locations)
+            created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            created.append(created_at)
+            is_closed = created_at < now - timedelta(days=1) and rng.random() < 0.9
+            complaints.append(Complaint(
+                station_id=location.station_id,
+                platform_location=location,
+                reporter_phone='9999999999',
+                status=rng.choice(['PENDING', 'IN_PROGRESS', 'RESOLVED']),
+                complaint_number=f'EXPLN-{i:08d}',
+                is_verified=True,
+                is_closed=is_closed,
+                closed_at=created_at + timedelta(hours=rng.randint(1, 48)) if is_closed else None,
+            ))
+        complaints = Complaint.objects.bulk_create(complaints, batch_size=1000)
+        # auto_now_add overrides created_at on insert, so backdate afterwards
+        for complaint, created_at in zip(complaints, created):
+            complaint.created_at = created_at
+        Complaint.objects.bulk_update(complaints, ['created_at'], batch_size=1000)
+
+        QRScanAttempt.objects.bulk_create([
+            QRScanAttempt(platform_location_id=complaint.platform_location_id, original_complaint=complaint)
+            for complaint in complaints[::20]
+        ], batch_size=1000)
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            # Refresh planner statistics so the plans reflect the seeded volume
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        return locations[0]
+
+    def hot_queries(self, location):
+        now = timezone.now()
+        fifteen_minutes_ago = now - timedelta(minutes=15)
+        station_complaints = Complaint.objects.filter(station_id=location.station_id)
+        return [
+            ('submit_complaint: duplicate check', Complaint.objects.filter(
+                platform_location=location,
+                created_at__gte=fifteen_minutes_ago,
+                is_closed=False,
+                is_verified=True,
+            ).order_by('pk')[:1]),
+            ('submit_complaint: parent lookup', Complaint.objects.filter(
+                platform_location=location,
+                status='IN_PROGRESS',
+                created_at__gte=fifteen_minutes_ago,
+                parent_complaint__isnull=True,
+                is_closed=False,
+            ).order_by('pk')[:1]),
+            ('user_dashboard: recent tab', station_complaints.filter(is_closed=False).order_by('-created_at', '-pk')[:50]),
+            ('user_dashboard: closed tab', station_complaints.filter(is_closed=True).annotate(
+                sort_at=Coalesce('closed_at', 'created_at'),
+            ).order_by('-sort_at', '-pk')[:50]),
+            ('auto_close_complaints', Complaint.objects.filter(
+                created_at__lte=now - timedelta(hours=24),
+                is_closed=False,
+            )),
+            ('station_analytics: scan attempts today', QRScanAttempt.objects.filter(
+                platform_location__station_id=location.station_id,
+                last_attempt_at__gte=now - timedelta(days=1),
+            ).values_list('platform_location').annotate(total=Sum('attempt_count'))),
+            ('QR scan attempts: recent at a location', QRScanAttempt.objects.filter(
+                platform_location=location,
+                last_attempt_at__gte=fifteen_minutes_ago,
+            )),
+        ]
+
+    def explain_queries(self, location):
+        for label, queryset in self.hot_queries(location):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'  {line}')
@@ -0,0 +1,51 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from complaints.photos import claim_photos, make_variants
+from complaints.uploads import remove_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Make the display and thumbnail images of uploaded complaint photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Encoding processes (default: PHOTO_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=20, help='Photos claimed per round (default: 20)')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to wait when no photo is pending (default: 2)')
+        parser.add_argument('--once', action='store_true', help='Exit when no photo is pending instead of waiting for more')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.PHOTO_WORKERS or os.cpu_count() or 1
+        ready = failed = 0
+        started = time.perf_counter()
+        self.stdout.write(f'Processing complaint photos with {workers} workers...')
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    batch = claim_photos(options['batch_size'])
+                    if not batch:
+                        # Idle: drop partial uploads nobody can finish any more
+                        stale = remove_stale_uploads()
+                        if stale:
+                            self.stdout.write(f'Removed {stale} abandoned partial uploads')
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    for photo, error in make_variants(batch, executor):
+                        if error is None:
+                            ready += 1
+                        else:
+                            failed += 1
+                            self.stdout.write(self.style.WARNING(f'Photo {photo.pk} ({photo.photo.name}) failed: {error}'))
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'  {ready} ready, {failed} failed ({ready / elapsed:.1f} photos/s)')
+        except KeyboardInterrupt:
+            # Claimed photos are picked up again once their lock times out
+            self.stdout.write('Interrupted')
+
+        self.stdout.write(self.style.SUCCESS(f'Made variants for {ready} photos, {failed} failed'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from complaints.models import Station
+from complaints.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly complaint rollup table from the complaints table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--station', type=str, action='append', help='Only rebuild this station code (can be repeated)')
+        parser.add_argument('--city', type=str, action='append', help='Only rebuild stations in this city code (can be repeated)')
+
+    def handle(self, *args, **options):
+        station_ids = None
+        if options['station'] or options['city']:
+            stations = Station.objects.none()
+            if options['station']:
+                stations = stations | Station.objects.filter(station_code__in=options['station'])
+            if options['city']:
+                stations = stations | Station.objects.filter(city__code__in=options['city'])
+            station_ids = list(stations.values_list('id', flat=True))
+            if not station_ids:
+                self.stdout.write(self.style.ERROR('No matching stations found'))
+                return
+            self.stdout.write(f'Rebuilding rollups for {len(station_ids)} stations...')
+        else:
+            self.stdout.write('Rebuilding rollups for all stations...')
+
+        row_count = rebuild_rollups(station_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt {row_count} rollup rows')
+        )
@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from complaints.models import PlatformLocation, Station
+from complaints.onboarding import qr_code_is_current, regenerate_qr_codes
+from complaints.qr import QR_FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Re-render QR location codes whose URL or format changed (e.g. after changing DOMAIN or QR_CODE_FORMAT)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--station', type=str, action='append', help='Only regenerate this station code (can be repeated)')
+        parser.add_argument('--city', type=str, action='append', help='Only regenerate stations in this city code (can be repeated)')
+        parser.add_argument('--format', type=str, choices=sorted(QR_FORMATS), default=None, help='Image format (default: QR_CODE_FORMAT)')
+        parser.add_argument('--workers', type=int, default=None, help='QR render processes (default: QR_RENDER_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Locations rendered and updated per batch (default: 500)')
+        parser.add_argument('--force', action='store_true', help='Regenerate every location, even if its image is up to date')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the locations that would be regenerated')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        fmt = options['format'] or settings.QR_CODE_FORMAT
+
+        locations = PlatformLocation.objects.select_related('station')
+        if options['station'] or options['city']:
+            stations = Station.objects.none()
+            if options['station']:
+                stations = stations | Station.objects.filter(station_code__in=options['station'])
+            if options['city']:
+                stations = stations | Station.objects.filter(city__code__in=options['city'])
+            station_ids = list(stations.values_list('id', flat=True))
+            if not station_ids:
+                self.stdout.write(self.style.ERROR('No matching stations found'))
+                return
+            locations = locations.filter(station_id__in=station_ids)
+
+        total = locations.count()
+        self.stdout.write(
+            f'Checking {total} QR locations against {settings.QR_CODE_SCHEME}://{settings.QR_CODE_DOMAIN} ({fmt})...'
+        )
+
+        started = time.perf_counter()
+        checked = regenerated = 0
+        last_pk = 0
+        while True:
+            # Keyset pagination: regenerated rows keep their pk, so batches never shift
+            batch = list(locations.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+            if options['dry_run']:
+                regenerated += sum(1 for location in batch if options['force'] or not qr_code_is_current(location, fmt))
+            else:
+                regenerated += len(regenerate_qr_codes(batch, options['workers'], fmt, options['force']))
+            self.stdout.write(
+                f'  {checked}/{total} checked, {regenerated} regenerated ({time.perf_counter() - started:.1f}s)'
+            )
+
+        verb = 'Would regenerate' if options['dry_run'] else 'Regenerated'
+        self.stdout.write(
+            self.style.SUCCESS(f'{verb} {regenerated} of {checked} QR codes; {checked - regenerated} already up to date')
+        )
@@ -1,5 +1,9 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from complaints.models import PlatformLocation
+from complaints.station_cache import invalidate_station
 
 
 class Command(BaseCommand):
@@ -11,38 +15,52 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be updated without actually updating',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Locations written per bulk update and transaction (default: 1000)',
+        )
 
     def handle(self, *args, **options):
-        locations = PlatformLocation.objects.all().order_by('station', 'platform_number', 'id')
-        
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # Number every location within its platform in one query instead of a COUNT per location
+        locations = PlatformLocation.objects.annotate(
+            sequence=Window(
+                RowNumber(),
+                partition_by=[F('station_id'), F('platform_number')],
+                order_by=F('id').asc(),
+            ),
+        ).values_list(
+            'id', 'station_id', 'station__name', 'platform_number', 'location_description', 'hash_id', 'sequence',
+        ).order_by('station', 'platform_number', 'id')
+
         updated_count = 0
-        
-        for location in locations:
-            old_hash_id = location.hash_id
-            
+        pending = []
+
+        for location_id, station_id, station_name, platform_number, description, old_hash_id, sequence in locations.iterator(chunk_size=options['batch_size']):
             # Skip if already in new format
             if old_hash_id.startswith('(') and old_hash_id.endswith(')'):
                 continue
-                
-            # Calculate new hash_id
-            existing_count = PlatformLocation.objects.filter(
-                station=location.station,
-                platform_number=location.platform_number,
-                id__lt=location.id  # Only count locations created before this one
-            ).count()
-            
-            sequence = existing_count + 1
-            new_hash_id = f"({location.platform_number}/{sequence})"
-            
+
+            new_hash_id = f"({platform_number}/{sequence})"
+            updated_count += 1
+            label = f"{station_name} - Platform {platform_number} - {description}"
+
             if options['dry_run']:
-                self.stdout.write(f'Would update {old_hash_id} -> {new_hash_id} for {location}')
+                self.stdout.write(f'Would update {old_hash_id} -> {new_hash_id} for {label}')
             else:
-                location.hash_id = new_hash_id
-                location.save(update_fields=['hash_id'])
-                self.stdout.write(f'Updated {old_hash_id} -> {new_hash_id} for {location}')
-            
-            updated_count += 1
-        
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Updating {old_hash_id} -> {new_hash_id} for {label}')
+                pending.append(PlatformLocation(id=location_id, station_id=station_id, hash_id=new_hash_id))
+                if len(pending) >= options['batch_size']:
+                    self.write_batch(pending, updated_count)
+
+        if pending:
+            self.write_batch(pending, updated_count)
+
         if options['dry_run']:
             self.stdout.write(
                 self.style.WARNING(f'Would update {updated_count} hash IDs (dry run mode)')
@@ -50,4 +68,13 @@ class Command(BaseCommand):
         else:
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully updated {updated_count} hash IDs')
-            ) 
\ No newline at end of file
+            )
+
+    def write_batch(self, pending, updated_count):
+        """Save a chunk of new hash IDs in one transaction and report progress"""
+        with transaction.atomic():
+            PlatformLocation.objects.bulk_update(pending, ['hash_id'])
+            for station_id in {location.station_id for location in pending}:
+                invalidate_station(station_id)
+        self.stdout.write(f'Updated {updated_count} hash IDs...')
+        pending.clear()
@@ -0,0 +1,125 @@
+"""
+Serving media files to signed-in users.
+
+Complaint photos and QR codes are not published under MEDIA_URL. Views check
+the same station/city permissions as the pages that link to them and then
+call serve_media(), which sends the file according to MEDIA_SERVE_MODE:
+
+- 'django': a FileResponse; WSGI servers with wsgi.file_wrapper (gunicorn,
+  uWSGI) send it with sendfile() instead of copying it through Python.
+  Single byte ranges are answered with a 206 holding only that range.
+- 'x-accel-redirect': an empty response whose X-Accel-Redirect header hands
+  MEDIA_ACCEL_REDIRECT_PREFIX + file name to nginx (an `internal` location
+  aliased to MEDIA_ROOT), which also handles Range requests.
+- 'x-sendfile': the same with an X-Sendfile header holding the file's path,
+  for Apache mod_xsendfile or lighttpd.
+
+In every mode responses carry an ETag and Last-Modified, conditional GETs
+are answered with 304 and browsers may only cache files privately.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single byte range header, both inclusive.
+
+    Returns None when the whole file should be sent (no header, multiple or
+    malformed ranges) and False when the range is not satisfiable.
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        # Suffix range: the last n bytes
+        if int(last) == 0:
+            return False
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        return False
+    return start, end
+
+
+def iter_range(file, start, length):
+    """Yield length bytes of file from start in CHUNK_SIZE blocks"""
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_media(request, field):
+    """Response sending the file of a FileField after the caller checked permissions"""
+    storage, name = field.storage, field.name
+    if not name:
+        raise Http404
+    try:
+        size = storage.size(name)
+        modified = int(storage.get_modified_time(name).timestamp())
+    except (OSError, NotImplementedError):
+        raise Http404
+    etag = quote_etag(f'{modified:x}-{size:x}')
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if settings.MEDIA_SERVE_MODE == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        elif settings.MEDIA_SERVE_MODE == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = storage.path(name)
+        else:
+            response = _file_response(request, storage, name, size, content_type, etag, modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, private=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
+
+
+def _file_response(request, storage, name, size, content_type, etag, modified):
+    byte_range = None
+    if request.headers.get('Range'):
+        # If-Range: only send a part if the client's copy is still this version
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag or parse_http_date_safe(if_range) == modified:
+            byte_range = parse_range(request.headers['Range'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_range(storage.open(name, 'rb'), start, end - start + 1), status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(storage.open(name, 'rb'), content_type=content_type, filename=os.path.basename(name))
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:44
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncHour
+
+
+def populate_rollups(apps, schema_editor):
+    """Build rollup rows for complaints that existed before the rollup table"""
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintHourlyRollup = apps.get_model('complaints', 'ComplaintHourlyRollup')
+
+    groups = Complaint.objects.order_by().values(
+        'station_id', 'platform_location_id', 'status', 'is_closed',
+        bucket=TruncHour('created_at', tzinfo=datetime.timezone.utc),
+    ).annotate(count=models.Count('id'))
+
+    ComplaintHourlyRollup.objects.bulk_create([
+        ComplaintHourlyRollup(
+            station_id=group['station_id'],
+            platform_location_id=group['platform_location_id'],
+            bucket=group['bucket'],
+            status=group['status'],
+            is_closed=group['is_closed'],
+            complaint_count=group['count'],
+        )
+        for group in groups
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0014_alter_platformlocation_hash_id_supportrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour (UTC) the complaints were created in', verbose_name='Hour Bucket')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('IN_PROGRESS', 'In Progress'), ('RESOLVED', 'Resolved')], max_length=20, verbose_name='Status')),
+                ('is_closed', models.BooleanField(default=False, verbose_name='Is Closed')),
+                ('complaint_count', models.IntegerField(default=0, verbose_name='Complaint Count')),
+                ('scan_attempts', models.IntegerField(default=0, help_text='Duplicate QR scans recorded in this hour', verbose_name='Scan Attempts')),
+                ('platform_location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='complaints.platformlocation', verbose_name='Platform Location')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_rollups', to='complaints.station', verbose_name='Station')),
+            ],
+            options={
+                'verbose_name': 'Complaint Hourly Rollup',
+                'verbose_name_plural': 'Complaint Hourly Rollups',
+                'unique_together': {('station', 'platform_location', 'bucket', 'status', 'is_closed')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:51
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def used_sequences(Complaint):
+    """
+    {(city_id, date): highest sequence used} from existing complaint numbers.
+
+    Numbers look like YYYYMMDD-CITY-STATION-NNNN. Counting the day's rows
+    instead would hand out a used number again once any of them was deleted.
+    """
+    used = {}
+    numbers = Complaint.objects.filter(station__city__isnull=False).exclude(complaint_number='')
+    for city_id, number in numbers.values_list('station__city_id', 'complaint_number').iterator():
+        try:
+            date = datetime.datetime.strptime(number.split('-')[0], '%Y%m%d').date()
+            value = int(number.rsplit('-', 1)[1])
+        except (ValueError, IndexError):
+            continue
+        key = (city_id, date)
+        used[key] = max(used.get(key, 0), value)
+    return used
+
+
+def seed_sequences(apps, schema_editor):
+    """Continue numbering after the complaint numbers already used on each day"""
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintSequence = apps.get_model('complaints', 'ComplaintSequence')
+
+    ComplaintSequence.objects.bulk_create([
+        ComplaintSequence(city_id=city_id, date=date, last_value=value)
+        for (city_id, date), value in used_sequences(Complaint).items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0015_complainthourlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('last_value', models.IntegerField(default=0, verbose_name='Last Value')),
+                ('city', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='complaint_sequences', to='complaints.city', verbose_name='City')),
+            ],
+            options={
+                'verbose_name': 'Complaint Sequence',
+                'verbose_name_plural': 'Complaint Sequences',
+                'unique_together': {('city', 'date')},
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
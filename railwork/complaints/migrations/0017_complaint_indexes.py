@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:53
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0016_complaintsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_closed', False)), fields=['platform_location', 'created_at'], name='complaint_open_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['station', 'is_closed', 'created_at'], name='complaint_station_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(models.F('station'), django.db.models.functions.comparison.Coalesce('closed_at', 'created_at'), condition=models.Q(('is_closed', True)), name='complaint_station_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_closed', False)), fields=['created_at'], name='complaint_open_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='qrscanattempt',
+            index=models.Index(fields=['platform_location', 'last_attempt_at'], name='scan_attempt_location_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0018_smsoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='platformlocation',
+            name='qr_code_digest',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the payload and format the stored QR image was rendered from', max_length=64, verbose_name='QR Code Digest'),
+        ),
+    ]
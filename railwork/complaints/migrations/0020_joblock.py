@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0019_platformlocation_qr_code_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Name')),
+                ('owner', models.CharField(blank=True, max_length=255, verbose_name='Owner')),
+                ('locked_until', models.DateTimeField(blank=True, help_text='The owner holds the lock until this time unless it renews it', null=True, verbose_name='Locked Until')),
+            ],
+            options={
+                'verbose_name': 'Job Lock',
+                'verbose_name_plural': 'Job Locks',
+            },
+        ),
+    ]
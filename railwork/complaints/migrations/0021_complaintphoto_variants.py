@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0020_joblock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='display',
+            field=models.ImageField(blank=True, help_text='Downscaled copy shown on complaint pages', upload_to='complaints/photos/display/', verbose_name='Display Image'),
+        ),
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, help_text='A worker is making the variants until this time', null=True, verbose_name='Locked Until'),
+        ),
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='complaints/photos/thumbnails/', verbose_name='Thumbnail'),
+        ),
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='variants_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', help_text='Display and thumbnail images are made by the process_photos command', max_length=20, verbose_name='Variants Status'),
+        ),
+        migrations.AddIndex(
+            model_name='complaintphoto',
+            index=models.Index(fields=['variants_status', 'locked_until'], name='photo_variants_due_idx'),
+        ),
+    ]
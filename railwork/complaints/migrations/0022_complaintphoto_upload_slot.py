@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0021_complaintphoto_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='upload_slot',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Photo field (1-4) a resumable upload was sent for', null=True, verbose_name='Upload Slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='complaintphoto',
+            constraint=models.UniqueConstraint(fields=('complaint', 'upload_slot'), name='photo_unique_upload_slot'),
+        ),
+    ]
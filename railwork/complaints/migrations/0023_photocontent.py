@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0022_complaintphoto_upload_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(upload_to='complaints/photos/', verbose_name='File')),
+                ('display', models.FileField(blank=True, upload_to='complaints/photos/display/', verbose_name='Display Image')),
+                ('thumbnail', models.FileField(blank=True, upload_to='complaints/photos/thumbnails/', verbose_name='Thumbnail')),
+                ('size', models.PositiveIntegerField(help_text='Bytes of the original image', verbose_name='Size')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='Reference Count')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Photo Content',
+                'verbose_name_plural': 'Photo Contents',
+            },
+        ),
+        migrations.AddField(
+            model_name='complaintphoto',
+            name='content',
+            field=models.ForeignKey(blank=True, help_text='Shared image this photo and its variants are stored as', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='photos', to='complaints.photocontent', verbose_name='Content'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# 0016 seeded the sequences from the number of complaints per day, which is
+# lower than the highest number used once any of them was deleted
+used_sequences = import_module('complaints.migrations.0016_complaintsequence').used_sequences
+
+
+def reseed_sequences(apps, schema_editor):
+    """Raise every sequence to at least the highest complaint number already used"""
+    Complaint = apps.get_model('complaints', 'Complaint')
+    ComplaintSequence = apps.get_model('complaints', 'ComplaintSequence')
+
+    for (city_id, date), value in used_sequences(Complaint).items():
+        sequence, created = ComplaintSequence.objects.get_or_create(
+            city_id=city_id, date=date, defaults={'last_value': value}
+        )
+        if not created and sequence.last_value < value:
+            ComplaintSequence.objects.filter(pk=sequence.pk, last_value__lt=value).update(last_value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0023_photocontent'),
+    ]
+
+    operations = [
+        migrations.RunPython(reseed_sequences, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,19 @@
-from django.db import models
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
-import qrcode
-from io import BytesIO
-from django.core.files import File
+from django.core.files.base import ContentFile
 from PIL import Image
-import os
+from .location_index import complaint_saved
+from .qr import QR_FORMATS, render_qr
+from .qr_cache import qr_digest
+from .station_cache import invalidate_station
 
 class UserProfile(models.Model):
     """Extended user profile to manage station-specific permissions"""
@@ -70,6 +76,7 @@ class PlatformLocation(models.Model):
     location_description = models.CharField(_('Location Description'), max_length=200, default='General Area', help_text=_('Custom description of the location (e.g., "Near Ticket Counter", "Platform Entry", "Waiting Area")'))
     hash_id = models.CharField(_('Hash ID'), max_length=15, blank=True, help_text=_('Format: (Platform Number/QR Number) (e.g., (1/1), (1/2), (2/1))'))
     qr_code = models.ImageField(upload_to='qr_codes/', blank=True, null=True)
+    qr_code_digest = models.CharField(_('QR Code Digest'), max_length=64, blank=True, editable=False, help_text=_('Hash of the payload and format the stored QR image was rendered from'))
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     
     def generate_hash_id(self):
@@ -86,37 +93,31 @@ class PlatformLocation(models.Model):
         # Format: (Platform Number/QR Number)
         self.hash_id = f"({self.platform_number}/{sequence})"
     
-    def generate_qr_code(self):
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        
-        # Fix: Use HTTP instead of HTTPS for development, and ensure we have an ID
-        protocol = 'http'  # Changed from https to http for development
-        domain = os.getenv('DOMAIN', 'localhost:8000')
+    def get_qr_code_data(self, scheme=None, domain=None):
+        """URL encoded in the location's QR code (QR_CODE_SCHEME://QR_CODE_DOMAIN unless given)"""
+        scheme = scheme or settings.QR_CODE_SCHEME
+        domain = domain or settings.QR_CODE_DOMAIN
         
         # Generate URL for the complaint form with station and platform info
         # Include language prefix to match Django's i18n URL structure
-        data = f"{protocol}://{domain}/en/submit-complaint/?station={self.station.id}&platform={self.platform_number}&location={self.id}"
-        qr.add_data(data)
-        qr.make(fit=True)
+        return f"{scheme}://{domain}/en/submit-complaint/?station={self.station_id}&platform={self.platform_number}&location={self.id}"
 
-        qr_image = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to RGB if necessary
-        if qr_image.mode != 'RGB':
-            qr_image = qr_image.convert('RGB')
-        
-        # Save QR code
-        buffer = BytesIO()
-        qr_image.save(buffer, format='PNG')
+    def get_qr_code_digest(self, fmt=None, **payload_options):
+        """What qr_code_digest is for an image rendered now; equal digests mean identical images"""
+        return qr_digest(self.get_qr_code_data(**payload_options), fmt=fmt or settings.QR_CODE_FORMAT)
+
+    def get_qr_code_filename(self, station_code=None, fmt=None):
         # Use location description instead of location_type.name
         location_name = self.location_description.replace(' ', '_').replace(',', '').replace('/', '_')
-        filename = f'qr_station_{self.station.station_code}_platform_{self.platform_number}_{location_name}_{self.id}.png'
-        self.qr_code.save(filename, File(buffer), save=False)
+        station_code = station_code or self.station.station_code
+        extension = QR_FORMATS[fmt or settings.QR_CODE_FORMAT][0]
+        return f'qr_station_{station_code}_platform_{self.platform_number}_{location_name}_{self.id}.{extension}'
+
+    def generate_qr_code(self):
+        # Save QR code in the configured format (QR_CODE_FORMAT)
+        image = render_qr(self.get_qr_code_data(), settings.QR_CODE_FORMAT)
+        self.qr_code.save(self.get_qr_code_filename(), ContentFile(image), save=False)
+        self.qr_code_digest = self.get_qr_code_digest()
         
     def save(self, *args, **kwargs):
         # Generate hash_id if it doesn't exist
@@ -138,7 +139,7 @@ class PlatformLocation(models.Model):
         if is_new or not self.qr_code:
             self.generate_qr_code()
             # Save again to update the qr_code field
-            super().save(update_fields=['qr_code'])
+            super().save(update_fields=['qr_code', 'qr_code_digest'])
 
     def __str__(self):
         return f"{self.station.name} - Platform {self.platform_number} - {self.location_description}"
@@ -148,14 +149,71 @@ class PlatformLocation(models.Model):
         verbose_name_plural = _('Platform Locations')
         unique_together = ['station', 'platform_number', 'location_description']
 
+class PhotoContent(models.Model):
+    """
+    A stored complaint photo image, shared by every ComplaintPhoto with the same bytes.
+
+    ref_count is the number of ComplaintPhoto rows using it; the image and its
+    variants are deleted with the last of them (see complaints/photo_store.py).
+    """
+    sha256 = models.CharField(_('SHA-256'), max_length=64, unique=True)
+    file = models.FileField(_('File'), upload_to='complaints/photos/')
+    display = models.FileField(_('Display Image'), upload_to='complaints/photos/display/', blank=True)
+    thumbnail = models.FileField(_('Thumbnail'), upload_to='complaints/photos/thumbnails/', blank=True)
+    size = models.PositiveIntegerField(_('Size'), help_text=_('Bytes of the original image'))
+    ref_count = models.PositiveIntegerField(_('Reference Count'), default=0)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} photos)"
+
+    class Meta:
+        verbose_name = _('Photo Content')
+        verbose_name_plural = _('Photo Contents')
+
 class ComplaintPhoto(models.Model):
+    VARIANTS_STATUS_CHOICES = [
+        ('PENDING', _('Pending')),
+        ('PROCESSING', _('Processing')),
+        ('READY', _('Ready')),
+        ('FAILED', _('Failed')),
+    ]
+
     complaint = models.ForeignKey('Complaint', on_delete=models.CASCADE, related_name='photos')
     photo = models.ImageField(upload_to='complaints/photos/')
+    display = models.ImageField(_('Display Image'), upload_to='complaints/photos/display/', blank=True, help_text=_('Downscaled copy shown on complaint pages'))
+    thumbnail = models.ImageField(_('Thumbnail'), upload_to='complaints/photos/thumbnails/', blank=True)
+    variants_status = models.CharField(_('Variants Status'), max_length=20, choices=VARIANTS_STATUS_CHOICES, default='PENDING', help_text=_('Display and thumbnail images are made by the process_photos command'))
+    locked_until = models.DateTimeField(_('Locked Until'), null=True, blank=True, help_text=_('A worker is making the variants until this time'))
+    upload_slot = models.PositiveSmallIntegerField(_('Upload Slot'), null=True, blank=True, help_text=_('Photo field (1-4) a resumable upload was sent for'))
+    content = models.ForeignKey(PhotoContent, on_delete=models.PROTECT, null=True, blank=True, related_name='photos', verbose_name=_('Content'), help_text=_('Shared image this photo and its variants are stored as'))
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Photos are only served to signed-in users through complaint_photo_file,
+    # which falls back to the original until a variant is made
+    @property
+    def original_url(self):
+        return reverse('complaint_photo_file', args=[self.pk, 'original'])
+
+    @property
+    def display_url(self):
+        return reverse('complaint_photo_file', args=[self.pk, 'display'])
+
+    @property
+    def thumbnail_url(self):
+        return reverse('complaint_photo_file', args=[self.pk, 'thumbnail'])
+
     class Meta:
         verbose_name = _('Complaint Photo')
         verbose_name_plural = _('Complaint Photos')
+        indexes = [
+            # process_photos: photos still waiting for their variants
+            models.Index(fields=['variants_status', 'locked_until'], name='photo_variants_due_idx'),
+        ]
+        constraints = [
+            # One photo per slot, however often its last chunk is retried
+            models.UniqueConstraint(fields=['complaint', 'upload_slot'], name='photo_unique_upload_slot'),
+        ]
 
 class QRScanAttempt(models.Model):
     """Track duplicate QR scan attempts for the same location within 15-minute windows"""
@@ -172,6 +230,10 @@ class QRScanAttempt(models.Model):
         verbose_name = _('QR Scan Attempt')
         verbose_name_plural = _('QR Scan Attempts')
         unique_together = ['platform_location', 'original_complaint']
+        indexes = [
+            # Recent duplicate scans per QR location
+            models.Index(fields=['platform_location', 'last_attempt_at'], name='scan_attempt_location_idx'),
+        ]
     
     def __str__(self):
         return f"Scan attempts for {self.platform_location.hash_id} - {self.attempt_count} attempts"
@@ -214,16 +276,40 @@ class Complaint(models.Model):
     closed_at = models.DateTimeField(_('Closed At'), null=True, blank=True)
     closed_status = models.CharField(_('Status When Closed'), max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
 
+    ROLLUP_FIELDS = ('station_id', 'platform_location_id', 'created_at', 'status', 'is_closed')
+
+    def get_rollup_state(self):
+        """Fields that decide which hourly rollup row this complaint is counted in"""
+        return tuple(getattr(self, field) for field in self.ROLLUP_FIELDS)
+
     def save(self, *args, **kwargs):
-        if not self.complaint_number:
-            # Generate a unique complaint number: YYYYMMDD-CITY-STATION-XXXX
-            date_str = timezone.now().strftime('%Y%m%d')
-            count = Complaint.objects.filter(
-                created_at__date=timezone.now().date(),
-                station__city=self.station.city
-            ).count() + 1
-            self.complaint_number = f"{date_str}-{self.station.city.code}-{self.station.station_code}-{count:04d}"
-        super().save(*args, **kwargs)
+        # Keep the hourly rollup in step with the complaint row
+        from .rollups import record_complaint_change
+        update_fields = kwargs.get('update_fields')
+        tracks_rollup = update_fields is None or any(
+            field in update_fields or f'{field}_id' in update_fields for field in ('station', 'platform_location', 'status', 'is_closed')
+        )
+        with transaction.atomic():
+            if not self.complaint_number:
+                # Generate a unique complaint number: YYYYMMDD-CITY-STATION-XXXX
+                today = timezone.now().date()
+                sequence = ComplaintSequence.allocate(self.station.city, today)
+                self.complaint_number = f"{today:%Y%m%d}-{self.station.city.code}-{self.station.station_code}-{sequence:04d}"
+
+            old_state = None
+            if tracks_rollup and not self._state.adding:
+                # Move the rollup from what the stored row is counted as, not from a copy loaded
+                # earlier (queryset updates and concurrent saves change the row behind it). The
+                # row lock makes concurrent saves of one complaint take turns.
+                old_state = Complaint.objects.select_for_update().filter(pk=self.pk).values_list(*self.ROLLUP_FIELDS).first()
+            super().save(*args, **kwargs)
+            if tracks_rollup:
+                new_state = self.get_rollup_state()
+                record_complaint_change(old_state, new_state)
+                if old_state and old_state[0] != self.station_id:
+                    invalidate_station(old_state[0])
+            invalidate_station(self.station_id)
+            complaint_saved(self)
 
     def get_closed_status_display(self):
         """Get display name for closed status"""
@@ -241,6 +327,73 @@ class Complaint(models.Model):
     class Meta:
         verbose_name = _('Complaint')
         verbose_name_plural = _('Complaints')
+        indexes = [
+            # Duplicate / parent lookup for a QR scan: open complaints at a location in the last 15 minutes
+            models.Index(fields=['platform_location', 'created_at'], condition=models.Q(is_closed=False), name='complaint_open_location_idx'),
+            # Station manager dashboard, recent tab and per-station feeds
+            models.Index(fields=['station', 'is_closed', 'created_at'], name='complaint_station_listing_idx'),
+            # Station manager dashboard, closed tab (ordered by closing time)
+            models.Index(
+                models.F('station'), Coalesce('closed_at', 'created_at'),
+                condition=models.Q(is_closed=True), name='complaint_station_closed_idx',
+            ),
+            # auto_close_complaints: open complaints older than the cutoff
+            models.Index(fields=['created_at'], condition=models.Q(is_closed=False), name='complaint_open_created_idx'),
+        ]
+
+class ComplaintSequence(models.Model):
+    """Last complaint number handed out per city and day"""
+    city = models.ForeignKey(City, on_delete=models.CASCADE, related_name='complaint_sequences', verbose_name=_('City'))
+    date = models.DateField(_('Date'))
+    last_value = models.IntegerField(_('Last Value'), default=0)
+
+    def __str__(self):
+        return f"{self.city.code} {self.date}: {self.last_value}"
+
+    @classmethod
+    def allocate(cls, city, date):
+        """
+        Atomically take the next sequence number for a city and day.
+
+        The increment is a single UPDATE on one row, so it does not depend on
+        how many complaints exist, and concurrent callers are serialised by
+        the row lock until their transaction commits. Call it inside the
+        transaction that inserts the complaint.
+        """
+        with transaction.atomic():
+            rows = cls.objects.filter(city=city, date=date)
+            if not rows.update(last_value=models.F('last_value') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(city=city, date=date, last_value=1)
+                    return 1
+                except IntegrityError:
+                    # Another request created today's row first
+                    rows.update(last_value=models.F('last_value') + 1)
+            return rows.values_list('last_value', flat=True).get()
+
+    class Meta:
+        verbose_name = _('Complaint Sequence')
+        verbose_name_plural = _('Complaint Sequences')
+        unique_together = ['city', 'date']
+
+class ComplaintHourlyRollup(models.Model):
+    """Complaint counts per station, QR location, hour bucket, status and closed state"""
+    station = models.ForeignKey(Station, on_delete=models.CASCADE, related_name='hourly_rollups', verbose_name=_('Station'))
+    platform_location = models.ForeignKey(PlatformLocation, on_delete=models.CASCADE, null=True, blank=True, related_name='hourly_rollups', verbose_name=_('Platform Location'))
+    bucket = models.DateTimeField(_('Hour Bucket'), help_text=_('Start of the hour (UTC) the complaints were created in'))
+    status = models.CharField(_('Status'), max_length=20, choices=Complaint.STATUS_CHOICES)
+    is_closed = models.BooleanField(_('Is Closed'), default=False)
+    complaint_count = models.IntegerField(_('Complaint Count'), default=0)
+    scan_attempts = models.IntegerField(_('Scan Attempts'), default=0, help_text=_('Duplicate QR scans recorded in this hour'))
+
+    def __str__(self):
+        return f"{self.station.station_code} {self.bucket:%Y-%m-%d %H:00} {self.status}{' (closed)' if self.is_closed else ''}: {self.complaint_count}"
+
+    class Meta:
+        verbose_name = _('Complaint Hourly Rollup')
+        verbose_name_plural = _('Complaint Hourly Rollups')
+        unique_together = ['station', 'platform_location', 'bucket', 'status', 'is_closed']
 
 class OTPVerification(models.Model):
     complaint = models.OneToOneField(Complaint, on_delete=models.CASCADE, verbose_name=_('Complaint'))
@@ -256,6 +409,70 @@ class OTPVerification(models.Model):
         verbose_name = _('OTP Verification')
         verbose_name_plural = _('OTP Verifications')
 
+class SMSOutbox(models.Model):
+    """Outgoing SMS, written in the sender's transaction and delivered by the dispatch_sms command"""
+    STATUS_CHOICES = [
+        ('PENDING', _('Pending')),
+        ('SENDING', _('Sending')),
+        ('SENT', _('Sent')),
+        ('FAILED', _('Failed')),
+    ]
+
+    complaint = models.ForeignKey(Complaint, on_delete=models.SET_NULL, null=True, blank=True, related_name='sms_messages', verbose_name=_('Complaint'))
+    phone_number = models.CharField(_('Phone Number'), max_length=15)
+    message = models.TextField(_('Message'))
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(_('Attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('Next Attempt At'), default=timezone.now, help_text=_('Pending messages are not sent before this time'))
+    locked_until = models.DateTimeField(_('Locked Until'), null=True, blank=True, help_text=_('A dispatcher is sending the message until this time'))
+    last_error = models.TextField(_('Last Error'), blank=True)
+    created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('Sent At'), null=True, blank=True)
+
+    def __str__(self):
+        return f"SMS to {self.phone_number} ({self.status})"
+
+    class Meta:
+        verbose_name = _('SMS Outbox Message')
+        verbose_name_plural = _('SMS Outbox')
+        indexes = [
+            # Dispatcher: due pending messages, oldest first
+            models.Index(fields=['status', 'next_attempt_at'], name='sms_outbox_due_idx'),
+        ]
+
+class JobLock(models.Model):
+    """Lease that lets only one node at a time run a periodic job"""
+    name = models.CharField(_('Name'), max_length=100, unique=True)
+    owner = models.CharField(_('Owner'), max_length=255, blank=True)
+    locked_until = models.DateTimeField(_('Locked Until'), null=True, blank=True, help_text=_('The owner holds the lock until this time unless it renews it'))
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or 'free'})"
+
+    @classmethod
+    def acquire(cls, name, owner, timeout):
+        """
+        Take or renew the lock for timeout seconds; returns whether owner holds it.
+
+        The lease is claimed with one conditional UPDATE, so two nodes cannot
+        both win it. A lease that was not renewed in time (its owner died) can
+        be taken over.
+        """
+        now = timezone.now()
+        cls.objects.get_or_create(name=name)
+        claimable = models.Q(locked_until__isnull=True) | models.Q(locked_until__lt=now) | models.Q(owner=owner)
+        return bool(
+            cls.objects.filter(claimable, name=name).update(owner=owner, locked_until=now + timedelta(seconds=timeout))
+        )
+
+    @classmethod
+    def release(cls, name, owner):
+        cls.objects.filter(name=name, owner=owner).update(owner='', locked_until=None)
+
+    class Meta:
+        verbose_name = _('Job Lock')
+        verbose_name_plural = _('Job Locks')
+
 class SupportRequest(models.Model):
     PRIORITY_CHOICES = [
         ('low', _('Low - General inquiry')),
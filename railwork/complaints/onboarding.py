@@ -0,0 +1,141 @@
+"""
+Bulk creation of QR locations for station setup.
+
+PlatformLocation.save() numbers the location with a COUNT query, saves the
+row three times and renders its QR code in the request thread. For a whole
+station that is hundreds of queries and renders, so bulk_create_locations()
+numbers all new locations from one grouped query, inserts them with a single
+bulk_create, renders the QR images in a process pool and stores the image
+paths with one bulk_update.
+
+regenerate_qr_codes() reuses the same pool to re-render existing locations
+after QR_CODE_DOMAIN, QR_CODE_SCHEME or QR_CODE_FORMAT changed, skipping
+locations whose stored image already matches what would be rendered.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count
+
+from .models import PlatformLocation
+from .qr import render_qr
+
+
+def render_qr_codes(data, workers=None, fmt=None):
+    """
+    Images in format fmt (default QR_CODE_FORMAT) for each QR payload in data, in order.
+
+    Rendering is CPU bound, so batches of at least QR_RENDER_PARALLEL_THRESHOLD
+    codes are spread over a process pool of QR_RENDER_WORKERS processes
+    (default: one per CPU); smaller batches are not worth the pool start-up.
+    """
+    render = partial(render_qr, fmt=fmt or settings.QR_CODE_FORMAT)
+    if workers is None:
+        workers = settings.QR_RENDER_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(data) < settings.QR_RENDER_PARALLEL_THRESHOLD:
+        return [render(item) for item in data]
+    workers = min(workers, len(data))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render, data, chunksize=max(1, len(data) // (workers * 4))))
+
+
+def bulk_create_locations(station, platform_locations, workers=None):
+    """
+    Create QR locations for a station and return them in input order.
+
+    platform_locations is the station setup payload: a list of
+    {'platform_number': n, 'locations': [description, ...]}. Hash IDs
+    continue each platform's existing numbering exactly like
+    PlatformLocation.generate_hash_id().
+
+    Rendering a large station takes seconds, so it happens between two
+    short transactions instead of holding the database write lock: the rows
+    are committed first and their images attached afterwards. Call it
+    outside a transaction. If rendering fails, the locations exist without
+    an image until regenerate_qr_codes is run.
+    """
+    existing = dict(
+        station.platform_locations.order_by().values_list('platform_number').annotate(count=Count('id'))
+    )
+    locations = []
+    for platform_data in platform_locations:
+        platform_number = platform_data['platform_number']
+        for location_description in platform_data['locations']:
+            existing[platform_number] = existing.get(platform_number, 0) + 1
+            locations.append(PlatformLocation(
+                station=station,
+                platform_number=platform_number,
+                location_description=location_description,
+                hash_id=f"({platform_number}/{existing[platform_number]})",
+            ))
+    if not locations:
+        return []
+
+    with transaction.atomic():
+        PlatformLocation.objects.bulk_create(locations)
+
+    images = render_qr_codes([location.get_qr_code_data() for location in locations], workers)
+    for location, image in zip(locations, images):
+        location.qr_code.save(location.get_qr_code_filename(station.station_code), ContentFile(image), save=False)
+        location.qr_code_digest = location.get_qr_code_digest()
+    with transaction.atomic():
+        PlatformLocation.objects.bulk_update(locations, ['qr_code', 'qr_code_digest'])
+    return locations
+
+
+def qr_code_is_current(location, fmt=None):
+    """Whether the location's stored QR image is the one rendering it now would produce"""
+    return (
+        bool(location.qr_code)
+        and location.qr_code_digest == location.get_qr_code_digest(fmt)
+        and location.qr_code.storage.exists(location.qr_code.name)
+    )
+
+
+def regenerate_qr_codes(locations, workers=None, fmt=None, force=False):
+    """
+    Re-render the QR images of locations that are out of date; returns the regenerated ones.
+
+    New images are saved under fresh storage names before one bulk_update
+    swaps them in, so a reader never sees a half-written file and the
+    transaction holds no storage writes; the replaced files are deleted once
+    the update commits, the new ones if it fails.
+    """
+    fmt = fmt or settings.QR_CODE_FORMAT
+    stale = [location for location in locations if force or not qr_code_is_current(location, fmt)]
+    if not stale:
+        return []
+
+    images = render_qr_codes([location.get_qr_code_data() for location in stale], workers, fmt)
+    previous = []
+    for location, image in zip(stale, images):
+        previous.append((location.qr_code.name, location.qr_code_digest))
+        location.qr_code.save(location.get_qr_code_filename(fmt=fmt), ContentFile(image), save=False)
+        location.qr_code_digest = location.get_qr_code_digest(fmt)
+    # A missing old file leaves its name free for the new image; keep that one
+    replaced = [
+        (location.qr_code.storage, name)
+        for location, (name, digest) in zip(stale, previous)
+        if name and name != location.qr_code.name
+    ]
+
+    def delete_old_files():
+        for storage, name in replaced:
+            storage.delete(name)
+
+    try:
+        with transaction.atomic():
+            PlatformLocation.objects.bulk_update(stale, ['qr_code', 'qr_code_digest'])
+            transaction.on_commit(delete_old_files)
+    except Exception:
+        # The rows still point at the old images
+        for location, (name, digest) in zip(stale, previous):
+            if location.qr_code.name != name:
+                location.qr_code.storage.delete(location.qr_code.name)
+            location.qr_code.name, location.qr_code_digest = name, digest
+        raise
+    return stale
@@ -0,0 +1,88 @@
+"""
+Keyset (cursor) pagination for complaint lists.
+
+Pages are ordered newest first on a timestamp plus the primary key, and each
+page is fetched with a WHERE on the last row seen instead of an OFFSET, so
+every page costs the same no matter how deep into the history it is.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    """Opaque cursor for a (timestamp, pk) position"""
+    raw = f"{value.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of results with cursors for the neighbouring pages"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(queryset, field, page_size, after=None, before=None):
+    """
+    Return a KeysetPage of queryset ordered by (field, pk) descending.
+
+    field is a model field or annotation holding a datetime. after/before are
+    cursors from a previous page's next_cursor/previous_cursor.
+    """
+    after = decode_cursor(after)
+    before = None if after else decode_cursor(before)
+
+    if before:
+        value, pk = before
+        queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+        rows = list(queryset.order_by(field, 'pk')[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+        has_previous = has_more
+    else:
+        if after:
+            value, pk = after
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after is not None
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+    if rows and has_previous:
+        previous_cursor = encode_cursor(getattr(rows[0], field), rows[0].pk)
+    return KeysetPage(rows, next_cursor, previous_cursor)
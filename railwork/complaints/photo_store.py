@@ -0,0 +1,164 @@
+"""
+Content-addressed storage of complaint photos.
+
+Reporters of the same spot often upload the same forwarded image. Photos are
+therefore stored by the SHA-256 of their bytes: store_photo() keeps one
+PhotoContent (file, display and thumbnail variants) per distinct image and
+points every ComplaintPhoto with those bytes at it. ComplaintPhoto.photo,
+display and thumbnail keep holding the shared file names, so serving and
+templates are unchanged.
+
+PhotoContent.ref_count counts the photos using a content. Code deleting
+photos in bulk passes the counts of what it deleted to release_contents(),
+which deletes contents (and their files) nobody uses any more;
+recount_contents() repairs the counts after deletes that bypassed it.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import ComplaintPhoto, PhotoContent
+
+CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(file):
+    """(sha256 hex digest, size) of a File, read in chunks; leaves it at the start"""
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+def content_files(content):
+    return [name for name in (content.file.name, content.display.name, content.thumbnail.name) if name]
+
+
+def store_photo(complaint, file, name, **fields):
+    """
+    Create a ComplaintPhoto of complaint for the image in file.
+
+    The image is only written to storage if no other photo has the same
+    bytes; otherwise the photo shares that content and, once made, its
+    display and thumbnail variants. Extra fields are set on the photo.
+    """
+    digest, size = hash_file(file)
+    while True:
+        content = PhotoContent.objects.filter(sha256=digest).first()
+        if content is None:
+            content = PhotoContent(sha256=digest, size=size)
+            content.file.save(name, file, save=False)
+            try:
+                with transaction.atomic():
+                    content.save()
+            except IntegrityError:
+                # The same image was stored concurrently; use that copy
+                content.file.delete(save=False)
+                continue
+
+        with transaction.atomic():
+            # Fails if release_contents() deleted an unused content in the meantime
+            if not PhotoContent.objects.filter(pk=content.pk).update(ref_count=F('ref_count') + 1):
+                continue
+            return ComplaintPhoto.objects.create(
+                complaint=complaint,
+                content=content,
+                photo=content.file.name,
+                display=content.display.name,
+                thumbnail=content.thumbnail.name,
+                variants_status='READY' if content.display else 'PENDING',
+                **fields
+            )
+
+
+def release_contents(content_counts):
+    """
+    Account for deleted photos; content_counts maps content ids to photos deleted.
+
+    Call in the deleting transaction after the photos are gone. Contents no
+    photo uses any more are deleted; returns their file names for removal.
+    """
+    for content_id, count in content_counts.items():
+        PhotoContent.objects.filter(pk=content_id).update(ref_count=F('ref_count') - count)
+    unused = PhotoContent.objects.filter(pk__in=list(content_counts), ref_count=0)
+    names = [name for content in unused for name in content_files(content)]
+    unused.delete()
+    return names
+
+
+def deleted_content_counts(photos):
+    """content_counts for release_contents() of a ComplaintPhoto queryset about to be deleted"""
+    return dict(
+        photos.filter(content__isnull=False).order_by().values('content_id')
+        .annotate(count=Count('id')).values_list('content_id', 'count')
+    )
+
+
+def adopt_photos(hashed_photos):
+    """
+    Move photos stored before deduplication onto shared contents.
+
+    hashed_photos is a list of (photo, sha256, size). The first file seen
+    for each image becomes its content; photos with the same bytes are
+    pointed at it. Returns (photos that were duplicates, names of files no
+    photo uses any more).
+    """
+    duplicates = 0
+    unused = []
+    with transaction.atomic():
+        for photo, digest, size in hashed_photos:
+            content = PhotoContent.objects.filter(sha256=digest).first()
+            own_variants = [photo.display.name, photo.thumbnail.name] if photo.variants_status == 'READY' else []
+            if content is None:
+                content = PhotoContent.objects.create(
+                    sha256=digest,
+                    file=photo.photo.name,
+                    display=photo.display.name if own_variants else '',
+                    thumbnail=photo.thumbnail.name if own_variants else '',
+                    size=size,
+                )
+            else:
+                duplicates += 1
+                if photo.photo.name != content.file.name:
+                    unused.append(photo.photo.name)
+                if own_variants and not content.display:
+                    PhotoContent.objects.filter(pk=content.pk).update(display=own_variants[0], thumbnail=own_variants[1])
+                    content.display, content.thumbnail = own_variants
+                else:
+                    unused.extend(name for name in own_variants if name and name not in content_files(content))
+
+            PhotoContent.objects.filter(pk=content.pk).update(ref_count=F('ref_count') + 1)
+            photo.content = content
+            photo.photo = content.file.name
+            if content.display:
+                photo.display = content.display.name
+                photo.thumbnail = content.thumbnail.name
+                photo.variants_status = 'READY'
+            photo.save(update_fields=['content', 'photo', 'display', 'thumbnail', 'variants_status'])
+    return duplicates, unused
+
+
+def recount_contents(orphan_age=timedelta(hours=1)):
+    """
+    Repair ref_count from the photos actually using each content.
+
+    Contents without photos that are older than orphan_age (younger ones may
+    be in the middle of store_photo()) are deleted. Returns (counts fixed,
+    names of files no longer used). Run it while nothing deletes photos.
+    """
+    fixed = 0
+    counted = PhotoContent.objects.annotate(references=Count('photos')).exclude(ref_count=F('references'))
+    for content_id, references in counted.values_list('id', 'references'):
+        fixed += PhotoContent.objects.filter(pk=content_id).update(ref_count=references)
+
+    orphans = PhotoContent.objects.filter(ref_count=0, photos__isnull=True, created_at__lt=timezone.now() - orphan_age)
+    names = [name for content in orphans for name in content_files(content)]
+    orphans.delete()
+    return fixed, names
@@ -0,0 +1,137 @@
+"""
+Display and thumbnail variants of complaint photos.
+
+submit_complaint stores photos exactly as uploaded, often several megabyte
+phone JPEGs, and marks them PENDING. The process_photos command claims
+pending photos, decodes and re-encodes them in a process pool (Pillow work is
+CPU bound and must not run in a request) and stores a downscaled display
+image and a small thumbnail next to the original. Pages show
+ComplaintPhoto.display_url / thumbnail_url, which fall back to the original
+until the variants exist.
+"""
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .models import ComplaintPhoto, PhotoContent
+
+# Pillow format name -> file extension
+VARIANT_FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+
+def encode_variants(data, display_size, thumbnail_size, fmt='jpeg', quality=80):
+    """
+    (display, thumbnail) image bytes for an uploaded photo.
+
+    Each variant fits in a size x size box. Runs in worker processes, so it
+    only takes and returns plain values.
+    """
+    image = Image.open(BytesIO(data))
+    # Let the JPEG decoder scale down while decoding instead of decoding every pixel
+    image.draft('RGB', (display_size, display_size))
+    # Phones store portrait photos sideways with an EXIF orientation tag
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    variants = []
+    # The thumbnail is scaled from the display image, not from the original again
+    for size in (display_size, thumbnail_size):
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=fmt.upper(), quality=quality)
+        variants.append(buffer.getvalue())
+    return tuple(variants)
+
+
+def claim_photos(limit):
+    """
+    Lock up to limit photos waiting for variants for this worker and return them.
+
+    Like the SMS outbox, photos are claimed with one conditional UPDATE each
+    and claimed again if the worker holding them died.
+    """
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=settings.PHOTO_LOCK_TIMEOUT)
+    due = (
+        ComplaintPhoto.objects.filter(variants_status='PENDING')
+        | ComplaintPhoto.objects.filter(variants_status='PROCESSING', locked_until__lt=now)
+    )
+    claimed = []
+    for photo in due.order_by('pk')[:limit]:
+        rows = ComplaintPhoto.objects.filter(pk=photo.pk, variants_status=photo.variants_status, locked_until=photo.locked_until)
+        if rows.update(variants_status='PROCESSING', locked_until=locked_until):
+            photo.variants_status = 'PROCESSING'
+            photo.locked_until = locked_until
+            claimed.append(photo)
+    return claimed
+
+
+def make_variants(photos, executor):
+    """
+    Encode the variants of claimed photos in executor and store them.
+
+    Returns a list of (photo, error) with error None for photos that are
+    READY; photos that cannot be read or decoded are marked FAILED.
+    """
+    fmt = settings.PHOTO_VARIANT_FORMAT
+    results = []
+    futures = []
+    for photo in photos:
+        content = PhotoContent.objects.filter(pk=photo.content_id).exclude(display='').first()
+        if content is not None:
+            # The same image was already processed for another photo
+            photo.display, photo.thumbnail = content.display.name, content.thumbnail.name
+            _finish(photo, 'READY')
+            results.append((photo, None))
+            continue
+        try:
+            with photo.photo.open('rb') as original:
+                data = original.read()
+        except OSError as e:
+            futures.append((photo, None, e))
+            continue
+        future = executor.submit(
+            encode_variants, data, settings.PHOTO_DISPLAY_SIZE, settings.PHOTO_THUMBNAIL_SIZE,
+            fmt, settings.PHOTO_VARIANT_QUALITY,
+        )
+        futures.append((photo, future, None))
+
+    for photo, future, error in futures:
+        if error is None:
+            error = future.exception()
+        if error is None:
+            display, thumbnail = future.result()
+            name = os.path.splitext(os.path.basename(photo.photo.name))[0]
+            extension = VARIANT_FORMATS[fmt]
+            photo.display.save(f'{name}.{extension}', ContentFile(display), save=False)
+            photo.thumbnail.save(f'{name}.{extension}', ContentFile(thumbnail), save=False)
+            if photo.content_id:
+                _share_variants(photo)
+            _finish(photo, 'READY')
+        else:
+            _finish(photo, 'FAILED')
+        results.append((photo, error))
+    return results
+
+
+def _finish(photo, status):
+    photo.variants_status = status
+    photo.locked_until = None
+    photo.save(update_fields=['display', 'thumbnail', 'variants_status', 'locked_until'])
+
+
+def _share_variants(photo):
+    """Record a photo's new variants on its content, or adopt the ones another worker stored first"""
+    rows = PhotoContent.objects.filter(pk=photo.content_id, display='')
+    if rows.update(display=photo.display.name, thumbnail=photo.thumbnail.name):
+        return
+    photo.display.delete(save=False)
+    photo.thumbnail.delete(save=False)
+    content = PhotoContent.objects.get(pk=photo.content_id)
+    photo.display, photo.thumbnail = content.display.name, content.thumbnail.name
@@ -0,0 +1,142 @@
+"""
+Bulk deletion of complaints, QR locations and stations for delete_data.
+
+QuerySet.delete() makes Django's deletion collector load every cascaded row
+into memory and removes everything in one transaction. Purger deletes in
+primary-key ordered batches instead, one short transaction per batch.
+Dependants are removed first, each table with one raw DELETE per batch,
+without loading a single row or sending delete signals; callers drop the
+affected rollup rows themselves. Photo and QR image files of a batch are removed by a thread pool
+after the batch has committed; shared photo files only once release_contents()
+finds no photo left using them.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .location_index import forget_locations
+from .models import (
+    Complaint, ComplaintHourlyRollup, ComplaintPhoto, OTPVerification, PlatformLocation, QRScanAttempt, SMSOutbox,
+)
+from .photo_store import deleted_content_counts, release_contents
+from .qr_archive import ARCHIVE_DIR
+from .station_cache import invalidate_station
+
+
+def raw_delete(queryset):
+    """DELETE the matching rows in one statement; no signals, no cascades, nothing loaded"""
+    return queryset._raw_delete(queryset.db)
+
+
+class Purger:
+    """
+    Deletes in batches of batch_size rows and removes media files with
+    media_workers threads. write(message) receives progress lines.
+    """
+
+    def __init__(self, batch_size=1000, media_workers=8, write=None):
+        self.batch_size = batch_size
+        self.pool = ThreadPoolExecutor(max_workers=media_workers)
+        self.file_futures = []
+        self.write = write or (lambda message: None)
+        self.rows = {}
+        self.started = time.perf_counter()
+
+    def _batches(self, queryset):
+        """Successive lists of up to batch_size primary keys of queryset, in pk order"""
+        last_pk = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:self.batch_size])
+            if not ids:
+                return
+            last_pk = ids[-1]
+            yield ids
+
+    def _progress(self, label, count, total):
+        self.rows[label] = self.rows.get(label, 0) + count
+        elapsed = time.perf_counter() - self.started
+        self.write(f'  {label}: {self.rows[label]}/{total} deleted ({self.rows[label] / elapsed if elapsed else 0:.0f}/s)')
+
+    def delete_files(self, names, storage=default_storage):
+        self.file_futures.extend(self.pool.submit(storage.delete, name) for name in names if name)
+
+    def delete_complaints(self, queryset):
+        """Delete complaints with their photos, OTPs and scan attempts; outbox messages are kept"""
+        total = queryset.count()
+        for ids in self._batches(queryset):
+            with transaction.atomic():
+                # Daughter complaints cascade from their parent, so they go in the same batch
+                ids = set(ids)
+                parents = ids
+                while parents:
+                    parents = set(Complaint.objects.filter(parent_complaint_id__in=parents).values_list('pk', flat=True)) - ids
+                    ids |= parents
+
+                complaints = Complaint.objects.filter(pk__in=ids)
+                affected = set(complaints.order_by().values_list('station_id', 'platform_location_id').distinct())
+                photos = ComplaintPhoto.objects.filter(complaint_id__in=ids)
+                # Shared contents lose a reference; only photos stored before deduplication own their files
+                content_counts = deleted_content_counts(photos)
+                legacy = photos.filter(content__isnull=True).values_list('photo', 'display', 'thumbnail')
+                photo_files = [name for names in legacy for name in names]
+                raw_delete(photos)
+                photo_files += release_contents(content_counts)
+                raw_delete(OTPVerification.objects.filter(complaint_id__in=ids))
+                raw_delete(QRScanAttempt.objects.filter(original_complaint_id__in=ids))
+                SMSOutbox.objects.filter(complaint_id__in=ids).update(complaint=None)
+                deleted = raw_delete(complaints)
+                for station_id in {station_id for station_id, location_id in affected}:
+                    invalidate_station(station_id)
+                forget_locations({location_id for station_id, location_id in affected})
+            self.delete_files(photo_files)
+            self._progress('complaints', deleted, total)
+
+    def delete_locations(self, queryset):
+        """Delete QR locations whose complaints are already gone, with their QR images"""
+        total = queryset.count()
+        for ids in self._batches(queryset):
+            with transaction.atomic():
+                locations = PlatformLocation.objects.filter(pk__in=ids)
+                images = list(locations.values_list('qr_code', flat=True))
+                raw_delete(QRScanAttempt.objects.filter(platform_location_id__in=ids))
+                raw_delete(ComplaintHourlyRollup.objects.filter(platform_location_id__in=ids))
+                deleted = raw_delete(locations)
+            self.delete_files(images)
+            self._progress('QR locations', deleted, total)
+
+    def delete_station(self, station):
+        """Delete a station and everything that belongs to it"""
+        self.delete_complaints(Complaint.objects.filter(station=station))
+        self.delete_locations(PlatformLocation.objects.filter(station=station))
+        raw_delete(ComplaintHourlyRollup.objects.filter(station=station))
+        self.delete_archives(f'station_{station.id}_')
+        station_id = station.id
+        # Only small tables (profiles, support requests) are left to cascade
+        station.delete()
+        invalidate_station(station_id)
+
+    def delete_archives(self, prefix=''):
+        """Delete prebuilt QR code archives whose file name starts with prefix"""
+        try:
+            filenames = default_storage.listdir(ARCHIVE_DIR)[1]
+        except FileNotFoundError:
+            return
+        self.delete_files(f'{ARCHIVE_DIR}/{filename}' for filename in filenames if filename.startswith(prefix))
+
+    def finish(self):
+        """
+        Wait for the file removals; returns (rows, files removed, file errors, seconds).
+
+        rows maps what was deleted in batches to the number of rows.
+        """
+        removed = errors = 0
+        for future in self.file_futures:
+            try:
+                future.result()
+                removed += 1
+            except OSError:
+                errors += 1
+        self.pool.shutdown()
+        return self.rows, removed, errors, time.perf_counter() - self.started
@@ -0,0 +1,84 @@
+"""
+QR code rendering.
+
+QR_FORMATS lists the output formats a QR code can be rendered in:
+- 'png': 1-bit PNG, the smallest raster format
+- 'rgb-png': 24-bit RGB PNG, the format QR codes were originally stored in
+- 'svg': vector image, sharpest when printed
+
+Kept free of Django imports so the functions can run in worker processes
+(see onboarding.bulk_create_locations) whatever the multiprocessing start
+method is.
+"""
+from io import BytesIO
+
+import qrcode
+
+
+def render_qr_png(data, error_correction=qrcode.constants.ERROR_CORRECT_L, border=4, rgb=True):
+    """PNG bytes of a QR code image encoding data (RGB unless rgb is False)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=error_correction,
+        box_size=10,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    qr_image = qr.make_image(fill_color="black", back_color="white")
+
+    # Convert to RGB if necessary
+    if rgb and qr_image.mode != 'RGB':
+        qr_image = qr_image.convert('RGB')
+
+    buffer = BytesIO()
+    qr_image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+# format -> (file extension, content type)
+QR_FORMATS = {
+    'png': ('png', 'image/png'),
+    'rgb-png': ('png', 'image/png'),
+    'svg': ('svg', 'image/svg+xml'),
+}
+
+
+def render_qr_svg(data, error_correction=qrcode.constants.ERROR_CORRECT_L, border=4, box_size=10):
+    """SVG bytes of a QR code, drawn as one stroked path with a segment per run of dark modules"""
+    qr = qrcode.QRCode(version=1, error_correction=error_correction, box_size=box_size, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    matrix = qr.get_matrix()  # includes the border
+    size = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        pen = None  # x where the previous run in this row ended
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            # Lines are 1 unit thick and centred on y + 0.5; later runs in a row move relatively
+            path.append(f'M{start} {y}.5h{x - start}' if pen is None else f'm{start - pen} 0h{x - start}')
+            pen = x
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size * box_size}" height="{size * box_size}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(path)}" stroke="#000"/></svg>'
+    ).encode()
+
+
+def render_qr(data, fmt='png'):
+    """QR code for data in one of QR_FORMATS, as bytes"""
+    if fmt == 'svg':
+        return render_qr_svg(data)
+    if fmt not in QR_FORMATS:
+        raise ValueError(f"Unknown QR code format: {fmt}")
+    return render_qr_png(data, rgb=fmt == 'rgb-png')
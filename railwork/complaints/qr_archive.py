@@ -0,0 +1,114 @@
+"""
+ZIP archives of a station's QR codes.
+
+iter_zip() produces the archive piece by piece for a StreamingHttpResponse:
+each QR image is copied from storage in CHUNK_SIZE blocks into a stored
+(uncompressed; PNGs do not shrink and SVGs are small) ZIP entry, so a download never holds
+more than one chunk in memory.
+
+With QR_ARCHIVE_PREBUILT the archive is instead written once to media
+storage and reused until the station's locations change; the file name
+carries a fingerprint of the archived locations, so any change produces a
+new archive and older ones are deleted. Storage has no atomic rename, so two
+requests may build the same archive at once and the second is saved under a
+suffixed name; files younger than CLEANUP_GRACE seconds are left alone so
+neither deletes the archive the other is about to serve.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from zipfile import ZIP_STORED, ZipFile, ZipInfo
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+ARCHIVE_DIR = 'qr_archives'
+CHUNK_SIZE = 64 * 1024
+CLEANUP_GRACE = 600
+
+
+class _ZipSink:
+    """Write-only, non-seekable file object collecting what ZipFile writes"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_entries(station):
+    """(name in archive, QR image field) for every location of the station with a QR code"""
+    entries = []
+    for platform_location in station.platform_locations.all():
+        if platform_location.qr_code:
+            # Use hash_id and location_description for better organization
+            location_name = platform_location.location_description.replace(' ', '_').replace(',', '').replace('/', '_')
+            extension = os.path.splitext(platform_location.qr_code.name)[1] or '.png'
+            entries.append((f"{platform_location.hash_id}_{location_name}{extension}", platform_location.qr_code))
+    return entries
+
+
+def iter_zip(entries):
+    """Yield a ZIP archive of the given (name, file field) entries in chunks"""
+    sink = _ZipSink()
+    with ZipFile(sink, 'w', ZIP_STORED) as zip_file:
+        for name, field in entries:
+            info = ZipInfo(name, date_time=time.localtime()[:6])
+            with field.storage.open(field.name, 'rb') as source, zip_file.open(info, 'w') as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    yield sink.pop()
+            yield sink.pop()
+    yield sink.pop()
+
+
+def archive_fingerprint(entries):
+    key = '\n'.join(f'{name}\t{field.name}' for name, field in entries)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def get_prebuilt_archive(station, entries):
+    """Storage name of the station's current archive, building it if its locations changed"""
+    prefix = f'station_{station.id}_'
+    name = f'{ARCHIVE_DIR}/{prefix}{archive_fingerprint(entries)}.zip'
+    if not default_storage.exists(name):
+        with tempfile.TemporaryFile() as archive:
+            for chunk in iter_zip(entries):
+                archive.write(chunk)
+            archive.seek(0)
+            name = default_storage.save(name, File(archive))
+
+    # Drop archives built for an earlier set of locations, and duplicates of concurrent builds,
+    # once no download can still be about to open them
+    try:
+        existing = default_storage.listdir(ARCHIVE_DIR)[1]
+    except FileNotFoundError:
+        existing = []
+    for filename in existing:
+        path = f'{ARCHIVE_DIR}/{filename}'
+        if not filename.startswith(prefix) or path == name:
+            continue
+        try:
+            age = timezone.now() - default_storage.get_modified_time(path)
+        except FileNotFoundError:
+            continue
+        if age.total_seconds() >= CLEANUP_GRACE:
+            default_storage.delete(path)
+    return name
@@ -0,0 +1,34 @@
+"""
+Rendered QR images, cached by a hash of what they encode.
+
+A QR image is fully determined by its payload and the render options, so the
+SHA-256 of both is used as the cache key and as a strong ETag. The images are
+kept in the QR_CACHE_ALIAS cache, which bounds its size (MAX_ENTRIES) and
+evicts old entries for both the local-memory and the file-based backend.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .qr import render_qr_png
+
+# Bump when render_qr_png() output changes so cached images and ETags are replaced
+QR_RENDER_VERSION = 1
+
+
+def qr_digest(data, **options):
+    """Content address of the image render_qr_png(data, **options) produces"""
+    key = repr((QR_RENDER_VERSION, data, sorted(options.items())))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_qr_png(data, **options):
+    """PNG bytes of the QR code for data, rendered at most once per cache lifetime"""
+    cache = caches[settings.QR_CACHE_ALIAS]
+    key = f'qr-png:{qr_digest(data, **options)}'
+    png = cache.get(key)
+    if png is None:
+        png = render_qr_png(data, **options)
+        cache.set(key, png, settings.QR_CACHE_MAX_AGE)
+    return png
@@ -0,0 +1,210 @@
+"""
+Incremental maintenance of ComplaintHourlyRollup.
+
+Each rollup row counts the complaints of one station / QR location that were
+created in one UTC hour and currently have a given status and closed state.
+Complaint.save() moves a complaint between rows and complaint_deleted() takes
+a deleted one out; code that changes complaints with queryset.update() must
+call record_bulk_change() first, inside the same transaction.
+"""
+from collections import Counter
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Complaint, ComplaintHourlyRollup, QRScanAttempt
+from .location_index import forget_locations
+from .station_cache import invalidate_station
+
+
+def hour_bucket(value):
+    """Start of the UTC hour containing the given datetime"""
+    return timezone.localtime(value, dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def apply_deltas(deltas):
+    """
+    Add counter deltas to rollup rows.
+
+    deltas maps (station_id, platform_location_id, bucket, status, is_closed)
+    to a dict of {field: increment}.
+    """
+    for key, increments in deltas.items():
+        increments = {field: value for field, value in increments.items() if value}
+        if not increments:
+            continue
+        station_id, platform_location_id, bucket, status, is_closed = key
+        rows = ComplaintHourlyRollup.objects.filter(
+            station_id=station_id,
+            platform_location_id=platform_location_id,
+            bucket=bucket,
+            status=status,
+            is_closed=is_closed,
+        )
+        updates = {field: F(field) + value for field, value in increments.items()}
+        if rows.update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                ComplaintHourlyRollup.objects.create(
+                    station_id=station_id,
+                    platform_location_id=platform_location_id,
+                    bucket=bucket,
+                    status=status,
+                    is_closed=is_closed,
+                    **increments
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            rows.update(**updates)
+
+
+def record_complaint_change(old_state, new_state):
+    """
+    Move one complaint between rollup rows.
+
+    States are Complaint.get_rollup_state() tuples; old_state is None for a new complaint.
+    """
+    if old_state == new_state:
+        return
+    deltas = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        station_id, platform_location_id, created_at, status, is_closed = state
+        key = (station_id, platform_location_id, hour_bucket(created_at), status, is_closed)
+        deltas.setdefault(key, Counter())['complaint_count'] += sign
+    apply_deltas(deltas)
+
+
+def complaint_deleted(sender, instance, **kwargs):
+    """
+    pre_delete receiver of Complaint: take a deleted complaint out of the rollup.
+
+    Runs inside the deletion's transaction, and like Complaint.save() reads
+    the stored row rather than trusting the instance being deleted. Purger's
+    raw DELETEs bypass it.
+    """
+    old_state = Complaint.objects.select_for_update().filter(pk=instance.pk).values_list(*Complaint.ROLLUP_FIELDS).first()
+    if old_state is None:
+        return
+    record_complaint_change(old_state, None)
+    invalidate_station(old_state[0])
+    forget_locations([old_state[1]])
+
+
+def record_bulk_change(queryset, **changes):
+    """
+    Account for queryset.update(**changes) before it runs.
+
+    Only status and is_closed changes affect the rollup; a status given as an
+    expression (e.g. F('status')) leaves the status unchanged. The cached
+    statistics of every affected station and the duplicate scan index of every
+    affected location are invalidated.
+    """
+    new_status = changes.get('status')
+    if not isinstance(new_status, str):
+        new_status = None
+    new_closed = changes.get('is_closed')
+
+    groups = queryset.order_by().values(
+        'station_id', 'platform_location_id', 'status', 'is_closed',
+        bucket=TruncHour('created_at', tzinfo=dt_timezone.utc),
+    ).annotate(count=Count('id'))
+
+    deltas = {}
+    station_ids = set()
+    location_ids = set()
+    for group in groups:
+        station_ids.add(group['station_id'])
+        location_ids.add(group['platform_location_id'])
+        old_key = (group['station_id'], group['platform_location_id'], group['bucket'], group['status'], group['is_closed'])
+        new_key = (
+            group['station_id'],
+            group['platform_location_id'],
+            group['bucket'],
+            new_status or group['status'],
+            group['is_closed'] if new_closed is None else new_closed,
+        )
+        if old_key == new_key:
+            continue
+        deltas.setdefault(old_key, Counter())['complaint_count'] -= group['count']
+        deltas.setdefault(new_key, Counter())['complaint_count'] += group['count']
+    apply_deltas(deltas)
+    for station_id in station_ids:
+        invalidate_station(station_id)
+    forget_locations(location_ids)
+
+
+def record_scan_attempt(complaint, attempted_at=None):
+    """Count a duplicate QR scan against the complaint it was redirected to"""
+    bucket = hour_bucket(attempted_at or timezone.now())
+    key = (complaint.station_id, complaint.platform_location_id, bucket, complaint.status, complaint.is_closed)
+    apply_deltas({key: {'scan_attempts': 1}})
+    invalidate_station(complaint.station_id)
+
+
+def rebuild_rollups(station_ids=None):
+    """
+    Recompute rollup rows from the complaint and scan attempt tables.
+
+    Scan attempts are only stored as a running total per complaint, so the
+    rebuilt rows attribute all of them to the hour of the last attempt.
+    Returns the number of rollup rows written.
+    """
+    complaints = Complaint.objects.order_by()
+    scan_attempts = QRScanAttempt.objects.order_by()
+    existing = ComplaintHourlyRollup.objects.all()
+    if station_ids is not None:
+        complaints = complaints.filter(station_id__in=station_ids)
+        scan_attempts = scan_attempts.filter(platform_location__station_id__in=station_ids)
+        existing = existing.filter(station_id__in=station_ids)
+
+    # Counted in the same transaction that replaces the rows: with SQLite's
+    # IMMEDIATE transactions no complaint change can land in between
+    with transaction.atomic():
+        rows = {}
+        complaint_groups = complaints.values(
+            'station_id', 'platform_location_id', 'status', 'is_closed',
+            bucket=TruncHour('created_at', tzinfo=dt_timezone.utc),
+        ).annotate(count=Count('id'))
+        for group in complaint_groups:
+            key = (group['station_id'], group['platform_location_id'], group['bucket'], group['status'], group['is_closed'])
+            rows.setdefault(key, Counter())['complaint_count'] += group['count']
+
+        attempt_groups = scan_attempts.values(
+            'platform_location_id',
+            'original_complaint__status',
+            'original_complaint__is_closed',
+            station_id=F('platform_location__station_id'),
+            bucket=TruncHour('last_attempt_at', tzinfo=dt_timezone.utc),
+        ).annotate(attempts=Sum('attempt_count'))
+        for group in attempt_groups:
+            key = (
+                group['station_id'],
+                group['platform_location_id'],
+                group['bucket'],
+                group['original_complaint__status'],
+                group['original_complaint__is_closed'],
+            )
+            rows.setdefault(key, Counter())['scan_attempts'] += group['attempts']
+
+        existing.delete()
+        ComplaintHourlyRollup.objects.bulk_create([
+            ComplaintHourlyRollup(
+                station_id=station_id,
+                platform_location_id=platform_location_id,
+                bucket=bucket,
+                status=status,
+                is_closed=is_closed,
+                complaint_count=counts['complaint_count'],
+                scan_attempts=counts['scan_attempts'],
+            )
+            for (station_id, platform_location_id, bucket, status, is_closed), counts in rows.items()
+        ], batch_size=1000)
+    for station_id in set(station_ids or []) | {key[0] for key in rows}:
+        invalidate_station(station_id)
+    return len(rows)
@@ -0,0 +1,97 @@
+"""
+SMS outbox.
+
+Views never talk to the SMS gateway. queue_sms() writes an SMSOutbox row in
+the caller's transaction, so a message exists exactly when the complaint it
+belongs to was committed. The dispatch_sms command claims due messages,
+sends them through the SMS gateway client (see sms_gateway) and records the
+outcome of each message, retrying failures with exponential backoff. Messages
+claimed within a short window that share the same text are coalesced into
+one bulk gateway call.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SMSOutbox
+from .sms_gateway import CircuitOpenError
+
+
+def queue_sms(phone_number, message, complaint=None):
+    """Add a message to the outbox; call inside the transaction that needs it sent"""
+    return SMSOutbox.objects.create(complaint=complaint, phone_number=phone_number, message=message)
+
+
+def claim_batch(limit):
+    """
+    Lock up to limit due messages for this dispatcher and return them.
+
+    Messages are claimed one conditional UPDATE at a time, so several
+    dispatchers can drain the same outbox without sending a message twice.
+    Messages locked by a dispatcher that died are claimed again once the lock
+    times out.
+    """
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=settings.SMS_LOCK_TIMEOUT)
+    due = (
+        SMSOutbox.objects.filter(status='PENDING', next_attempt_at__lte=now)
+        | SMSOutbox.objects.filter(status='SENDING', locked_until__lt=now)
+    )
+    claimed = []
+    for message in due.order_by('next_attempt_at', 'pk')[:limit]:
+        rows = SMSOutbox.objects.filter(pk=message.pk, status=message.status, locked_until=message.locked_until)
+        if rows.update(status='SENDING', locked_until=locked_until, attempts=message.attempts + 1):
+            message.status = 'SENDING'
+            message.locked_until = locked_until
+            message.attempts += 1
+            claimed.append(message)
+    return claimed
+
+
+def coalesce(messages, max_recipients):
+    """
+    Group messages with identical text into bulk sends.
+
+    Returns lists of messages, each list at most max_recipients long, in the
+    order the texts first appear. Messages with per-recipient content (such
+    as OTPs) end up alone in their list and are sent individually.
+    """
+    groups = {}
+    for message in messages:
+        groups.setdefault(message.message, []).append(message)
+    return [
+        group[start:start + max_recipients]
+        for group in groups.values()
+        for start in range(0, len(group), max_recipients)
+    ]
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt: SMS_RETRY_BACKOFF doubled per failed attempt, with jitter"""
+    delay = settings.SMS_RETRY_BACKOFF * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def record_result(message, error=None):
+    """Store the outcome of a send attempt"""
+    now = timezone.now()
+    message.locked_until = None
+    if error is None:
+        message.status = 'SENT'
+        message.sent_at = now
+        message.last_error = ''
+    elif isinstance(error, CircuitOpenError):
+        # Nothing was sent, so the attempt does not count against the message
+        message.status = 'PENDING'
+        message.attempts -= 1
+        message.next_attempt_at = now + timedelta(seconds=error.retry_after)
+    else:
+        message.last_error = str(error)
+        if getattr(error, 'permanent', False) or message.attempts >= settings.SMS_MAX_ATTEMPTS:
+            message.status = 'FAILED'
+        else:
+            message.status = 'PENDING'
+            message.next_attempt_at = now + retry_delay(message.attempts)
+    message.save(update_fields=['status', 'attempts', 'sent_at', 'last_error', 'next_attempt_at', 'locked_until'])
@@ -0,0 +1,293 @@
+"""
+SMS gateway clients.
+
+get_gateway() returns the process-wide client selected by SMS_BACKEND (a
+dotted path, like EMAIL_BACKEND). Every client shares the same behaviour
+around the actual send: a circuit breaker that fails fast while the provider
+is down, and latency metrics for every attempt.
+
+Identical texts for several numbers can be sent in one call with send_bulk().
+
+- Fast2SMSGateway keeps a pooled requests.Session (one TCP/TLS connection
+  per concurrent sender, reused across messages) and always sets connect and
+  read timeouts.
+- FakeGateway never leaves the process; tests and benchmarks use it to
+  record messages, inject failures and simulate gateway latency.
+"""
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class SMSError(Exception):
+    """A send failed; permanent errors are not retried"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class CircuitOpenError(SMSError):
+    """The circuit breaker is open; nothing was sent"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'SMS gateway circuit open, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing provider.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused for reset_timeout seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def retry_after(self):
+        """Seconds until calls are allowed again (0 if the circuit is closed or half-open)"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            return max(0, self.opened_at + self.reset_timeout - self.clock())
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if remaining > 0 or self.trial_running:
+                raise CircuitOpenError(max(remaining, 0))
+            self.trial_running = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+class LatencyStats:
+    """
+    Latency and outcome of every send attempt made through a gateway.
+
+    Totals cover every attempt; the latency figures cover the last
+    `window` attempts, so a long-running dispatcher keeps constant memory.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latencies = deque(maxlen=self.window)
+            self.sends = 0
+            self.recipients = 0
+            self.errors = 0
+            self.rejected = 0
+
+    def record(self, seconds, error=None, recipients=1):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.sends += 1
+            self.recipients += recipients
+            if error is not None:
+                self.errors += 1
+
+    def record_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        """Counts plus average/p50/p95/max latency in milliseconds of the recent attempts"""
+        with self.lock:
+            latencies = list(self.latencies)
+            stats = {
+                'sends': self.sends,
+                'recipients': self.recipients,
+                'errors': self.errors,
+                'circuit_rejected': self.rejected,
+            }
+        # Sorted outside the lock, so senders never wait for a snapshot
+        latencies.sort()
+        if latencies:
+            stats.update({
+                'avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1),
+            })
+        return stats
+
+
+class BaseGateway:
+    """Circuit breaker and metrics around a backend's _send()"""
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        self.breaker = CircuitBreaker(
+            settings.SMS_CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold,
+            settings.SMS_CIRCUIT_RESET_TIMEOUT if reset_timeout is None else reset_timeout,
+        )
+        self.stats = LatencyStats()
+
+    def send(self, phone_number, message):
+        """Send one message; raises SMSError (or CircuitOpenError) on failure"""
+        self.send_bulk([phone_number], message)
+
+    def send_bulk(self, phone_numbers, message):
+        """
+        Send the same text to several numbers in one gateway call; all succeed or fail together.
+
+        Raises SMSError on failure; other exceptions from _send() are wrapped in one.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats.record_rejected()
+            raise
+        started = time.perf_counter()
+        try:
+            self._send(phone_numbers, message)
+        except Exception as e:
+            # Unexpected errors (library or parsing bugs) count as provider failures too;
+            # skipping the breaker here would leave a half-open trial running forever
+            error = e if isinstance(e, SMSError) else SMSError(f'{type(e).__name__}: {e}')
+            self.stats.record(time.perf_counter() - started, error, len(phone_numbers))
+            # A rejected message says nothing about the provider's health
+            if error.permanent:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            if error is e:
+                raise
+            raise error from e
+        self.stats.record(time.perf_counter() - started, recipients=len(phone_numbers))
+        self.breaker.record_success()
+
+    def _send(self, phone_numbers, message):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Fast2SMSGateway(BaseGateway):
+    """Fast2SMS bulkV2 over a pooled keep-alive session"""
+
+    def __init__(self, url=None, api_key=None, pool_size=None, timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url or settings.FAST2SMS_URL
+        self.api_key = api_key if api_key is not None else settings.FAST2SMS_API_KEY
+        self.timeout = timeout or (settings.SMS_CONNECT_TIMEOUT, settings.SMS_READ_TIMEOUT)
+        pool_size = pool_size or settings.SMS_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _send(self, phone_numbers, message):
+        try:
+            response = self.session.post(
+                self.url,
+                data={
+                    'message': message,
+                    'language': 'english',
+                    'route': 'q',
+                    'numbers': ','.join(phone_numbers),
+                },
+                headers={'authorization': self.api_key or ''},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            raise SMSError(f'{type(e).__name__}: {e}')
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SMSError(f'HTTP {response.status_code}')
+        if response.status_code >= 400:
+            raise SMSError(f'HTTP {response.status_code}: {response.text[:200]}', permanent=True)
+        try:
+            accepted = response.json().get('return')
+        except ValueError:
+            raise SMSError('Invalid JSON response')
+        if not accepted:
+            raise SMSError(f'Rejected: {response.text[:200]}')
+
+    def close(self):
+        self.session.close()
+
+
+class FakeGateway(BaseGateway):
+    """
+    In-process gateway for tests and benchmarks.
+
+    Delivered messages are appended to `sent` as (phone_number, message)
+    pairs and every gateway call to `calls` as (phone_numbers, message).
+    `latency` seconds are slept per call; queue exceptions with fail_next().
+    """
+
+    def __init__(self, latency=0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.sent = []
+        self.calls = []
+        self.failures = []
+        self.lock = threading.Lock()
+
+    def fail_next(self, count=1, error=None):
+        with self.lock:
+            self.failures.extend([error or SMSError('Simulated gateway failure')] * count)
+
+    def _send(self, phone_numbers, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            self.calls.append((list(phone_numbers), message))
+            self.sent.extend((phone_number, message) for phone_number in phone_numbers)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """The shared gateway client of this process, built from SMS_BACKEND on first use"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = import_string(settings.SMS_BACKEND)()
+        return _gateway
+
+
+def reset_gateway():
+    """Close and forget the shared client (after settings changes, in tests)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.close()
+        _gateway = None
@@ -0,0 +1,102 @@
+"""
+Per-station cache for analytics and dashboard statistics.
+
+Every station has a version counter in the cache. Cached blocks are stored
+together with the version they were built for, so bumping the counter (on any
+complaint mutation for the station) makes all of the station's blocks stale at
+once. A read fetches the counter and the block in a single get_many() call.
+Works with any Django cache backend, but invalidation only reaches the
+processes sharing it: local memory is for development only (see CACHE_BACKEND
+in settings).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cache():
+    return caches[settings.STATION_CACHE_ALIAS]
+
+
+def version_key(station_id):
+    return f'station-cache:{station_id}:version'
+
+
+def data_key(station_id, name):
+    return f'station-cache:{station_id}:{name}'
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def get_cache_stats():
+    """Hit/miss counts of this process since start (or the last reset)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+def get_cached(station_id, name, builder, timeout=None):
+    """
+    Return the cached block `name` for a station, building it with builder() if
+    it is missing or was built for an older station version.
+    """
+    cache = get_cache()
+    keys = [version_key(station_id), data_key(station_id, name)]
+    values = cache.get_many(keys)
+    version = values.get(keys[0])
+    entry = values.get(keys[1])
+
+    if version is None:
+        # Start from a unique value so entries from before an eviction never match
+        cache.add(keys[0], time.time_ns(), None)
+        version = cache.get(keys[0])
+    elif entry is not None and entry[0] == version:
+        _count('hits')
+        return entry[1]
+
+    _count('misses')
+    data = builder()
+    if timeout is None:
+        timeout = settings.STATION_CACHE_TIMEOUT
+    cache.set(keys[1], (version, data), timeout)
+    return data
+
+
+def _bump(station_id):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(station_id))
+    except ValueError:
+        cache.set(version_key(station_id), time.time_ns(), None)
+
+
+def invalidate_station(station_id):
+    """
+    Mark all cached blocks of a station as stale.
+
+    The version is bumped immediately and again when the surrounding
+    transaction commits, so a reader that rebuilt a block from pre-commit
+    data in between cannot keep serving it.
+    """
+    if station_id is None:
+        return
+    _bump(station_id)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(station_id))
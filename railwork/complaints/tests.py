@@ -1,3 +1,1590 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time as time_module
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from zipfile import ZIP_STORED, ZipFile
+from zoneinfo import ZoneInfo
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, quote
 
-# Create your tests here.
+import qrcode
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.files import locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+from django.db import OperationalError, connection, connections
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .analytics import get_station_analytics, time_series
+from .location_index import DUPLICATE_WINDOW, get_active_complaint
+from .onboarding import bulk_create_locations, regenerate_qr_codes, render_qr_codes
+from .photo_store import store_photo
+from .uploads import append_chunk, partial_path
+from .photos import claim_photos
+from .qr import render_qr, render_qr_png
+from .qr_archive import ARCHIVE_DIR, CLEANUP_GRACE, archive_entries, get_prebuilt_archive, iter_zip
+from .rollups import record_bulk_change
+from .sms import claim_batch, queue_sms
+from .sms_gateway import CircuitBreaker, CircuitOpenError, FakeGateway, LatencyStats, SMSError, get_gateway, reset_gateway
+from .station_cache import get_cache, get_cache_stats, reset_cache_stats
+from .models import City, Complaint, ComplaintHourlyRollup, ComplaintPhoto, ComplaintSequence, JobLock, OTPVerification, PhotoContent, PlatformLocation, QRScanAttempt, SMSOutbox, Station, UserProfile
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StationTestCase(TestCase):
+    """Base test case with a city, a station, its manager and a few QR locations"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        get_cache().clear()
+        reset_cache_stats()
+        self.user = User.objects.create_user(username='manager', email='manager@example.com', password='secret')
+        self.city = City.objects.create(name='Delhi', code='DLI')
+        self.station = Station.objects.create(
+            name='New Delhi', station_code='NDLS', city=self.city, total_platforms=3, manager=self.user
+        )
+        UserProfile.objects.create(user=self.user, station=self.station)
+        self.locations = [
+            PlatformLocation.objects.create(station=self.station, platform_number=1, location_description='Entry'),
+            PlatformLocation.objects.create(station=self.station, platform_number=1, location_description='Washroom'),
+            PlatformLocation.objects.create(station=self.station, platform_number=2, location_description='Waiting Area'),
+        ]
+
+    def create_complaint(self, location=None, status='PENDING', created_at=None, **kwargs):
+        complaint = Complaint.objects.create(
+            station=self.station,
+            platform_location=location,
+            reporter_phone='9999999999',
+            status=status,
+            **kwargs
+        )
+        if created_at is not None:
+            Complaint.objects.filter(pk=complaint.pk).update(created_at=created_at)
+            complaint.refresh_from_db()
+        return complaint
+
+
+class StationAnalyticsTests(StationTestCase):
+    def seed(self):
+        now = timezone.now()
+        self.create_complaint(self.locations[0], 'PENDING')
+        self.create_complaint(self.locations[0], 'RESOLVED')
+        self.create_complaint(self.locations[2], 'IN_PROGRESS', is_closed=True, closed_status='IN_PROGRESS')
+        self.create_complaint(self.locations[1], 'RESOLVED', created_at=now - timedelta(days=1))
+        self.create_complaint(self.locations[1], 'PENDING', created_at=now - timedelta(days=10))
+        original = self.create_complaint(self.locations[1], 'PENDING', created_at=now - timedelta(days=40))
+        QRScanAttempt.objects.create(platform_location=self.locations[1], original_complaint=original, attempt_count=3)
+
+    def test_context_values(self):
+        self.seed()
+        context = get_station_analytics(self.station)
+
+        self.assertEqual(context['total_complaints'], 6)
+        self.assertEqual(context['pending_complaints'], 3)
+        self.assertEqual(context['in_progress_complaints'], 1)
+        self.assertEqual(context['resolved_complaints'], 2)
+        self.assertEqual(context['closed_complaints'], 1)
+        self.assertEqual(context['today_stats'], {'total': 3, 'pending': 1, 'in_progress': 1, 'resolved': 1, 'closed': 1})
+        self.assertEqual(context['yesterday_stats'], {'total': 1, 'pending': 0, 'in_progress': 0, 'resolved': 1, 'closed': 0})
+        self.assertEqual(context['daily_changes']['total'], 200.0)
+
+        self.assertEqual(len(context['daily_data']), 30)
+        self.assertEqual(context['daily_data'][-1]['total'], 3)
+        self.assertEqual(sum(day['total'] for day in context['daily_data']), 5)
+        self.assertEqual(len(context['weekly_stats']), 7)
+        self.assertEqual([day['count'] for day in context['weekly_stats']][-2:], [1, 3])
+        self.assertEqual(len(context['hourly_stats']), 24)
+        self.assertEqual(sum(hour['count'] for hour in context['hourly_stats']), 3)
+
+        platform_stats = {p['platform_number']: p for p in context['platform_stats']}
+        self.assertEqual(len(platform_stats), 3)
+        self.assertEqual(platform_stats[1]['total'], 5)
+        self.assertEqual(platform_stats[1]['today'], 2)
+        self.assertEqual(platform_stats[2]['closed'], 1)
+        self.assertEqual(platform_stats[3]['total'], 0)
+
+        qr_stats = {s['location'].id: s for s in context['qr_location_stats']}
+        self.assertEqual(qr_stats[self.locations[1].id]['total'], 3)
+        self.assertEqual(qr_stats[self.locations[1].id]['pending'], 2)
+
+        top = context['today_location_stats']
+        self.assertEqual([s['location'].id for s in top], [self.locations[1].id, self.locations[0].id, self.locations[2].id])
+        self.assertEqual(top[0]['count'], 0)
+        self.assertEqual(top[0]['scan_attempts'], 3)
+        self.assertEqual(top[1]['count'], 2)
+        self.assertEqual(top[1]['resolved'], 1)
+
+    def test_query_budget_does_not_grow_with_station_size(self):
+        self.seed()
+        with CaptureQueriesContext(connection) as small:
+            context = get_station_analytics(self.station)
+            list(context['worker_stats'])
+            list(context['monthly_data'])
+            list(context['recent_complaints'])
+
+        self.station.total_platforms = 20
+        self.station.save()
+        for platform_number in range(3, 21):
+            location = PlatformLocation.objects.create(
+                station=self.station, platform_number=platform_number, location_description='Platform End'
+            )
+            for status in ('PENDING', 'IN_PROGRESS', 'RESOLVED'):
+                self.create_complaint(location, status, assigned_worker=f'Worker {platform_number}')
+
+        with CaptureQueriesContext(connection) as large:
+            context = get_station_analytics(self.station)
+            list(context['worker_stats'])
+            list(context['monthly_data'])
+            list(context['recent_complaints'])
+
+        self.assertLessEqual(len(small.captured_queries), 10)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(context['total_complaints'], 6 + 18 * 3)
+
+    def test_view_renders(self):
+        self.seed()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('station_analytics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_complaints'], 6)
+        self.assertLess(len(queries.captured_queries), 20)
+
+
+class TimeSeriesTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        # 19:00 UTC on Jan 1st is 00:30 on Jan 2nd in IST
+        self.create_complaint(self.locations[0], created_at=datetime(2026, 1, 1, 19, 0, tzinfo=dt_timezone.utc))
+        self.create_complaint(self.locations[0], 'RESOLVED', created_at=datetime(2026, 1, 3, 10, 0, tzinfo=dt_timezone.utc))
+        self.complaints = Complaint.objects.filter(station=self.station)
+
+    def test_daily_buckets_follow_the_station_time_zone(self):
+        ist = ZoneInfo('Asia/Kolkata')
+        with self.assertNumQueries(1):
+            series = time_series(self.complaints, 'day', date(2025, 12, 31), date(2026, 1, 4), ist)
+        self.assertEqual(series, [
+            (date(2025, 12, 31), {'count': 0}),
+            (date(2026, 1, 1), {'count': 0}),
+            (date(2026, 1, 2), {'count': 1}),
+            (date(2026, 1, 3), {'count': 1}),
+            (date(2026, 1, 4), {'count': 0}),
+        ])
+        utc_series = dict(time_series(self.complaints, 'day', date(2026, 1, 1), date(2026, 1, 2), dt_timezone.utc))
+        self.assertEqual(utc_series, {date(2026, 1, 1): {'count': 1}, date(2026, 1, 2): {'count': 0}})
+
+    def test_hourly_buckets_with_conditional_aggregates(self):
+        ist = ZoneInfo('Asia/Kolkata')
+        start = datetime(2026, 1, 2, 0, 0, tzinfo=ist)
+        with self.assertNumQueries(1):
+            series = time_series(
+                self.complaints, 'hour', start, start + timedelta(days=2), ist,
+                total=Count('id'), resolved=Count('id', filter=Q(status='RESOLVED')),
+            )
+        self.assertEqual(len(series), 48)
+        self.assertEqual(series[0], (start, {'total': 1, 'resolved': 0}))
+        # 10:00 UTC on Jan 3rd is 15:30 IST, counted in the 15:00 bucket
+        self.assertEqual(series[24 + 15], (datetime(2026, 1, 3, 15, 0, tzinfo=ist), {'total': 1, 'resolved': 1}))
+        self.assertEqual(sum(values['total'] for _, values in series), 2)
+
+
+class ComplaintRollupTests(StationTestCase):
+    def rollup_counts(self):
+        rows = ComplaintHourlyRollup.objects.filter(complaint_count__gt=0)
+        return sorted(
+            (row.platform_location_id or 0, row.bucket, row.status, row.is_closed, row.complaint_count)
+            for row in rows
+        )
+
+    def test_rollup_follows_status_changes_and_closing(self):
+        self.client.force_login(self.user)
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS')
+        daughter = self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=1)
+        self.create_complaint(self.locations[1], 'PENDING')
+
+        def count(**filters):
+            return sum(ComplaintHourlyRollup.objects.filter(**filters).values_list('complaint_count', flat=True))
+
+        self.assertEqual(count(status='IN_PROGRESS', is_closed=False), 2)
+        self.assertEqual(count(status='PENDING', is_closed=False), 1)
+
+        self.client.post(reverse('update_status', args=[parent.id]), {'status': 'RESOLVED'})
+        self.assertEqual(count(status='IN_PROGRESS'), 0)
+        self.assertEqual(count(status='RESOLVED', is_closed=False), 2)
+
+        self.client.post(reverse('close_complaint', args=[parent.id]))
+        daughter.refresh_from_db()
+        self.assertTrue(daughter.is_closed)
+        self.assertEqual(count(status='RESOLVED', is_closed=True), 2)
+        self.assertEqual(count(is_closed=False), 1)
+
+        Complaint.objects.filter(is_closed=False).update(created_at=timezone.now() - timedelta(days=2))
+        call_command('auto_close_complaints', stdout=StringIO())
+        call_command('rebuild_complaint_rollups', stdout=StringIO())
+        self.assertEqual(count(status='PENDING', is_closed=True), 1)
+        self.assertEqual(count(is_closed=False), 0)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        for location in self.locations:
+            for status in ('PENDING', 'IN_PROGRESS', 'RESOLVED'):
+                complaint = self.create_complaint(location, status)
+        complaint.status = 'PENDING'
+        complaint.save()
+        self.create_complaint(None, 'PENDING')
+
+        incremental = self.rollup_counts()
+        call_command('rebuild_complaint_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_counts(), incremental)
+        self.assertEqual(sum(row[-1] for row in incremental), 10)
+
+    def test_saving_a_stale_copy_moves_the_stored_state(self):
+        complaint = self.create_complaint(self.locations[0], 'PENDING')
+        first, second = Complaint.objects.get(pk=complaint.pk), Complaint.objects.get(pk=complaint.pk)
+        first.status = 'RESOLVED'
+        first.save()
+        # Loaded as PENDING, but the row is RESOLVED by now
+        second.status = 'IN_PROGRESS'
+        second.save()
+        # A bulk change behind the loaded copy
+        record_bulk_change(Complaint.objects.filter(pk=complaint.pk), status='PENDING')
+        Complaint.objects.filter(pk=complaint.pk).update(status='PENDING')
+        second.is_closed = True
+        second.save()
+
+        incremental = self.rollup_counts()
+        call_command('rebuild_complaint_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_counts(), incremental)
+        self.assertEqual([row[2:] for row in incremental], [('IN_PROGRESS', True, 1)])
+
+    def test_deleted_complaints_leave_the_rollup(self):
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS')
+        self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=1)
+        single = self.create_complaint(self.locations[1], 'RESOLVED')
+        kept = self.create_complaint(self.locations[2])
+
+        single.delete()
+        # The daughter goes with its parent through the cascade
+        Complaint.objects.get(pk=parent.pk).delete()
+
+        incremental = self.rollup_counts()
+        call_command('rebuild_complaint_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_counts(), incremental)
+        self.assertEqual([row[2:] for row in incremental], [(kept.status, False, 1)])
+
+
+@override_settings(DASHBOARD_PAGE_SIZE=3)
+class UserDashboardTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def get_page(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user_dashboard'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries.captured_queries)
+
+    def test_keyset_pages_cover_all_complaints(self):
+        now = timezone.now()
+        created = [
+            self.create_complaint(self.locations[i % 3], created_at=now - timedelta(minutes=i)) for i in range(8)
+        ]
+        # Two complaints sharing a timestamp are ordered by id
+        Complaint.objects.filter(pk=created[7].pk).update(created_at=created[6].created_at)
+
+        seen = []
+        response, _ = self.get_page()
+        while True:
+            seen.extend(c.id for c in response.context['complaints'])
+            page = response.context['page']
+            if not page.has_next:
+                break
+            response, _ = self.get_page(after=page.next_cursor)
+        self.assertEqual(seen, [c.id for c in created[:6]] + [created[7].id, created[6].id])
+        self.assertEqual(response.context['total_complaints'], 8)
+
+        # Walking back from the last page returns the previous one
+        previous, _ = self.get_page(before=response.context['page'].previous_cursor)
+        self.assertEqual([c.id for c in previous.context['complaints']], seen[3:6])
+
+    def test_page_query_count_is_constant(self):
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS')
+        _, baseline = self.get_page()
+
+        for i in range(5):
+            self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=i + 1)
+        for complaint in Complaint.objects.all():
+            QRScanAttempt.objects.create(platform_location=self.locations[0], original_complaint=complaint, attempt_count=2)
+            ComplaintPhoto.objects.create(complaint=complaint, photo='complaints/photos/a.jpg')
+            ComplaintPhoto.objects.create(complaint=complaint, photo='complaints/photos/b.jpg')
+        response, queries = self.get_page()
+
+        self.assertEqual(queries, baseline)
+        rows = list(response.context['complaints'])
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row.scan_attempt_count == 2 and row.photo_count == 2 for row in rows))
+
+        closed, _ = self.get_page(tab='closed')
+        self.assertEqual(list(closed.context['complaints']), [])
+
+    def test_daughter_count_annotation(self):
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS', created_at=timezone.now() + timedelta(minutes=1))
+        self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=1)
+        self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=2)
+        response, _ = self.get_page()
+        first = response.context['complaints'][0]
+        self.assertEqual(first.pk, parent.pk)
+        self.assertEqual(first.daughter_count, 2)
+        self.assertContains(response, '(2 redundant)')
+
+
+class DashboardComplaintFeedTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        other_city = City.objects.create(name='Mumbai', code='BCT')
+        self.other_station = Station.objects.create(name='Mumbai Central', station_code='MMCT', city=other_city)
+        self.client.force_login(self.admin)
+
+    def get_feed(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard_complaints'), params)
+        return response, len(queries.captured_queries)
+
+    def test_filters(self):
+        now = timezone.now()
+        pending = self.create_complaint(self.locations[0], 'PENDING')
+        resolved = self.create_complaint(self.locations[1], 'RESOLVED', is_closed=True, closed_status='RESOLVED')
+        old = self.create_complaint(self.locations[2], 'PENDING', created_at=now - timedelta(days=5))
+        Complaint.objects.create(
+            complaint_number='TEST-OTHER', station=self.other_station, reporter_phone='1', status='PENDING'
+        )
+
+        def ids(**params):
+            response, _ = self.get_feed(**params)
+            self.assertEqual(response.status_code, 200)
+            return {row['id'] for row in response.json()['complaints']}
+
+        self.assertEqual(len(ids()), 4)
+        self.assertEqual(ids(city='DLI'), {pending.id, resolved.id, old.id})
+        self.assertEqual(ids(station=self.station.id, status='PENDING'), {pending.id, old.id})
+        self.assertEqual(ids(city='DLI', closed='true'), {resolved.id})
+        self.assertEqual(ids(city='DLI', date_to=(now - timedelta(days=1)).date().isoformat()), {old.id})
+        self.assertEqual(ids(city='DLI', date_from=now.date().isoformat(), closed='false'), {pending.id})
+
+        response, _ = self.get_feed(date_from='yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_pagination_and_query_count(self):
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS')
+        _, baseline = self.get_feed(page_size=5)
+        for i in range(11):
+            complaint = self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=i + 1)
+            ComplaintPhoto.objects.create(complaint=complaint, photo='complaints/photos/a.jpg')
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 5}
+            if cursor:
+                params['after'] = cursor
+            response, queries = self.get_feed(**params)
+            self.assertEqual(queries, baseline)
+            data = response.json()
+            seen.extend(row['id'] for row in data['complaints'])
+            if not data['has_next']:
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(len(set(seen)), 12)
+        parent_row = [row for row in data['complaints'] if row['id'] == parent.id][0]
+        self.assertEqual(parent_row['daughter_count'], 11)
+
+    def test_city_admin_only_sees_their_cities(self):
+        self.city.admin = self.user
+        self.city.save()
+        self.user.is_staff = True
+        self.user.save()
+        self.create_complaint(self.locations[0])
+        Complaint.objects.create(
+            complaint_number='TEST-OTHER', station=self.other_station, reporter_phone='1', status='PENDING'
+        )
+        self.client.force_login(self.user)
+        response, _ = self.get_feed(city='BCT')
+        self.assertEqual(response.json()['complaints'], [])
+        response, _ = self.get_feed()
+        self.assertEqual(len(response.json()['complaints']), 1)
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_complaints'], 1)
+
+
+class StationCacheTestsMixin:
+    def view_analytics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('station_analytics'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries.captured_queries)
+
+    def test_repeat_views_hit_cache_until_a_mutation(self):
+        self.client.force_login(self.user)
+        complaint = self.create_complaint(self.locations[0])
+
+        first, miss_queries = self.view_analytics()
+        second, hit_queries = self.view_analytics()
+        self.assertEqual(get_cache_stats()['hits'], 1)
+        self.assertEqual(get_cache_stats()['misses'], 1)
+        self.assertLess(hit_queries, miss_queries)
+        self.assertEqual(second.context['total_complaints'], 1)
+        self.assertEqual(second.context['station'], self.station)
+
+        # Every kind of complaint mutation invalidates the station
+        mutations = [
+            lambda: self.create_complaint(self.locations[1]),
+            lambda: self.client.post(reverse('assign_worker', args=[complaint.id]), {'worker_name': 'Ravi'}),
+            lambda: self.client.post(reverse('update_status', args=[complaint.id]), {'status': 'RESOLVED'}),
+            lambda: self.client.post(reverse('close_complaint', args=[complaint.id])),
+        ]
+        for mutate in mutations:
+            misses = get_cache_stats()['misses']
+            mutate()
+            self.view_analytics()
+            self.assertEqual(get_cache_stats()['misses'], misses + 1)
+
+        response, _ = self.view_analytics()
+        self.assertEqual(response.context['total_complaints'], 2)
+        self.assertEqual(response.context['closed_complaints'], 1)
+        self.assertEqual(response.context['worker_stats'][0]['assigned_worker'], 'Ravi')
+
+    def test_stations_are_invalidated_independently(self):
+        other_station = Station.objects.create(name='Other', station_code='OTH', city=self.city)
+        self.client.force_login(self.user)
+
+        self.view_analytics()
+        Complaint.objects.create(complaint_number='TEST-OTHER', station=other_station, reporter_phone='1')
+        self.view_analytics()
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        self.create_complaint(self.locations[0])
+        response, _ = self.view_analytics()
+        self.assertEqual(get_cache_stats()['misses'], 2)
+        self.assertEqual(response.context['total_complaints'], 1)
+
+
+class LocalMemoryStationCacheTests(StationCacheTestsMixin, StationTestCase):
+    pass
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(MEDIA_ROOT, 'cache'),
+    }
+})
+class FileStationCacheTests(StationCacheTestsMixin, StationTestCase):
+    pass
+
+
+class ComplaintNumberTests(StationTestCase):
+    def test_numbers_continue_per_city_and_day(self):
+        first = self.create_complaint(self.locations[0])
+        # Backdating used to shrink the day's COUNT(*) and hand out the same number twice
+        Complaint.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(days=1))
+        second = self.create_complaint(self.locations[0])
+        prefix = f"{timezone.now():%Y%m%d}-DLI-NDLS-"
+        self.assertEqual(first.complaint_number, prefix + '0001')
+        self.assertEqual(second.complaint_number, prefix + '0002')
+
+    def test_allocation_cost_does_not_depend_on_volume(self):
+        today = timezone.now().date()
+        ComplaintSequence.allocate(self.city, today)
+        with CaptureQueriesContext(connection) as few:
+            ComplaintSequence.allocate(self.city, today)
+        for _ in range(50):
+            self.create_complaint(self.locations[0])
+        with CaptureQueriesContext(connection) as many:
+            value = ComplaintSequence.allocate(self.city, today)
+        self.assertEqual(value, 53)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertFalse(any('COUNT' in query['sql'] for query in many.captured_queries))
+
+    def test_reseeding_continues_after_the_highest_used_number(self):
+        from django.apps import apps
+        reseed_sequences = import_module('complaints.migrations.0024_reseed_complaint_sequences').reseed_sequences
+        complaints = [self.create_complaint(self.locations[0]) for _ in range(3)]
+        complaints[0].delete()
+        # What seeding from the day's COUNT(*) produced
+        ComplaintSequence.objects.filter(city=self.city).update(last_value=2)
+
+        reseed_sequences(apps, None)
+        self.assertEqual(ComplaintSequence.objects.get(city=self.city).last_value, 3)
+        self.assertTrue(self.create_complaint(self.locations[0]).complaint_number.endswith('-0004'))
+
+
+class ConcurrentComplaintNumberTests(TransactionTestCase):
+    def test_concurrent_allocations_never_collide(self):
+        city = City.objects.create(name='Delhi', code='DLI')
+        today = timezone.now().date()
+        workers, per_worker = 8, 25
+        values, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(workers)
+
+        def allocate():
+            try:
+                barrier.wait()
+                for _ in range(per_worker):
+                    deadline = time_module.monotonic() + 30
+                    while True:
+                        try:
+                            value = ComplaintSequence.allocate(city, today)
+                            break
+                        except OperationalError:
+                            # SQLite's shared-cache test database reports lock contention instead of waiting
+                            if time_module.monotonic() > deadline:
+                                raise
+                            time_module.sleep(random.uniform(0.001, 0.005))
+                    with lock:
+                        values.append(value)
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(values), list(range(1, workers * per_worker + 1)))
+        self.assertEqual(ComplaintSequence.objects.get(city=city, date=today).last_value, workers * per_worker)
+
+
+class HotQueryIndexTests(TestCase):
+    def test_explain_command_uses_indexes_and_rolls_back(self):
+        out = StringIO()
+        call_command('explain_complaint_queries', complaints=500, stations=2, stdout=out)
+        output = out.getvalue()
+        if connection.vendor == 'sqlite':
+            for index in ('complaint_open_location_idx', 'complaint_station_closed_idx', 'complaint_open_created_idx', 'scan_attempt_location_idx'):
+                self.assertIn(index, output)
+        self.assertIn('rolled back', output)
+        self.assertFalse(City.objects.filter(code='EXPLN').exists())
+        self.assertFalse(Complaint.objects.exists())
+
+
+class HotLocationIndexTests(StationTestCase):
+    def create_verified(self, location):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_complaint(location, is_verified=True)
+
+    def scan(self, location):
+        return self.client.post(reverse('submit_complaint'), {
+            'station': self.station.id,
+            'platform_location': location.id,
+            'reporter_phone': '8888888888',
+            'description': 'Dirty floor',
+        })
+
+    def test_duplicate_scan_only_confirms_by_primary_key(self):
+        complaint = self.create_verified(self.locations[0])
+        self.assertEqual(get_active_complaint(self.locations[0].id).id, complaint.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.scan(self.locations[0])
+        self.assertRedirects(response, reverse('complaint_already_in_progress', args=[quote(self.locations[0].hash_id, safe=''), complaint.id]), fetch_redirect_response=False)
+        complaint_selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT') and 'FROM "complaints_complaint"' in q['sql']]
+        self.assertEqual(len(complaint_selects), 1)
+        self.assertIn('"complaints_complaint"."id" =', complaint_selects[0])
+        self.assertEqual(QRScanAttempt.objects.get(original_complaint=complaint).attempt_count, 1)
+        self.assertEqual(Complaint.objects.count(), 1)
+
+    def test_database_lookup_fills_index(self):
+        complaint = self.create_complaint(self.locations[1], is_verified=True)
+        self.assertIsNone(get_active_complaint(self.locations[1].id))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.scan(self.locations[1])
+        self.assertEqual(get_active_complaint(self.locations[1].id).id, complaint.id)
+
+    def test_closing_and_bulk_changes_evict(self):
+        complaint = self.create_verified(self.locations[0])
+        complaint.is_closed = True
+        complaint.save()
+        self.assertIsNone(get_active_complaint(self.locations[0].id))
+
+        other = self.create_verified(self.locations[2])
+        self.assertIsNotNone(get_active_complaint(self.locations[2].id))
+        record_bulk_change(Complaint.objects.filter(pk=other.pk), status='RESOLVED')
+        self.assertIsNone(get_active_complaint(self.locations[2].id))
+
+    def test_changes_missed_by_this_cache_are_caught(self):
+        complaint = self.create_verified(self.locations[0])
+        # Closed by another worker: its eviction went to that worker's cache
+        Complaint.objects.filter(pk=complaint.pk).update(is_closed=True)
+        self.assertIsNone(get_active_complaint(self.locations[0].id))
+
+        response = self.scan(self.locations[0])
+        self.assertFalse(QRScanAttempt.objects.exists())
+        self.assertEqual(Complaint.objects.count(), 2)
+        self.assertEqual(response.status_code, 302)
+
+    def test_entries_outside_the_window_are_ignored(self):
+        complaint = self.create_verified(self.locations[0])
+        later = timezone.now() + DUPLICATE_WINDOW + timedelta(seconds=1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertIsNone(get_active_complaint(self.locations[0].id))
+        self.assertEqual(get_active_complaint(self.locations[0].id).id, complaint.id)
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """Fast2SMS stand-in; replies with the next queued (status, body, delay) response"""
+
+    protocol_version = 'HTTP/1.1'  # keep connections alive like the real gateway
+
+    def do_POST(self):
+        server = self.server
+        body = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        server.received.append({key: values[0] for key, values in body.items()})
+        server.client_ports.add(self.client_address[1])
+        status, payload, delay = server.responses.pop(0) if server.responses else (200, {'return': True}, 0)
+        time_module.sleep(delay)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out
+
+    def log_message(self, *args):
+        pass
+
+
+class SMSOutboxTests(StationTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGatewayHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.gateway_settings = override_settings(
+            FAST2SMS_API_KEY='test-key',
+            FAST2SMS_URL=f'http://127.0.0.1:{cls.server.server_port}/dev/bulkV2',
+            SMS_READ_TIMEOUT=0.5,
+            SMS_MAX_ATTEMPTS=3,
+        )
+        cls.gateway_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.received = []
+        self.server.responses = []
+        self.server.client_ports = set()
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+
+    def dispatch(self):
+        call_command('dispatch_sms', once=True, workers=2, stdout=StringIO())
+
+    def test_submit_queues_otp_instead_of_calling_gateway(self):
+        with mock.patch('requests.Session.request') as request:
+            response = self.client.post(reverse('submit_complaint'), {
+                'station': self.station.id,
+                'platform_location': self.locations[0].id,
+                'reporter_phone': '8888888888',
+                'description': 'Dirty floor',
+            })
+        complaint = Complaint.objects.get()
+        self.assertRedirects(response, reverse('verify_otp', args=[complaint.id]), fetch_redirect_response=False)
+        request.assert_not_called()
+        message = SMSOutbox.objects.get()
+        self.assertEqual((message.complaint, message.phone_number, message.status), (complaint, '8888888888', 'PENDING'))
+        self.assertIn(complaint.otpverification.otp, message.message)
+
+    def test_dispatch_delivers_pending_messages(self):
+        for phone in ('9000000001', '9000000002', '9000000003'):
+            queue_sms(phone, f'Your OTP is {phone[-6:]}')
+        self.dispatch()
+        self.assertEqual(sorted(request['numbers'] for request in self.server.received), ['9000000001', '9000000002', '9000000003'])
+        self.assertEqual(set(SMSOutbox.objects.values_list('status', flat=True)), {'SENT'})
+        self.assertFalse(SMSOutbox.objects.filter(sent_at__isnull=True).exists())
+
+    def test_failures_are_retried_with_backoff(self):
+        message = queue_sms('9000000001', 'Your OTP is 123456')
+        self.server.responses = [(503, {}, 0), (200, {'return': True}, 1)]  # the second reply exceeds the read timeout
+
+        self.dispatch()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('PENDING', 1))
+        self.assertIn('503', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+        # Not due yet
+        self.dispatch()
+        self.assertEqual(len(self.server.received), 1)
+
+        SMSOutbox.objects.update(next_attempt_at=timezone.now())
+        self.dispatch()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('PENDING', 2))
+        self.assertIn('Timeout', message.last_error)
+
+        SMSOutbox.objects.update(next_attempt_at=timezone.now())
+        self.dispatch()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('SENT', 3))
+
+    def test_permanent_errors_and_exhausted_retries_fail(self):
+        rejected = queue_sms('9000000001', 'Your OTP is 123456')
+        self.server.responses = [(401, {'message': 'Invalid key'}, 0)]
+        self.dispatch()
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.status, rejected.attempts), ('FAILED', 1))
+
+        flaky = queue_sms('9000000002', 'Your OTP is 654321')
+        self.server.responses = [(500, {}, 0)] * 3
+        for _ in range(3):
+            SMSOutbox.objects.filter(status='PENDING').update(next_attempt_at=timezone.now())
+            self.dispatch()
+        flaky.refresh_from_db()
+        self.assertEqual((flaky.status, flaky.attempts), ('FAILED', 3))
+
+    def test_messages_of_a_crashed_dispatcher_are_claimed_again(self):
+        message = queue_sms('9000000001', 'Your OTP is 123456')
+        self.assertEqual(claim_batch(10), [message])
+        self.assertEqual(claim_batch(10), [])
+        SMSOutbox.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.dispatch()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('SENT', 2))
+
+    @override_settings(SMS_COALESCE_WINDOW_MS=50)
+    def test_identical_texts_are_sent_as_one_bulk_call(self):
+        for phone in ('9000000001', '9000000002', '9000000003'):
+            queue_sms(phone, 'Platform 1 washroom cleaned')
+        queue_sms('9000000004', 'Your OTP is 123456')
+        self.dispatch()
+        numbers = sorted(request['numbers'] for request in self.server.received)
+        self.assertEqual(numbers, ['9000000001,9000000002,9000000003', '9000000004'])
+        self.assertEqual(set(SMSOutbox.objects.values_list('status', flat=True)), {'SENT'})
+
+    def test_gateway_reuses_connections(self):
+        gateway = get_gateway()
+        for i in range(5):
+            gateway.send(f'900000000{i}', 'Your OTP is 123456')
+        self.assertEqual(len(self.server.received), 5)
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertEqual(gateway.stats.snapshot()['sends'], 5)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: self.now)
+
+    def test_opens_after_consecutive_failures_and_probes_after_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.before_call()
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.assertEqual(self.breaker.retry_after(), 30)
+
+        self.now = 31
+        self.breaker.before_call()  # trial call
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()  # only one trial at a time
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.now = 62
+        self.breaker.before_call()
+        self.breaker.record_success()
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.retry_after(), 0)
+
+
+    def test_unexpected_error_in_the_trial_call_reopens_the_circuit(self):
+        gateway = FakeGateway(failure_threshold=1, reset_timeout=30)
+        gateway.breaker.clock = lambda: self.now
+        gateway.fail_next(error=SMSError('Down'))
+        with self.assertRaises(SMSError):
+            gateway.send('9000000001', 'Your OTP is 123456')
+
+        self.now = 31
+        gateway.fail_next(error=RuntimeError('Bug in the client'))
+        with self.assertRaisesMessage(SMSError, 'RuntimeError: Bug in the client'):
+            gateway.send('9000000001', 'Your OTP is 123456')
+        self.assertFalse(gateway.breaker.trial_running)
+        self.assertEqual(gateway.stats.snapshot()['errors'], 2)
+
+        # The next trial goes ahead once the circuit's timeout has passed again
+        self.now = 62
+        gateway.send('9000000001', 'Your OTP is 123456')
+        self.assertEqual(gateway.sent, [('9000000001', 'Your OTP is 123456')])
+
+    def test_latency_stats_keep_a_bounded_window(self):
+        stats = LatencyStats(window=10)
+        for i in range(100):
+            stats.record(i / 1000, error=ValueError() if i % 2 else None)
+        snapshot = stats.snapshot()
+        self.assertEqual(len(stats.latencies), 10)
+        self.assertEqual((snapshot['sends'], snapshot['errors'], snapshot['recipients']), (100, 50, 100))
+        self.assertEqual((snapshot['p50_ms'], snapshot['max_ms']), (95.0, 99.0))
+
+
+@override_settings(SMS_BACKEND='complaints.sms_gateway.FakeGateway', SMS_CIRCUIT_FAILURE_THRESHOLD=2, SMS_CIRCUIT_RESET_TIMEOUT=60)
+class FakeGatewayDispatchTests(TestCase):
+    def setUp(self):
+        reset_gateway()
+        self.addCleanup(reset_gateway)
+
+    def test_open_circuit_fails_fast_without_spending_attempts(self):
+        gateway = get_gateway()
+        self.assertIsInstance(gateway, FakeGateway)
+        for i in range(5):
+            queue_sms(f'900000000{i}', f'Your OTP is 12345{i}')
+        gateway.fail_next(5)
+
+        call_command('dispatch_sms', once=True, workers=1, stdout=StringIO())
+
+        attempts = sorted(SMSOutbox.objects.values_list('attempts', flat=True))
+        self.assertEqual(attempts, [0, 0, 0, 1, 1])
+        self.assertEqual(set(SMSOutbox.objects.values_list('status', flat=True)), {'PENDING'})
+        self.assertFalse(SMSOutbox.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+        stats = gateway.stats.snapshot()
+        self.assertEqual((stats['sends'], stats['errors'], stats['circuit_rejected']), (2, 2, 3))
+        self.assertEqual(gateway.sent, [])
+
+    def test_surge_is_coalesced_within_the_window(self):
+        gateway = get_gateway()
+        for i in range(10):
+            queue_sms(f'90000000{i:02d}', 'Cleaning staff dispatched to platform 2')
+        queue_sms('9100000000', 'Your OTP is 111111')
+        queue_sms('9200000000', 'Your OTP is 222222')
+
+        with override_settings(SMS_BULK_MAX_RECIPIENTS=4):
+            call_command('dispatch_sms', once=True, workers=2, coalesce_window=5, stdout=StringIO())
+
+        self.assertEqual(sorted(len(numbers) for numbers, message in gateway.calls), [1, 1, 2, 4, 4])
+        self.assertEqual(len(gateway.sent), 12)
+        self.assertEqual(gateway.stats.snapshot()['recipients'], 12)
+        self.assertEqual(set(SMSOutbox.objects.values_list('status', flat=True)), {'SENT'})
+
+    @override_settings(SMS_COALESCE_WINDOW_MS=50)
+    def test_bulk_failure_applies_to_every_recipient(self):
+        gateway = get_gateway()
+        for i in range(3):
+            queue_sms(f'900000000{i}', 'Cleaning staff dispatched to platform 2')
+        gateway.fail_next(1)
+        call_command('dispatch_sms', once=True, workers=1, stdout=StringIO())
+        self.assertEqual(len(gateway.calls), 0)
+        self.assertEqual(list(SMSOutbox.objects.values_list('status', 'attempts').distinct()), [('PENDING', 1)])
+
+    def test_window_zero_sends_individually(self):
+        gateway = get_gateway()
+        for i in range(3):
+            queue_sms(f'900000000{i}', 'Cleaning staff dispatched to platform 2')
+        call_command('dispatch_sms', once=True, workers=1, coalesce_window=0, stdout=StringIO())
+        self.assertEqual(len(gateway.calls), 3)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StationOnboardingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='manager', password='secret')
+        self.client.force_login(self.user)
+        self.payload = {
+            'city_name': 'Mumbai',
+            'city_code': 'MUM',
+            'station_name': 'Mumbai Central',
+            'station_code': 'MMCT',
+            'total_platforms': 2,
+            'platform_locations': [
+                {'platform_number': 1, 'locations': ['Entry', 'Washroom', 'Food Court']},
+                {'platform_number': 2, 'locations': ['Waiting Area']},
+            ],
+        }
+
+    def test_station_setup_response(self):
+        response = self.client.post(reverse('station_setup'), json.dumps(self.payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        station = Station.objects.get(station_code='MMCT')
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['station_id'], station.id)
+        self.assertEqual(
+            [(item['platform_number'], item['location_description'], item['hash_id']) for item in data['locations']],
+            [(1, 'Entry', '(1/1)'), (1, 'Washroom', '(1/2)'), (1, 'Food Court', '(1/3)'), (2, 'Waiting Area', '(2/1)')],
+        )
+        for item in data['locations']:
+            location = PlatformLocation.objects.get(pk=item['id'])
+            self.assertEqual(item['qr_code_url'], reverse('location_qr_code', args=[location.id]))
+            self.assertEqual(self.client.get(item['qr_code_url']).status_code, 200)
+            # The storage appends a suffix if an earlier test left a file with the same name
+            self.assertTrue(location.qr_code.name.startswith(
+                f"qr_codes/qr_station_MMCT_platform_{location.platform_number}_{location.location_description.replace(' ', '_')}_{location.id}"
+            ))
+            with location.qr_code.open('rb') as image:
+                self.assertEqual(image.read(), render_qr(location.get_qr_code_data()))
+
+    def test_bulk_creation_continues_numbering_with_constant_queries(self):
+        city = City.objects.create(name='Mumbai', code='MUM')
+        station = Station.objects.create(name='Mumbai Central', station_code='MMCT', city=city, total_platforms=2)
+        PlatformLocation.objects.create(station=station, platform_number=1, location_description='Entry')
+
+        with CaptureQueriesContext(connection) as small:
+            bulk_create_locations(station, [{'platform_number': 1, 'locations': ['Washroom']}])
+        with CaptureQueriesContext(connection) as large:
+            locations = bulk_create_locations(station, [
+                {'platform_number': 1, 'locations': [f'Spot {i}' for i in range(10)]},
+                {'platform_number': 2, 'locations': [f'Spot {i}' for i in range(10)]},
+            ])
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(locations[0].hash_id, '(1/3)')
+        self.assertEqual(locations[-1].hash_id, '(2/10)')
+
+    def test_images_are_rendered_outside_the_write_transaction(self):
+        city = City.objects.create(name='Mumbai', code='MUM')
+        station = Station.objects.create(name='Mumbai Central', station_code='MMCT', city=city, total_platforms=1)
+        # The test case's own transaction is the only one open while rendering
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def render(data, workers=None):
+            depths.append(len(connection.atomic_blocks))
+            return [render_qr(item) for item in data]
+
+        with mock.patch('complaints.onboarding.render_qr_codes', side_effect=render):
+            locations = bulk_create_locations(station, [{'platform_number': 1, 'locations': ['Entry', 'Exit']}])
+        self.assertEqual(depths, [depth])
+        self.assertTrue(all(PlatformLocation.objects.get(pk=location.pk).qr_code for location in locations))
+
+    @override_settings(QR_RENDER_PARALLEL_THRESHOLD=2)
+    def test_process_pool_renders_the_same_images(self):
+        data = [f'http://localhost:8000/en/submit-complaint/?station=1&platform=1&location={i}' for i in range(4)]
+        self.assertEqual(render_qr_codes(data, workers=2), [render_qr(item) for item in data])
+
+
+class StationQRTests(StationTestCase):
+    def url(self, platform=1):
+        return reverse('generate_station_qr', args=[self.station.station_code, platform])
+
+    def test_renders_once_and_answers_revalidation_with_304(self):
+        with mock.patch('complaints.qr_cache.render_qr_png', wraps=render_qr_png) as render:
+            first = self.client.get(self.url())
+            second = self.client.get(self.url())
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertEqual(first.content, second.content)
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('max-age=', first['Cache-Control'])
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"') and not etag.startswith('W/'))
+        self.assertEqual(second['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'kiosk.example.com'])
+    def test_etag_follows_the_payload(self):
+        platform_1 = self.client.get(self.url(1))
+        platform_2 = self.client.get(self.url(2), HTTP_IF_NONE_MATCH=platform_1['ETag'])
+        other_host = self.client.get(self.url(1), HTTP_HOST='kiosk.example.com', HTTP_IF_NONE_MATCH=platform_1['ETag'])
+        self.assertEqual(platform_2.status_code, 200)
+        self.assertEqual(other_host.status_code, 200)
+        self.assertNotEqual(platform_2['ETag'], platform_1['ETag'])
+        self.assertNotEqual(other_host.content, platform_1.content)
+
+
+class QRArchiveDownloadTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.url = reverse('download_qr_codes', args=[self.station.id])
+
+    def read_zip(self, response):
+        content = b''.join(response.streaming_content)
+        return ZipFile(BytesIO(content))
+
+    def assert_archive_matches_locations(self, archive):
+        expected = {}
+        for location in self.station.platform_locations.all():
+            with location.qr_code.open('rb') as image:
+                expected[f"{location.hash_id}_{location.location_description.replace(' ', '_')}.png"] = image.read()
+        self.assertEqual({info.filename: archive.read(info) for info in archive.infolist()}, expected)
+        self.assertEqual({info.compress_type for info in archive.infolist()}, {ZIP_STORED})
+        self.assertIsNone(archive.testzip())
+
+    def test_streams_stored_zip(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=NDLS_qr_codes.zip')
+        self.assert_archive_matches_locations(self.read_zip(response))
+
+    @override_settings(QR_ARCHIVE_PREBUILT=True)
+    def test_prebuilt_archive_is_rebuilt_only_when_locations_change(self):
+        with mock.patch('complaints.qr_archive.iter_zip', wraps=iter_zip) as build:
+            first = self.read_zip(self.client.get(self.url))
+            self.client.get(self.url)
+            self.assertEqual(build.call_count, 1)
+            self.assert_archive_matches_locations(first)
+
+            PlatformLocation.objects.create(station=self.station, platform_number=3, location_description='Exit')
+            self.assert_archive_matches_locations(self.read_zip(self.client.get(self.url)))
+            self.assertEqual(build.call_count, 2)
+
+        # The replaced archive is kept while a download may still be opening it
+        self.assertEqual(len(self.archives()), 2)
+        self.age_archives()
+        self.client.get(self.url)
+        self.assertEqual(len(self.archives()), 1)
+
+    def archives(self):
+        return [name for name in default_storage.listdir(ARCHIVE_DIR)[1] if name.startswith(f'station_{self.station.id}_')]
+
+    def age_archives(self):
+        old = time_module.time() - CLEANUP_GRACE - 1
+        for name in self.archives():
+            os.utime(default_storage.path(f'{ARCHIVE_DIR}/{name}'), (old, old))
+
+    def test_concurrent_builds_keep_each_others_archive(self):
+        entries = archive_entries(self.station)
+        name = get_prebuilt_archive(self.station, entries)
+        # A second request built the same archive meanwhile and got a suffixed name
+        duplicate = default_storage.save(name, ContentFile(b'PK'))
+        self.assertNotEqual(duplicate, name)
+        self.assertEqual(get_prebuilt_archive(self.station, entries), name)
+        self.assertTrue(default_storage.exists(duplicate))
+
+        self.age_archives()
+        self.assertEqual(get_prebuilt_archive(self.station, entries), name)
+        self.assertFalse(default_storage.exists(duplicate))
+        self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QRFormatTests(TestCase):
+    payload = 'http://localhost:8000/en/submit-complaint/?station=1&platform=2&location=3'
+
+    def setUp(self):
+        self.station = Station.objects.create(name='Pune', station_code='PUNE', city=City.objects.create(name='Pune', code='PNQ'))
+
+    def svg_modules(self, svg):
+        """Dark modules drawn by render_qr_svg()'s path"""
+        modules = set()
+        path = re.search(r' d="([^"]*)"', svg.decode()).group(1)
+        x = y = 0
+        for command, a, b in re.findall(r'([Mmh])(-?[\d.]+)(?: (-?[\d.]+))?', path):
+            if command == 'M':
+                x, y = int(a), int(float(b))
+            elif command == 'm':
+                x += int(a)
+            else:
+                modules.update((x + i, y) for i in range(int(a)))
+                x += int(a)
+        return modules
+
+    def test_default_format_is_one_bit_png(self):
+        location = PlatformLocation.objects.create(station=self.station, platform_number=1, location_description='Entry')
+        self.assertTrue(location.qr_code.name.endswith('.png'))
+        with location.qr_code.open('rb') as image:
+            self.assertEqual(Image.open(image).mode, '1')
+        self.assertLess(len(render_qr(self.payload, 'png')), len(render_qr(self.payload, 'rgb-png')))
+
+    def test_svg_encodes_the_same_modules(self):
+        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+        qr.add_data(self.payload)
+        qr.make(fit=True)
+        expected = {(x, y) for y, row in enumerate(qr.get_matrix()) for x, dark in enumerate(row) if dark}
+        self.assertEqual(self.svg_modules(render_qr(self.payload, 'svg')), expected)
+
+    @override_settings(QR_CODE_FORMAT='svg')
+    def test_svg_locations_are_stored_and_archived_as_svg(self):
+        locations = bulk_create_locations(self.station, [{'platform_number': 1, 'locations': ['Entry', 'Exit']}])
+        for location in locations:
+            self.assertTrue(location.qr_code.name.endswith('.svg'))
+            with location.qr_code.open('rb') as image:
+                self.assertTrue(image.read().startswith(b'<svg'))
+        names = [name for name, field in archive_entries(self.station)]
+        self.assertEqual(names, ['(1/1)_Entry.svg', '(1/2)_Exit.svg'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RegenerateQRCodesTests(TestCase):
+    def setUp(self):
+        self.station = Station.objects.create(name='Nagpur', station_code='NGP', city=City.objects.create(name='Nagpur', code='NAG'))
+        self.locations = bulk_create_locations(self.station, [{'platform_number': 1, 'locations': ['Entry', 'Exit']}])
+
+    def regenerate(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('regenerate_qr_codes', '--station', 'NGP', *args, stdout=out)
+        return out.getvalue()
+
+    def test_up_to_date_locations_are_skipped(self):
+        names = [location.qr_code.name for location in self.locations]
+        self.assertIn('Regenerated 0 of 2 QR codes', self.regenerate())
+        self.assertEqual([location.qr_code.name for location in PlatformLocation.objects.order_by('pk')], names)
+
+    def test_domain_change_replaces_images(self):
+        old_names = [location.qr_code.name for location in self.locations]
+        with override_settings(QR_CODE_SCHEME='https', QR_CODE_DOMAIN='rail.example.com'):
+            self.assertIn('Would regenerate 2 of 2', self.regenerate('--dry-run'))
+            self.assertIn('Regenerated 2 of 2 QR codes', self.regenerate())
+            self.assertIn('Regenerated 0 of 2 QR codes', self.regenerate())
+            for location, old_name in zip(PlatformLocation.objects.order_by('pk'), old_names):
+                self.assertNotEqual(location.qr_code.name, old_name)
+                self.assertFalse(default_storage.exists(old_name))
+                self.assertEqual(location.qr_code_digest, location.get_qr_code_digest())
+                self.assertIn('https://rail.example.com/', location.get_qr_code_data())
+
+    def test_missing_digest_or_file_is_regenerated(self):
+        PlatformLocation.objects.filter(pk=self.locations[0].pk).update(qr_code_digest='')
+        default_storage.delete(self.locations[1].qr_code.name)
+        self.assertIn('Regenerated 2 of 2 QR codes', self.regenerate())
+        for location in PlatformLocation.objects.all():
+            self.assertTrue(default_storage.exists(location.qr_code.name))
+
+    def test_failed_update_removes_the_new_images(self):
+        names = [location.qr_code.name for location in self.locations]
+        directory = os.path.dirname(default_storage.path(names[0]))
+        files = sorted(os.listdir(directory))
+        with override_settings(QR_CODE_DOMAIN='rail.example.com'), \
+                mock.patch.object(PlatformLocation.objects, 'bulk_update', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                regenerate_qr_codes(self.locations)
+        self.assertEqual([location.qr_code.name for location in self.locations], names)
+        self.assertEqual(sorted(os.listdir(directory)), files)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UpdateHashIdsTests(TestCase):
+    def test_legacy_hash_ids_are_renumbered_per_platform(self):
+        station = Station.objects.create(name='Surat', station_code='ST', city=City.objects.create(name='Surat', code='STV'))
+        locations = bulk_create_locations(station, [
+            {'platform_number': 1, 'locations': ['A', 'B', 'C']},
+            {'platform_number': 2, 'locations': ['D', 'E']},
+        ])
+        PlatformLocation.objects.filter(pk__in=[location.pk for location in locations]).exclude(hash_id='(1/1)').update(hash_id='P1X')
+
+        out = StringIO()
+        call_command('update_hash_ids', '--dry-run', stdout=out)
+        self.assertIn('Would update 4 hash IDs', out.getvalue())
+        self.assertEqual(PlatformLocation.objects.filter(hash_id='P1X').count(), 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_hash_ids', '--batch-size', '2', stdout=StringIO())
+        # One window-function read plus a bulk update per chunk, not a COUNT and UPDATE per row
+        self.assertLess(len(queries), 15)
+        self.assertEqual(
+            list(PlatformLocation.objects.order_by('pk').values_list('hash_id', flat=True)),
+            ['(1/1)', '(1/2)', '(1/3)', '(2/1)', '(2/2)'],
+        )
+
+
+class AutoCloseComplaintsTests(StationTestCase):
+    def test_stale_complaints_and_their_daughters_are_closed_in_batches(self):
+        stale = timezone.now() - timedelta(days=2)
+        parent = self.create_complaint(self.locations[0], 'IN_PROGRESS', created_at=stale)
+        daughter = self.create_complaint(self.locations[0], 'IN_PROGRESS', parent_complaint=parent, intensity_count=1)
+        others = [self.create_complaint(self.locations[1], created_at=stale) for _ in range(4)]
+        fresh = self.create_complaint(self.locations[2])
+
+        out = StringIO()
+        call_command('auto_close_complaints', '--batch-size', '2', stdout=out)
+        self.assertIn('auto-closed 6 complaints in 3 batches', out.getvalue())
+        for complaint in [parent, daughter, *others]:
+            complaint.refresh_from_db()
+            self.assertTrue(complaint.is_closed)
+            self.assertEqual(complaint.closed_status, complaint.status)
+        fresh.refresh_from_db()
+        self.assertFalse(fresh.is_closed)
+        self.assertEqual(
+            sum(ComplaintHourlyRollup.objects.filter(is_closed=True).values_list('complaint_count', flat=True)), 6
+        )
+        self.assertFalse(JobLock.objects.get(name='auto_close_complaints').owner)
+
+    def test_run_is_skipped_while_another_node_holds_the_lock(self):
+        self.create_complaint(self.locations[0], created_at=timezone.now() - timedelta(days=2))
+        self.assertTrue(JobLock.acquire('auto_close_complaints', 'other-node:1', 600))
+
+        out = StringIO()
+        call_command('auto_close_complaints', stdout=out)
+        self.assertIn('Another node', out.getvalue())
+        self.assertEqual(Complaint.objects.filter(is_closed=False).count(), 1)
+
+        # An expired lease can be taken over
+        JobLock.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        call_command('auto_close_complaints', stdout=StringIO())
+        self.assertEqual(Complaint.objects.filter(is_closed=False).count(), 0)
+
+    def test_run_stops_when_another_node_takes_the_lock_over(self):
+        stale = timezone.now() - timedelta(days=2)
+        for _ in range(4):
+            self.create_complaint(self.locations[0], created_at=stale)
+
+        def steal_after_first_batch(queryset, **changes):
+            record_bulk_change(queryset, **changes)
+            # This node stalled past its lease and another one took it over
+            JobLock.objects.update(owner='other-node:1', locked_until=timezone.now() + timedelta(minutes=10))
+
+        out = StringIO()
+        with mock.patch('complaints.management.commands.auto_close_complaints.record_bulk_change', steal_after_first_batch):
+            call_command('auto_close_complaints', '--batch-size', '2', stdout=out)
+        self.assertIn('Lost the run lock to another node after 2 closed', out.getvalue())
+        self.assertEqual(Complaint.objects.filter(is_closed=False).count(), 2)
+        self.assertEqual(JobLock.objects.get(name='auto_close_complaints').owner, 'other-node:1')
+
+
+class DeleteDataTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_station = Station.objects.create(name='Old Delhi', station_code='DLI', city=self.city)
+        self.other_location = PlatformLocation.objects.create(station=self.other_station, platform_number=1, location_description='Gate')
+        self.kept = Complaint.objects.create(station=self.other_station, platform_location=self.other_location, reporter_phone='9999999999')
+
+        parents = [self.create_complaint(self.locations[index % 3]) for index in range(5)]
+        # A daughter created after later complaints still goes with its parent's batch
+        self.create_complaint(self.locations[0], parent_complaint=parents[0], intensity_count=1)
+        self.photos = []
+        for complaint in parents[:2]:
+            name = default_storage.save('complaints/photos/delete_me.jpg', BytesIO(b'jpeg'))
+            ComplaintPhoto.objects.create(complaint=complaint, photo=name)
+            self.photos.append(name)
+        queue_sms('9999999999', 'Closed', complaint=parents[0])
+
+    def test_station_is_deleted_in_batches_with_its_media(self):
+        qr_files = [location.qr_code.name for location in self.locations]
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('delete_data', '--station', 'NDLS', '--batch-size', '2', stdout=out)
+
+        self.assertIn('Deleted 6 complaints, 3 QR locations and 5 media files', out.getvalue())
+        self.assertFalse(Station.objects.filter(station_code='NDLS').exists())
+        self.assertEqual(list(Complaint.objects.all()), [self.kept])
+        self.assertEqual(ComplaintPhoto.objects.count(), 0)
+        self.assertEqual(PlatformLocation.objects.get().pk, self.other_location.pk)
+        self.assertIsNone(SMSOutbox.objects.get().complaint_id)
+        for name in self.photos + qr_files:
+            self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.other_location.qr_code.name))
+        # No SELECT of every cascaded row: statements grow with batches, not rows
+        self.assertLess(len(queries), 80)
+
+
+@override_settings(PHOTO_DISPLAY_SIZE=400, PHOTO_THUMBNAIL_SIZE=100)
+class PhotoVariantTests(StationTestCase):
+    def upload(self, content, name='upload.jpg'):
+        complaint = self.create_complaint(self.locations[0])
+        return ComplaintPhoto.objects.create(complaint=complaint, photo=default_storage.save(f'complaints/photos/{name}', BytesIO(content)))
+
+    def phone_jpeg(self):
+        """A landscape JPEG with the EXIF tag phones use for portrait shots"""
+        image = Image.new('RGB', (1200, 800), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90° clockwise
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def test_variants_are_made_off_request(self):
+        photo = self.upload(self.phone_jpeg())
+        broken = self.upload(b'not an image', 'broken.jpg')
+        self.assertEqual(photo.variants_status, 'PENDING')
+
+        out = StringIO()
+        call_command('process_photos', '--once', '--workers', '1', stdout=out)
+        self.assertIn('Made variants for 1 photos, 1 failed', out.getvalue())
+
+        photo.refresh_from_db()
+        self.assertEqual(photo.variants_status, 'READY')
+        self.assertIsNone(photo.locked_until)
+        with photo.display.open('rb') as display:
+            self.assertEqual(Image.open(display).size, (267, 400))
+        with photo.thumbnail.open('rb') as thumbnail:
+            self.assertEqual(max(Image.open(thumbnail).size), 100)
+        broken.refresh_from_db()
+        self.assertEqual(broken.variants_status, 'FAILED')
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('view_complaint_photo', args=[photo.id]))
+        self.assertContains(response, f'src="{photo.display_url}"')
+        self.assertContains(response, f'href="{photo.original_url}" download')
+
+    def test_expired_claims_are_taken_over(self):
+        photo = self.upload(self.phone_jpeg())
+        self.assertEqual([claimed.pk for claimed in claim_photos(10)], [photo.pk])
+        self.assertEqual(claim_photos(10), [])
+        ComplaintPhoto.objects.filter(pk=photo.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([claimed.pk for claimed in claim_photos(10)], [photo.pk])
+
+
+class ProtectedMediaTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        complaint = self.create_complaint(self.locations[0])
+        self.content = bytes(range(256)) * 40
+        self.photo = ComplaintPhoto.objects.create(
+            complaint=complaint, photo=default_storage.save('complaints/photos/protected.jpg', BytesIO(self.content))
+        )
+        self.client.force_login(self.user)
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.photo.original_url, headers=headers)
+
+    def test_original_is_sent_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+
+        self.assertEqual(self.get(**{'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.get(**{'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+        # A missing variant falls back to the original
+        self.assertEqual(b''.join(self.get(self.photo.thumbnail_url).streaming_content), self.content)
+
+    def test_byte_ranges(self):
+        response = self.get(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.get(Range='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+        self.assertEqual(self.get(Range=f'bytes={len(self.content)}-').status_code, 416)
+        # A stale If-Range gets the whole file
+        self.assertEqual(self.get(Range='bytes=0-9', **{'If-Range': '"stale"'}).status_code, 200)
+
+    def test_other_stations_and_anonymous_users_are_refused(self):
+        other = User.objects.create_user(username='other', password='secret')
+        Station.objects.create(name='Agra', station_code='AGC', city=self.city, manager=other)
+        self.client.force_login(other)
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(reverse('location_qr_code', args=[self.locations[0].id])).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.get().status_code, 302)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_front_proxy_sends_the_file(self):
+        response = self.get(reverse('location_qr_code', args=[self.locations[0].id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + quote(self.locations[0].qr_code.name))
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+
+class DeferredPhotoUploadTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        override = override_settings(PHOTO_UPLOAD_DIR=self.upload_dir, MEDIA_ROOT=MEDIA_ROOT)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'blue').save(buffer, format='JPEG')
+        self.jpeg = buffer.getvalue()
+
+    def submit(self):
+        response = self.client.post(reverse('submit_complaint'), {
+            'station': self.station.id,
+            'platform_location': self.locations[0].id,
+            'reporter_phone': '8888888888',
+            'deferred_photos': '1',
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def send(self, upload, offset, chunk, slot=1, token=None, size=None):
+        query = {'token': token or upload['upload_token'], 'slot': slot, 'offset': offset, 'size': size or len(self.jpeg), 'name': 'IMG_0001.jpg'}
+        return self.client.post(
+            f"{upload['upload_url']}?{'&'.join(f'{key}={quote(str(value))}' for key, value in query.items())}",
+            chunk, content_type='application/octet-stream',
+        )
+
+    def test_complaint_and_otp_exist_before_photos_arrive(self):
+        upload = self.submit()
+        complaint = Complaint.objects.get()
+        self.assertTrue(OTPVerification.objects.filter(complaint=complaint).exists())
+        self.assertEqual(upload['verify_url'], reverse('verify_otp', args=[complaint.id]))
+        self.assertFalse(complaint.photos.exists())
+
+        half = len(self.jpeg) // 2
+        self.assertEqual(self.send(upload, 0, self.jpeg[:half]).json(), {'status': 'partial', 'offset': half})
+        # A resent first chunk is refused with the offset to continue from
+        response = self.send(upload, 0, self.jpeg[:half])
+        self.assertEqual((response.status_code, response.json()['offset']), (409, half))
+        status = self.client.get(upload['upload_url'], {'token': upload['upload_token'], 'slot': 1}).json()
+        self.assertEqual(status, {'status': 'partial', 'offset': half})
+
+        photo_id = self.send(upload, half, self.jpeg[half:]).json()['photo_id']
+        photo = ComplaintPhoto.objects.get(pk=photo_id)
+        self.assertEqual((photo.complaint_id, photo.upload_slot, photo.variants_status), (complaint.id, 1, 'PENDING'))
+        with photo.photo.open('rb') as stored:
+            self.assertEqual(stored.read(), self.jpeg)
+        # Retrying the last chunk does not store the photo twice
+        self.assertEqual(self.send(upload, half, self.jpeg[half:]).json()['photo_id'], photo_id)
+        self.assertEqual(complaint.photos.count(), 1)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_retry_waiting_for_the_request_that_finishes_the_photo(self):
+        upload = self.submit()
+        complaint = Complaint.objects.get()
+        half = len(self.jpeg) // 2
+        self.send(upload, 0, self.jpeg[:half])
+        lock = locks.lock
+
+        def finished_while_waiting(file, flags):
+            # The other request stores the photo and removes the partial file we have open
+            store_photo(complaint, ContentFile(self.jpeg), 'IMG_0001.jpg', upload_slot=1)
+            os.remove(partial_path(complaint.pk, 1))
+            return lock(file, flags)
+
+        with mock.patch('complaints.uploads.locks', mock.Mock(lock=finished_while_waiting, unlock=locks.unlock, LOCK_EX=locks.LOCK_EX)):
+            photo = append_chunk(complaint, 1, half, len(self.jpeg), 'IMG_0001.jpg', self.jpeg[half:])
+        self.assertEqual(photo, complaint.photos.get())
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_bad_uploads_are_refused(self):
+        upload = self.submit()
+        self.assertEqual(self.send(upload, 0, self.jpeg, token='forged').status_code, 403)
+        self.assertEqual(self.send(upload, 0, self.jpeg, slot=5).status_code, 400)
+        with override_settings(PHOTO_UPLOAD_MAX_SIZE=10):
+            self.assertEqual(self.send(upload, 0, self.jpeg).status_code, 413)
+        self.assertEqual(self.send(upload, 0, b'not an image', size=12).status_code, 400)
+        self.assertFalse(ComplaintPhoto.objects.exists())
+
+    def test_invalid_form_is_reported_as_json(self):
+        response = self.client.post(reverse('submit_complaint'), {'station': self.station.id, 'deferred_photos': '1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('reporter_phone', response.json()['errors'])
+        self.assertFalse(Complaint.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PHOTO_DISPLAY_SIZE=400, PHOTO_THUMBNAIL_SIZE=100)
+class PhotoDeduplicationTests(StationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_station = Station.objects.create(name='Old Delhi', station_code='DLI', city=self.city)
+        self.other_location = PlatformLocation.objects.create(station=self.other_station, platform_number=1, location_description='Gate')
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), 'green').save(buffer, format='JPEG')
+        self.jpeg = buffer.getvalue()
+
+    def test_identical_photos_share_one_file_until_the_last_is_deleted(self):
+        first = store_photo(self.create_complaint(self.locations[0]), ContentFile(self.jpeg), 'forwarded.jpg')
+        other = Complaint.objects.create(station=self.other_station, platform_location=self.other_location, reporter_phone='9999999999')
+        second = store_photo(other, ContentFile(self.jpeg), 'forwarded.jpg')
+        content = PhotoContent.objects.get()
+        self.assertEqual((content.ref_count, content.size), (2, len(self.jpeg)))
+        self.assertEqual(first.photo.name, second.photo.name)
+
+        out = StringIO()
+        call_command('process_photos', '--once', '--workers', '1', stdout=out)
+        self.assertIn('Made variants for 2 photos, 0 failed', out.getvalue())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.display.name, second.display.name)
+        self.assertEqual(len(os.listdir(os.path.join(MEDIA_ROOT, 'complaints/photos/display'))), 1)
+
+        call_command('delete_data', '--station', 'NDLS', stdout=StringIO())
+        self.assertEqual(PhotoContent.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(second.photo.name))
+        self.assertTrue(default_storage.exists(second.thumbnail.name))
+
+        call_command('delete_data', '--station', 'DLI', stdout=StringIO())
+        self.assertFalse(PhotoContent.objects.exists())
+        for name in (second.photo.name, second.display.name, second.thumbnail.name):
+            self.assertFalse(default_storage.exists(name))
+
+    def test_existing_duplicates_are_merged(self):
+        legacy = []
+        for content in (self.jpeg, self.jpeg, b'other image'):
+            name = default_storage.save('complaints/photos/legacy.jpg', BytesIO(content))
+            legacy.append(ComplaintPhoto.objects.create(complaint=self.create_complaint(self.locations[0]), photo=name))
+
+        out = StringIO()
+        call_command('dedup_photos', '--dry-run', stdout=out)
+        self.assertIn(f'1 of 3 photos were duplicates. Would free {len(self.jpeg) / 1024 / 1024:.1f} MB', out.getvalue())
+        self.assertFalse(PhotoContent.objects.exists())
+
+        out = StringIO()
+        call_command('dedup_photos', '--batch-size', '2', stdout=out)
+        self.assertIn('1 of 3 photos were duplicates', out.getvalue())
+        for photo in legacy:
+            photo.refresh_from_db()
+        self.assertEqual(legacy[0].photo.name, legacy[1].photo.name)
+        self.assertEqual(legacy[1].content.ref_count, 2)
+        self.assertEqual(PhotoContent.objects.count(), 2)
+        self.assertEqual(len([name for name in os.listdir(os.path.join(MEDIA_ROOT, 'complaints/photos')) if name.startswith('legacy')]), 2)
+
+        # Deletes that bypass release_contents() are repaired on the next run
+        legacy[0].delete()
+        call_command('dedup_photos', stdout=out)
+        self.assertIn('Repaired 1 reference counts', out.getvalue())
+        self.assertEqual(PhotoContent.objects.get(pk=legacy[1].content_id).ref_count, 1)
+
+
+class DatabaseProfileTests(TransactionTestCase):
+    def test_new_sqlite_connections_are_tuned(self):
+        path = os.path.join(tempfile.mkdtemp(), 'profile.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        profile = type(connections['default'])({**connection.settings_dict, 'NAME': path}, alias='profile')
+        try:
+            with profile.cursor() as cursor:
+                values = []
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    values.append(cursor.fetchone()[0])
+        finally:
+            profile.close()
+        # synchronous=NORMAL reads back as 1
+        self.assertEqual(values, ['wal', 1, 5000, 256 * 1024 * 1024])
+
+    def test_benchmark_submits_complaints_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_complaint_submissions', '--threads', '1', '--requests', '3', stdout=out)
+        self.assertIn('Database profile: sqlite', out.getvalue())
+        self.assertIn('3 of 3 complaints stored', out.getvalue())
+        self.assertFalse(Station.objects.exists())
+        self.assertFalse(Complaint.objects.exists())
@@ -0,0 +1,146 @@
+"""
+Resumable complaint photo uploads.
+
+On slow platform networks the photos of a complaint take far longer to
+upload than the rest of the form. The submit page's script therefore posts
+the form without them: submit_complaint creates the complaint and queues the
+OTP straight away and answers with an upload token, and the browser sends
+each photo to upload_complaint_photo in PHOTO_UPLOAD_CHUNK_SIZE pieces while
+the reporter waits for and types the OTP.
+
+Every chunk names its photo slot (1-4) and byte offset. Chunks are appended
+to a partial file under PHOTO_UPLOAD_DIR, so a client that lost its
+connection asks for the current offset and continues from there; the last
+chunk turns the file into the slot's ComplaintPhoto. Tokens are signed
+complaint ids that expire after PHOTO_UPLOAD_TOKEN_MAX_AGE.
+"""
+import contextlib
+import os
+import time
+
+from PIL import Image
+from django.conf import settings
+from django.core import signing
+from django.core.files import File, locks
+from django.db import IntegrityError
+
+from .photo_store import store_photo
+
+TOKEN_SALT = 'complaints.photo-upload'
+MAX_SLOTS = 4
+
+
+class UploadError(Exception):
+    """A chunk was refused; offset is where the client should continue"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def make_upload_token(complaint):
+    return signing.dumps(complaint.pk, salt=TOKEN_SALT)
+
+
+def check_upload_token(token, complaint_id):
+    """Whether token allows uploading photos to the complaint now"""
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=settings.PHOTO_UPLOAD_TOKEN_MAX_AGE) == complaint_id
+    except signing.BadSignature:
+        return False
+
+
+def partial_path(complaint_id, slot):
+    return os.path.join(settings.PHOTO_UPLOAD_DIR, f'{complaint_id}_{slot}.part')
+
+
+def upload_offset(complaint, slot):
+    """Bytes of a photo received so far, or None once the photo is stored"""
+    if complaint.photos.filter(upload_slot=slot).exists():
+        return None
+    try:
+        return os.path.getsize(partial_path(complaint.pk, slot))
+    except FileNotFoundError:
+        return 0
+
+
+def append_chunk(complaint, slot, offset, size, filename, chunk):
+    """
+    Write chunk at offset of a photo upload of size bytes.
+
+    Returns the ComplaintPhoto once the last byte has arrived (also for a
+    retried last chunk), otherwise None. The partial file is locked while a
+    chunk is written, so concurrent retries cannot interleave.
+    """
+    if size > settings.PHOTO_UPLOAD_MAX_SIZE:
+        raise UploadError('Photo is too large', status=413)
+    if offset + len(chunk) > size:
+        raise UploadError('Chunk goes past the end of the photo')
+
+    photo = complaint.photos.filter(upload_slot=slot).first()
+    if photo is not None:
+        return photo
+
+    path = partial_path(complaint.pk, slot)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as partial:
+        locks.lock(partial, locks.LOCK_EX)
+        try:
+            # Another request may have finished this photo while we waited for the lock
+            photo = complaint.photos.filter(upload_slot=slot).first()
+            if photo is not None:
+                # Our open() created a new, empty partial file, unless we opened
+                # the one that request finished and already removed
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                return photo
+            current = partial.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadError('Chunk does not continue the upload', status=409, offset=current)
+            partial.write(chunk)
+            partial.flush()
+            if offset + len(chunk) < size:
+                return None
+            photo = _store(complaint, slot, filename, path)
+            os.remove(path)
+            return photo
+        finally:
+            locks.unlock(partial)
+
+
+def _store(complaint, slot, filename, path):
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        # Pillow raises anything from OSError to SyntaxError for a broken file
+        os.remove(path)
+        raise UploadError('Not an image')
+
+    try:
+        with open(path, 'rb') as upload:
+            return store_photo(complaint, File(upload), os.path.basename(filename) or 'photo.jpg', upload_slot=slot)
+    except IntegrityError:
+        # Stored first by a request on another node, which our file lock does not cover;
+        # a content stored for nothing is removed by recount_contents()
+        return complaint.photos.get(upload_slot=slot)
+
+
+def remove_stale_uploads():
+    """Delete partial files of uploads whose token has expired; returns how many"""
+    try:
+        names = os.listdir(settings.PHOTO_UPLOAD_DIR)
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - settings.PHOTO_UPLOAD_TOKEN_MAX_AGE
+    removed = 0
+    for name in names:
+        path = os.path.join(settings.PHOTO_UPLOAD_DIR, name)
+        try:
+            if name.endswith('.part') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
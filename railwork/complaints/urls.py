@@ -25,10 +25,12 @@ urlpatterns = [
     
     # Admin Dashboard (for superuser/staff)
     path('admin-dashboard/', views.dashboard, name='dashboard'),
+    path('admin-dashboard/complaints/', views.dashboard_complaints, name='dashboard_complaints'),
     
     # Public complaint submission
     path('submit/', views.submit_complaint, name='submit_complaint'),
     path('submit-complaint/', views.submit_complaint, name='submit_complaint_qr'),
+    path('upload-photo/<int:complaint_id>/', views.upload_complaint_photo, name='upload_complaint_photo'),
     path('verify-otp/<int:complaint_id>/', views.verify_otp, name='verify_otp'),
     path('success/<int:complaint_id>/', views.complaint_success, name='complaint_success'),
     path('already-in-progress/<str:hash_id>/<int:existing_complaint_id>/', views.complaint_already_in_progress, name='complaint_already_in_progress'),
@@ -49,6 +51,10 @@ urlpatterns = [
     # Photo viewing
     path('view-photo/<int:photo_id>/', views.view_complaint_photo, name='view_complaint_photo'),
     
+    # Protected media files
+    path('media/photos/<int:photo_id>/<str:variant>/', views.complaint_photo_file, name='complaint_photo_file'),
+    path('media/qr-codes/<int:location_id>/', views.location_qr_code, name='location_qr_code'),
+    
     # Support
     path('support/', views.support_request, name='support_request'),
     
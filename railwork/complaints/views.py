@@ -1,9 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
 from django.urls import reverse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import PasswordResetForm
@@ -12,28 +13,39 @@ from django.utils.translation import gettext as _
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.dateparse import parse_date
 from django.utils.encoding import force_bytes, force_str
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
-from django.db.models.functions import TruncMonth
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
 from django.utils import timezone
 from datetime import datetime, timedelta
 from urllib.parse import quote, unquote
 import qrcode
 import random
 import string
-import requests
-from io import BytesIO
-from .models import Station, Complaint, OTPVerification, ComplaintPhoto, City, PlatformLocation, LocationType, UserProfile, QRScanAttempt, SupportRequest
+from .models import Station, Complaint, OTPVerification, ComplaintPhoto, City, PlatformLocation, LocationType, UserProfile, QRScanAttempt, SupportRequest, ComplaintHourlyRollup
 from .forms import ComplaintForm, OTPVerificationForm
+from .analytics import get_cached_station_analytics
+from .rollups import record_bulk_change, record_scan_attempt
+from .location_index import DUPLICATE_WINDOW, get_active_complaint, remember
+from .media import serve_media
+from .onboarding import bulk_create_locations
+from .pagination import keyset_paginate
+from .photo_store import store_photo
+from .qr_archive import archive_entries, get_prebuilt_archive, iter_zip
+from .qr_cache import get_qr_png, qr_digest
+from .sms import queue_sms
+from .station_cache import get_cached, invalidate_station
+from .uploads import MAX_SLOTS, UploadError, append_chunk, check_upload_token, make_upload_token, upload_offset
 from django.core.exceptions import PermissionDenied
 import json
 import os
-from zipfile import ZipFile
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from PIL import Image
-from django.db import models
+from django.db import models, transaction
 
 # Authentication Views
 def user_login(request):
@@ -117,36 +129,43 @@ def user_dashboard(request):
     
     if tab == 'closed':
         # Show closed complaints
-        complaints = all_complaints.filter(is_closed=True).order_by('-closed_at')
-        # Statistics for closed complaints
-        total_complaints = complaints.count()
-        pending_complaints = complaints.filter(closed_status='PENDING').count()
-        in_progress_complaints = complaints.filter(closed_status='IN_PROGRESS').count()
-        resolved_complaints = complaints.filter(closed_status='RESOLVED').count()
+        complaints = all_complaints.filter(is_closed=True).annotate(sort_at=Coalesce('closed_at', 'created_at'))
     else:
         # Show recent (non-closed) complaints
-        complaints = all_complaints.filter(is_closed=False).order_by('-created_at')
-        # Statistics for recent complaints
-        total_complaints = complaints.count()
-        pending_complaints = complaints.filter(status='PENDING').count()
-        in_progress_complaints = complaints.filter(status='IN_PROGRESS').count()
-        resolved_complaints = complaints.filter(status='RESOLVED').count()
-    
-    # Add QR scan attempt data for each complaint
-    complaints_with_scan_attempts = []
-    for complaint in complaints:
-        try:
-            scan_attempt = QRScanAttempt.objects.get(
-                platform_location=complaint.platform_location,
-                original_complaint=complaint
-            )
-            complaint.scan_attempt_count = scan_attempt.attempt_count
-        except QRScanAttempt.DoesNotExist:
-            complaint.scan_attempt_count = 0
-        complaints_with_scan_attempts.append(complaint)
+        complaints = all_complaints.filter(is_closed=False).annotate(sort_at=models.F('created_at'))
+    
+    # Statistics from the hourly rollup (a closed complaint keeps the status it was closed with)
+    show_closed = tab == 'closed'
+    status_totals = get_cached(user_station.id, f'dashboard-stats:{show_closed}', lambda: dict(
+        ComplaintHourlyRollup.objects.filter(station=user_station, is_closed=show_closed)
+        .order_by().values_list('status').annotate(count=Sum('complaint_count'))
+    ))
+    total_complaints = sum(status_totals.values())
+    pending_complaints = status_totals.get('PENDING', 0)
+    in_progress_complaints = status_totals.get('IN_PROGRESS', 0)
+    resolved_complaints = status_totals.get('RESOLVED', 0)
+    
+    # One page of complaints with scan attempt, daughter and photo counts annotated
+    scan_attempts = QRScanAttempt.objects.filter(
+        platform_location=OuterRef('platform_location'),
+        original_complaint=OuterRef('pk')
+    ).values('attempt_count')[:1]
+    complaints = complaints.select_related('platform_location').prefetch_related('photos').annotate(
+        scan_attempt_count=Coalesce(Subquery(scan_attempts), 0),
+        daughter_count=subquery_count(Complaint.objects.filter(parent_complaint=OuterRef('pk')), 'parent_complaint'),
+        photo_count=subquery_count(ComplaintPhoto.objects.filter(complaint=OuterRef('pk')), 'complaint'),
+    )
+    page = keyset_paginate(
+        complaints,
+        'sort_at',
+        settings.DASHBOARD_PAGE_SIZE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     
     context = {
-        'complaints': complaints_with_scan_attempts,
+        'complaints': page.object_list,
+        'page': page,
         'user_station': user_station,
         'total_complaints': total_complaints,
         'pending_complaints': pending_complaints,
@@ -156,85 +175,89 @@ def user_dashboard(request):
     }
     return render(request, 'complaints/user_dashboard.html', context)
 
+def subquery_count(queryset, group_field):
+    """Correlated COUNT(*) of queryset, usable as an annotation"""
+    counts = queryset.order_by().values(group_field).annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts), 0)
+
 def generate_otp():
     return ''.join(random.choices(string.digits, k=6))
 
-def send_sms_fast2sms(phone_number, message):
-    url = "https://www.fast2sms.com/dev/bulkV2"
-    headers = {
-        'authorization': settings.FAST2SMS_API_KEY,
-        'Content-Type': "application/x-www-form-urlencoded"
-    }
-    payload = {
-        "route": "v3",
-        "sender_id": "TXTIND",
-        "message": message,
-        "language": "unicode",
-        "numbers": phone_number,
-    }
-    
-    try:
-        response = requests.post(url, headers=headers, data=payload)
-        return response.json()['return']
-    except Exception as e:
-        print(f"SMS sending failed: {str(e)}")
-        return False
+# Station QR images keep their original look: ECC level M, 5-module border, 1-bit PNG
+STATION_QR_OPTIONS = {'error_correction': qrcode.constants.ERROR_CORRECT_M, 'border': 5, 'rgb': False}
 
-def generate_station_qr(request, station_code, platform_number):
-    station = get_object_or_404(Station, station_code=station_code)
-    
-    # Generate the complaint URL with station and platform info
-    complaint_url = request.build_absolute_uri(
+def station_qr_payload(request, station_code, platform_number):
+    """URL encoded in a station QR image"""
+    return request.build_absolute_uri(
         reverse('submit_complaint') + 
         f'?station={station_code}&platform={platform_number}'
     )
+
+def station_qr_etag(request, station_code, platform_number):
+    return qr_digest(station_qr_payload(request, station_code, platform_number), **STATION_QR_OPTIONS)
+
+# The image only depends on the payload, so a matching If-None-Match is answered with a 304 before any work
+@condition(etag_func=station_qr_etag)
+def generate_station_qr(request, station_code, platform_number):
+    station = get_object_or_404(Station, station_code=station_code)
     
-    # Create QR code
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(complaint_url)
-    qr.make(fit=True)
-    
-    # Create image
-    img_buffer = BytesIO()
-    qr.make_image(fill_color="black", back_color="white").save(img_buffer)
-    img_buffer.seek(0)
+    # Generate the complaint URL with station and platform info
+    complaint_url = station_qr_payload(request, station_code, platform_number)
     
-    return HttpResponse(img_buffer.getvalue(), content_type="image/png")
+    # Render once per payload; repeat requests are served from the QR cache
+    response = HttpResponse(get_qr_png(complaint_url, **STATION_QR_OPTIONS), content_type="image/png")
+    patch_cache_control(response, public=True, max_age=settings.QR_CACHE_MAX_AGE)
+    return response
 
 def submit_complaint(request):
     if request.method == 'POST':
         form = ComplaintForm(request.POST, request.FILES)
+        # The page's script sends photos through upload_complaint_photo once the complaint exists
+        deferred_photos = request.POST.get('deferred_photos') == '1'
+        if deferred_photos and not form.is_valid():
+            return JsonResponse({'status': 'error', 'errors': form.errors.get_json_data()}, status=400)
         if form.is_valid():
             complaint = form.save(commit=False)
             
             # Smart QR Logic: Check if there's already a complaint for this location within 15 minutes
             if complaint.platform_location:
-                fifteen_minutes_ago = timezone.now() - timedelta(minutes=15)
+                fifteen_minutes_ago = timezone.now() - DUPLICATE_WINDOW
                 
-                # Check for ANY complaint (not just IN_PROGRESS) from the same location within 15 minutes
-                existing_recent_complaint = Complaint.objects.filter(
-                    platform_location=complaint.platform_location,
-                    created_at__gte=fifteen_minutes_ago,
-                    is_closed=False,
-                    is_verified=True  # Only consider verified complaints
-                ).first()
+                # Check for ANY complaint (not just IN_PROGRESS) from the same location within 15 minutes,
+                # answered from the hot-location index when the spot was scanned recently
+                existing_recent_complaint = get_active_complaint(complaint.platform_location_id)
+                if existing_recent_complaint is None:
+                    existing_recent_complaint = Complaint.objects.filter(
+                        platform_location=complaint.platform_location,
+                        created_at__gte=fifteen_minutes_ago,
+                        is_closed=False,
+                        is_verified=True  # Only consider verified complaints
+                    ).first()
+                    if existing_recent_complaint:
+                        remember(existing_recent_complaint)
                 
                 if existing_recent_complaint:
                     # Track this duplicate attempt
-                    scan_attempt, created = QRScanAttempt.objects.get_or_create(
-                        platform_location=complaint.platform_location,
-                        original_complaint=existing_recent_complaint,
-                        defaults={'attempt_count': 1, 'reporter_phones': complaint.reporter_phone}
-                    )
-                    
-                    if not created:
-                        # Increment existing attempt count
-                        scan_attempt.increment_attempt(complaint.reporter_phone)
+                    with transaction.atomic():
+                        scan_attempt, created = QRScanAttempt.objects.get_or_create(
+                            platform_location=complaint.platform_location,
+                            original_complaint=existing_recent_complaint,
+                            defaults={'attempt_count': 1, 'reporter_phones': complaint.reporter_phone}
+                        )
+                        
+                        if not created:
+                            # Increment existing attempt count
+                            scan_attempt.increment_attempt(complaint.reporter_phone)
+                        record_scan_attempt(existing_recent_complaint)
                     
                     # Don't create a new complaint - redirect to "already in progress" page
-                    return redirect('complaint_already_in_progress', 
-                                  hash_id=quote(complaint.platform_location.hash_id, safe=''),
-                                  existing_complaint_id=existing_recent_complaint.id)
+                    in_progress_url = reverse('complaint_already_in_progress', kwargs={
+                        'hash_id': quote(complaint.platform_location.hash_id, safe=''),
+                        'existing_complaint_id': existing_recent_complaint.id,
+                    })
+                    if deferred_photos:
+                        return JsonResponse({'status': 'redirect', 'url': in_progress_url})
+                    return redirect(in_progress_url)
                 
                 # If no recent complaint, proceed with parent-child logic for intensity tracking
                 parent_complaint = Complaint.objects.filter(
@@ -255,35 +278,36 @@ def submit_complaint(request):
                     existing_daughters = parent_complaint.daughter_complaints.count()
                     complaint.intensity_count = existing_daughters + 1
             
-            complaint.save()
-            
-            # Handle multiple photo uploads
-            photos = []
-            for i in range(1, 5):  # photo_1 to photo_4
-                photo = request.FILES.get(f'photo_{i}')
-                if photo:
-                    ComplaintPhoto.objects.create(complaint=complaint, photo=photo)
-                    photos.append(photo)
-            
-            # Generate and save OTP
-            otp = ''.join(random.choices(string.digits, k=6))
-            OTPVerification.objects.create(complaint=complaint, otp=otp)
-            
-            # Send OTP via SMS
-            if settings.FAST2SMS_API_KEY:
-                url = "https://www.fast2sms.com/dev/bulkV2"
-                payload = {
-                    "message": f"Your OTP for complaint verification is: {otp}",
-                    "language": "english",
-                    "route": "q",
-                    "numbers": complaint.reporter_phone,
-                }
-                headers = {
-                    "authorization": settings.FAST2SMS_API_KEY,
-                }
-                response = requests.post(url, data=payload, headers=headers)
+            with transaction.atomic():
+                complaint.save()
+                
+                # Handle multiple photo uploads
+                photos = []
+                for i in range(1, 5):  # photo_1 to photo_4
+                    photo = request.FILES.get(f'photo_{i}')
+                    if photo:
+                        store_photo(complaint, photo, photo.name)
+                        photos.append(photo)
+                
+                # Generate and save OTP
+                otp = ''.join(random.choices(string.digits, k=6))
+                OTPVerification.objects.create(complaint=complaint, otp=otp)
+                
+                # Queue the OTP SMS; the dispatch_sms command delivers it after commit
+                if settings.FAST2SMS_API_KEY:
+                    queue_sms(complaint.reporter_phone, f"Your OTP for complaint verification is: {otp}", complaint=complaint)
             
+            if deferred_photos:
+                return JsonResponse({
+                    'status': 'success',
+                    'verify_url': reverse('verify_otp', args=[complaint.id]),
+                    'upload_url': reverse('upload_complaint_photo', args=[complaint.id]),
+                    'upload_token': make_upload_token(complaint),
+                    'chunk_size': settings.PHOTO_UPLOAD_CHUNK_SIZE,
+                })
             return redirect('verify_otp', complaint_id=complaint.id)
+        # Invalid form: show it again with its errors (the script falls back to this too)
+        context = {'form': form}
     else:
         initial = {}
         station = None
@@ -329,6 +353,41 @@ def submit_complaint(request):
     
     return render(request, 'complaints/submit_complaint.html', context)
 
+@require_http_methods(['GET', 'POST'])
+def upload_complaint_photo(request, complaint_id):
+    """
+    Resumable chunked upload of one complaint photo (see uploads.py).
+
+    GET returns how many bytes of the slot's photo have arrived; POST appends
+    the raw request body at ?offset= to a photo of ?size= bytes.
+    """
+    complaint = get_object_or_404(Complaint, id=complaint_id)
+    if not check_upload_token(request.GET.get('token', ''), complaint.id):
+        return JsonResponse({'status': 'error', 'message': _('This upload link has expired.')}, status=403)
+    try:
+        slot = int(request.GET.get('slot', ''))
+        if not 1 <= slot <= MAX_SLOTS:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': _('Invalid photo slot')}, status=400)
+    
+    if request.method == 'GET':
+        offset = upload_offset(complaint, slot)
+        return JsonResponse({'status': 'complete' if offset is None else 'partial', 'offset': offset})
+    
+    try:
+        offset = int(request.GET['offset'])
+        size = int(request.GET['size'])
+        photo = append_chunk(complaint, slot, offset, size, request.GET.get('name', ''), request.body)
+    except (KeyError, ValueError):
+        return JsonResponse({'status': 'error', 'message': _('Invalid upload parameters')}, status=400)
+    except UploadError as e:
+        return JsonResponse({'status': 'error', 'message': str(e), 'offset': e.offset}, status=e.status)
+    
+    if photo is None:
+        return JsonResponse({'status': 'partial', 'offset': offset + len(request.body)})
+    return JsonResponse({'status': 'complete', 'photo_id': photo.id})
+
 def verify_otp(request, complaint_id):
     complaint = get_object_or_404(Complaint, id=complaint_id)
     otp_verification = get_object_or_404(OTPVerification, complaint=complaint)
@@ -397,22 +456,102 @@ def complaint_already_in_progress(request, hash_id, existing_complaint_id):
 def dashboard(request):
     # For superuser, show all complaints
     # For city admin, show only their city's complaints
+    # Complaint rows are loaded page by page from dashboard_complaints
     if request.user.is_superuser:
-        complaints = Complaint.objects.all().order_by('-created_at')
         stations = Station.objects.all()
         cities = City.objects.all()
     else:
         cities = City.objects.filter(admin=request.user)
         stations = Station.objects.filter(city__admin=request.user)
-        complaints = Complaint.objects.filter(station__city__admin=request.user).order_by('-created_at')
+    
+    total_complaints = ComplaintHourlyRollup.objects.filter(
+        station__in=stations
+    ).aggregate(total=Coalesce(Sum('complaint_count'), 0))['total']
     
     context = {
-        'complaints': complaints,
-        'stations': stations,
+        'stations': stations.order_by('name'),
         'cities': cities,
+        'total_complaints': total_complaints,
+        'status_choices': Complaint.STATUS_CHOICES,
     }
     return render(request, 'complaints/dashboard.html', context)
 
+@login_required
+def dashboard_complaints(request):
+    """Paginated, filterable JSON feed of complaints for the admin dashboard"""
+    if request.user.is_superuser:
+        complaints = Complaint.objects.all()
+    else:
+        complaints = Complaint.objects.filter(station__city__admin=request.user)
+    
+    # Filters
+    if request.GET.get('city'):
+        complaints = complaints.filter(station__city__code=request.GET['city'])
+    if request.GET.get('station'):
+        try:
+            complaints = complaints.filter(station_id=int(request.GET['station']))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': _('Invalid station')}, status=400)
+    if request.GET.get('status'):
+        if request.GET['status'] not in dict(Complaint.STATUS_CHOICES):
+            return JsonResponse({'status': 'error', 'message': _('Invalid status')}, status=400)
+        complaints = complaints.filter(status=request.GET['status'])
+    if request.GET.get('closed') in ('true', 'false'):
+        complaints = complaints.filter(is_closed=request.GET['closed'] == 'true')
+    for param, lookup in (('date_from', 'created_at__date__gte'), ('date_to', 'created_at__date__lte')):
+        if request.GET.get(param):
+            try:
+                value = parse_date(request.GET[param])
+            except ValueError:
+                value = None
+            if value is None:
+                return JsonResponse({'status': 'error', 'message': _('Invalid date')}, status=400)
+            complaints = complaints.filter(**{lookup: value})
+    
+    try:
+        page_size = min(max(int(request.GET.get('page_size', settings.DASHBOARD_PAGE_SIZE)), 1), 200)
+    except ValueError:
+        page_size = settings.DASHBOARD_PAGE_SIZE
+    
+    complaints = complaints.select_related('station__city', 'platform_location').prefetch_related('photos').annotate(
+        daughter_count=subquery_count(Complaint.objects.filter(parent_complaint=OuterRef('pk')), 'parent_complaint'),
+    )
+    page = keyset_paginate(complaints, 'created_at', page_size, after=request.GET.get('after'))
+    
+    rows = []
+    for complaint in page:
+        location = complaint.platform_location
+        rows.append({
+            'id': complaint.id,
+            'complaint_number': complaint.complaint_number,
+            'city': complaint.station.city.code if complaint.station.city else None,
+            'station': complaint.station.name,
+            'platform_number': location.platform_number if location else None,
+            'location_description': location.location_description if location else None,
+            'description': complaint.description or '',
+            'status': complaint.status,
+            'status_display': str(complaint.get_status_display()),
+            'is_closed': complaint.is_closed,
+            'assigned_worker': complaint.assigned_worker or '',
+            'is_daughter': complaint.parent_complaint_id is not None,
+            'intensity_count': complaint.intensity_count,
+            'daughter_count': complaint.daughter_count,
+            'photos': [
+                {'url': reverse('view_complaint_photo', args=[photo.id]), 'thumbnail': photo.thumbnail_url if photo.thumbnail else None}
+                for photo in complaint.photos.all()
+            ],
+            'created_at': timezone.localtime(complaint.created_at).strftime('%Y-%m-%d %H:%M'),
+            'update_status_url': reverse('update_status', args=[complaint.id]),
+            'assign_worker_url': reverse('assign_worker', args=[complaint.id]),
+        })
+    
+    return JsonResponse({
+        'status': 'success',
+        'complaints': rows,
+        'has_next': page.has_next,
+        'next_cursor': page.next_cursor,
+    })
+
 @login_required
 def station_setup(request):
     # Prevent regular users from creating stations if they already have one
@@ -481,25 +620,16 @@ def station_setup(request):
                 user_profile.station = station
                 user_profile.save()
 
-            # Create platform locations with custom descriptions
+            # Create platform locations with custom descriptions, in bulk
             created_locations = []
-            for platform_data in platform_locations:
-                platform_number = platform_data['platform_number']
-                locations = platform_data['locations']  # List of custom location descriptions
-                
-                for location_description in locations:
-                    platform_location = PlatformLocation.objects.create(
-                        station=station,
-                        platform_number=platform_number,
-                        location_description=location_description
-                    )
-                    created_locations.append({
-                        'id': platform_location.id,
-                        'platform_number': platform_number,
-                        'location_description': location_description,
-                        'hash_id': platform_location.hash_id,
-                        'qr_code_url': platform_location.qr_code.url if platform_location.qr_code else None
-                    })
+            for platform_location in bulk_create_locations(station, platform_locations):
+                created_locations.append({
+                    'id': platform_location.id,
+                    'platform_number': platform_location.platform_number,
+                    'location_description': platform_location.location_description,
+                    'hash_id': platform_location.hash_id,
+                    'qr_code_url': reverse('location_qr_code', args=[platform_location.id]) if platform_location.qr_code else None
+                })
 
             return JsonResponse({
                 'status': 'success',
@@ -532,18 +662,12 @@ def download_qr_codes(request, station_id):
     elif not request.user.is_superuser and station.city.admin != request.user:
         raise PermissionDenied(_("You don't have permission to download QR codes for this station."))
     
-    # Create a ZIP file
-    zip_buffer = BytesIO()
-    with ZipFile(zip_buffer, 'w') as zip_file:
-        for platform_location in station.platform_locations.all():
-            if platform_location.qr_code:
-                # Use hash_id and location_description for better organization
-                location_name = platform_location.location_description.replace(' ', '_').replace(',', '').replace('/', '_')
-                qr_name = f"{platform_location.hash_id}_{location_name}.png"
-                zip_file.writestr(qr_name, platform_location.qr_code.read())
-    
-    # Return the ZIP file
-    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+    # Stream the ZIP file entry by entry, or serve the station's prebuilt archive
+    entries = archive_entries(station)
+    if settings.QR_ARCHIVE_PREBUILT:
+        response = FileResponse(default_storage.open(get_prebuilt_archive(station, entries), 'rb'), content_type='application/zip')
+    else:
+        response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
     response['Content-Disposition'] = f'attachment; filename={station.station_code}_qr_codes.zip'
     return response
 
@@ -575,18 +699,21 @@ def update_complaint_status(request, complaint_id):
     
     if new_status in dict(Complaint.STATUS_CHOICES):
         old_status = complaint.status
-        complaint.status = new_status
-        complaint.save()
-        
-        # If this is a parent complaint and status changes, update all daughter complaints
-        if complaint.parent_complaint is None and complaint.daughter_complaints.exists():
-            if new_status != 'IN_PROGRESS':
-                # Auto-resolve all daughter complaints when parent status changes away from IN_PROGRESS
-                complaint.daughter_complaints.filter(is_closed=False).update(
-                    status='RESOLVED',
-                    updated_at=timezone.now()
-                )
-                messages.info(request, _('All related intensity complaints have been auto-resolved.'))
+        with transaction.atomic():
+            complaint.status = new_status
+            complaint.save()
+            
+            # If this is a parent complaint and status changes, update all daughter complaints
+            if complaint.parent_complaint is None and complaint.daughter_complaints.exists():
+                if new_status != 'IN_PROGRESS':
+                    # Auto-resolve all daughter complaints when parent status changes away from IN_PROGRESS
+                    open_daughters = complaint.daughter_complaints.filter(is_closed=False)
+                    record_bulk_change(open_daughters, status='RESOLVED')
+                    open_daughters.update(
+                        status='RESOLVED',
+                        updated_at=timezone.now()
+                    )
+                    messages.info(request, _('All related intensity complaints have been auto-resolved.'))
         
         messages.success(request, _('Complaint status updated to {status}').format(status=new_status))
     else:
@@ -618,20 +745,23 @@ def close_complaint(request, complaint_id):
     if complaint.is_closed:
         messages.error(request, _('Complaint is already closed.'))
     else:
-        # Close the complaint
-        complaint.is_closed = True
-        complaint.closed_at = timezone.now()
-        complaint.closed_status = complaint.status
-        complaint.save()
-        
-        # If this is a parent complaint, close all daughter complaints too
-        if complaint.parent_complaint is None and complaint.daughter_complaints.exists():
-            complaint.daughter_complaints.filter(is_closed=False).update(
-                is_closed=True,
-                closed_at=timezone.now(),
-                closed_status=models.F('status')
-            )
-            messages.info(request, _('All related intensity complaints have been closed as well.'))
+        with transaction.atomic():
+            # Close the complaint
+            complaint.is_closed = True
+            complaint.closed_at = timezone.now()
+            complaint.closed_status = complaint.status
+            complaint.save()
+            
+            # If this is a parent complaint, close all daughter complaints too
+            if complaint.parent_complaint is None and complaint.daughter_complaints.exists():
+                open_daughters = complaint.daughter_complaints.filter(is_closed=False)
+                record_bulk_change(open_daughters, is_closed=True)
+                open_daughters.update(
+                    is_closed=True,
+                    closed_at=timezone.now(),
+                    closed_status=models.F('status')
+                )
+                messages.info(request, _('All related intensity complaints have been closed as well.'))
         
         messages.success(request, _('Complaint has been closed successfully.'))
     
@@ -702,6 +832,46 @@ def view_complaint_photo(request, photo_id):
         'complaint': complaint
     })
 
+@login_required
+def complaint_photo_file(request, photo_id, variant):
+    """Image file of a complaint photo: the original upload, or its display or thumbnail variant"""
+    photo = get_object_or_404(ComplaintPhoto.objects.select_related('complaint__station__city'), id=photo_id)
+    complaint = photo.complaint
+    
+    # Same permissions as view_complaint_photo
+    if not request.user.is_superuser and not request.user.is_staff:
+        try:
+            user_station = request.user.managed_station
+            if complaint.station != user_station:
+                raise PermissionDenied(_("You don't have permission to view this photo."))
+        except Station.DoesNotExist:
+            raise PermissionDenied(_("You don't have a station assigned."))
+    elif not request.user.is_superuser and complaint.station.city.admin != request.user:
+        raise PermissionDenied(_("You don't have permission to view this photo."))
+    
+    # Variants that are not made yet fall back to the original
+    field = {'display': photo.display, 'thumbnail': photo.thumbnail}.get(variant) or photo.photo
+    return serve_media(request, field)
+
+@login_required
+def location_qr_code(request, location_id):
+    """Stored QR code image of one location"""
+    location = get_object_or_404(PlatformLocation.objects.select_related('station__city'), id=location_id)
+    station = location.station
+    
+    # Same permissions as download_qr_codes
+    if not request.user.is_superuser and not request.user.is_staff:
+        try:
+            user_station = request.user.managed_station
+            if user_station != station:
+                raise PermissionDenied(_("You don't have permission to download QR codes for this station."))
+        except Station.DoesNotExist:
+            raise PermissionDenied(_("You don't have a station assigned."))
+    elif not request.user.is_superuser and station.city.admin != request.user:
+        raise PermissionDenied(_("You don't have permission to download QR codes for this station."))
+    
+    return serve_media(request, location.qr_code)
+
 @login_required
 def station_analytics(request):
     """Analytics dashboard for station managers showing detailed statistics"""
@@ -724,200 +894,7 @@ def station_analytics(request):
         messages.error(request, _('No station assigned to your account.'))
         return redirect('user_dashboard')
     
-    # Get all complaints for this station
-    complaints = Complaint.objects.filter(station=station)
-    
-    # Overall statistics
-    total_complaints = complaints.count()
-    pending_complaints = complaints.filter(status='PENDING').count()
-    in_progress_complaints = complaints.filter(status='IN_PROGRESS').count()
-    resolved_complaints = complaints.filter(status='RESOLVED').count()
-    closed_complaints = complaints.filter(is_closed=True).count()
-    
-    # Daily Analytics - Today's statistics
-    today = timezone.now().date()
-    today_complaints = complaints.filter(created_at__date=today)
-    today_stats = {
-        'total': today_complaints.count(),
-        'pending': today_complaints.filter(status='PENDING').count(),
-        'in_progress': today_complaints.filter(status='IN_PROGRESS').count(),
-        'resolved': today_complaints.filter(status='RESOLVED').count(),
-        'closed': today_complaints.filter(is_closed=True).count(),
-    }
-    
-    # Yesterday's statistics for comparison
-    yesterday = today - timedelta(days=1)
-    yesterday_complaints = complaints.filter(created_at__date=yesterday)
-    yesterday_stats = {
-        'total': yesterday_complaints.count(),
-        'pending': yesterday_complaints.filter(status='PENDING').count(),
-        'in_progress': yesterday_complaints.filter(status='IN_PROGRESS').count(),
-        'resolved': yesterday_complaints.filter(status='RESOLVED').count(),
-        'closed': yesterday_complaints.filter(is_closed=True).count(),
-    }
-    
-    # Daily trend (last 30 days)
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    daily_data = []
-    for i in range(30):
-        date = (timezone.now() - timedelta(days=i)).date()
-        day_complaints = complaints.filter(created_at__date=date)
-        daily_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'date_display': date.strftime('%b %d'),
-            'total': day_complaints.count(),
-            'pending': day_complaints.filter(status='PENDING').count(),
-            'in_progress': day_complaints.filter(status='IN_PROGRESS').count(),
-            'resolved': day_complaints.filter(status='RESOLVED').count(),
-            'closed': day_complaints.filter(is_closed=True).count(),
-        })
-    daily_data.reverse()  # Show oldest to newest
-    
-    # Hourly pattern analysis (today)
-    hourly_stats = []
-    for hour in range(24):
-        hour_start = timezone.now().replace(hour=hour, minute=0, second=0, microsecond=0)
-        hour_end = hour_start + timedelta(hours=1)
-        hour_complaints = today_complaints.filter(
-            created_at__gte=hour_start,
-            created_at__lt=hour_end
-        )
-        hourly_stats.append({
-            'hour': hour,
-            'hour_display': f"{hour:02d}:00",
-            'count': hour_complaints.count(),
-        })
-    
-    # Weekly pattern (last 7 days)
-    weekly_stats = []
-    for i in range(7):
-        date = (timezone.now() - timedelta(days=i)).date()
-        day_complaints = complaints.filter(created_at__date=date)
-        weekly_stats.append({
-            'date': date,
-            'day_name': date.strftime('%A'),
-            'day_short': date.strftime('%a'),
-            'count': day_complaints.count(),
-        })
-    weekly_stats.reverse()
-    
-    # Top complaint locations (daily)
-    today_location_stats = []
-    for location in station.platform_locations.all():
-        location_today = today_complaints.filter(platform_location=location)
-        
-        # Get scan attempt data for this location
-        scan_attempts_today = QRScanAttempt.objects.filter(
-            platform_location=location,
-            last_attempt_at__date=today
-        )
-        total_scan_attempts = sum(attempt.attempt_count for attempt in scan_attempts_today)
-        
-        if location_today.count() > 0 or total_scan_attempts > 0:
-            today_location_stats.append({
-                'location': location,
-                'count': location_today.count(),
-                'pending': location_today.filter(status='PENDING').count(),
-                'resolved': location_today.filter(status='RESOLVED').count(),
-                'scan_attempts': total_scan_attempts,
-                'total_interest': location_today.count() + total_scan_attempts,  # Combined metric
-            })
-    today_location_stats.sort(key=lambda x: x['total_interest'], reverse=True)
-    
-    # Platform-wise statistics
-    platform_stats = []
-    for platform_num in range(1, station.total_platforms + 1):
-        platform_complaints = complaints.filter(platform_location__platform_number=platform_num)
-        platform_today = today_complaints.filter(platform_location__platform_number=platform_num)
-        platform_stats.append({
-            'platform_number': platform_num,
-            'total': platform_complaints.count(),
-            'today': platform_today.count(),
-            'pending': platform_complaints.filter(status='PENDING').count(),
-            'in_progress': platform_complaints.filter(status='IN_PROGRESS').count(),
-            'resolved': platform_complaints.filter(status='RESOLVED').count(),
-            'closed': platform_complaints.filter(is_closed=True).count(),
-        })
-    
-    # QR Location-wise statistics
-    qr_location_stats = []
-    for location in station.platform_locations.all():
-        location_complaints = complaints.filter(platform_location=location)
-        qr_location_stats.append({
-            'location': location,
-            'total': location_complaints.count(),
-            'pending': location_complaints.filter(status='PENDING').count(),
-            'resolved': location_complaints.filter(status='RESOLVED').count(),
-        })
-    
-    # Worker performance statistics
-    worker_stats = complaints.exclude(assigned_worker__isnull=True).exclude(assigned_worker='').values('assigned_worker').annotate(
-        total_assigned=Count('id'),
-        resolved_count=Count('id', filter=Q(status='RESOLVED')),
-        closed_count=Count('id', filter=Q(is_closed=True))
-    ).order_by('-resolved_count')
-    
-    # Monthly trend (last 12 months)
-    end_date = timezone.now()
-    start_date = end_date - timedelta(days=365)
-    
-    monthly_data = complaints.filter(
-        created_at__range=[start_date, end_date]
-    ).annotate(
-        month=TruncMonth('created_at')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
-    
-    # Status distribution for charts
-    status_distribution = {
-        'pending': pending_complaints,
-        'in_progress': in_progress_complaints,
-        'resolved': resolved_complaints,
-        'closed': closed_complaints,
-    }
-    
-    # Recent activity (last 30 days)
-    recent_complaints = complaints.filter(created_at__gte=thirty_days_ago).order_by('-created_at')[:10]
-    
-    # Calculate percentage changes from yesterday
-    def calculate_change(today_val, yesterday_val):
-        if yesterday_val == 0:
-            return 100 if today_val > 0 else 0
-        return round(((today_val - yesterday_val) / yesterday_val) * 100, 1)
-    
-    daily_changes = {
-        'total': calculate_change(today_stats['total'], yesterday_stats['total']),
-        'pending': calculate_change(today_stats['pending'], yesterday_stats['pending']),
-        'in_progress': calculate_change(today_stats['in_progress'], yesterday_stats['in_progress']),
-        'resolved': calculate_change(today_stats['resolved'], yesterday_stats['resolved']),
-    }
-    
-    context = {
-        'station': station,
-        'total_complaints': total_complaints,
-        'pending_complaints': pending_complaints,
-        'in_progress_complaints': in_progress_complaints,
-        'resolved_complaints': resolved_complaints,
-        'closed_complaints': closed_complaints,
-        
-        # Daily analytics
-        'today_stats': today_stats,
-        'yesterday_stats': yesterday_stats,
-        'daily_changes': daily_changes,
-        'daily_data': daily_data,
-        'hourly_stats': hourly_stats,
-        'weekly_stats': weekly_stats,
-        'today_location_stats': today_location_stats,
-        
-        # Existing analytics
-        'platform_stats': platform_stats,
-        'qr_location_stats': qr_location_stats,
-        'worker_stats': worker_stats,
-        'monthly_data': monthly_data,
-        'status_distribution': status_distribution,
-        'recent_complaints': recent_complaints,
-    }
+    context = get_cached_station_analytics(station)
     
     return render(request, 'complaints/station_analytics.html', context)
 
@@ -978,18 +955,9 @@ def manage_station(request):
                     continue
             
             # Create new locations
-            created_count = 0
-            for platform_data in new_locations:
-                platform_number = platform_data['platform_number']
-                locations = platform_data['locations']
-                
-                for location_description in locations:
-                    PlatformLocation.objects.create(
-                        station=station,
-                        platform_number=platform_number,
-                        location_description=location_description
-                    )
-                    created_count += 1
+            created_count = len(bulk_create_locations(station, new_locations))
+            
+            invalidate_station(station.id)
             
             message_parts = []
             if created_count > 0:
@@ -1023,7 +991,7 @@ def manage_station(request):
             'platform_number': location.platform_number,
             'location_description': location.location_description,
             'hash_id': location.hash_id,
-            'qr_code_url': location.qr_code.url if location.qr_code else None,
+            'qr_code_url': reverse('location_qr_code', args=[location.id]) if location.qr_code else None,
             'has_complaints': has_complaints
         })
     
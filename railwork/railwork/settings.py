@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 from django.utils.translation import gettext_lazy as _
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -83,14 +84,87 @@ WSGI_APPLICATION = 'railwork.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# DATABASE_ENGINE=postgresql uses the DATABASE_* server settings below (needs psycopg installed);
+# the default is the SQLite file DATABASE_PATH. Compare profiles with benchmark_complaint_submissions.
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'railwork'),
+            'USER': os.getenv('DATABASE_USER', 'railwork'),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', 'localhost'),
+            'PORT': os.getenv('DATABASE_PORT', '5432'),
+            # Keep connections open between requests instead of connecting for each one
+            'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '60')),  # seconds (None = forever)
+            # Test a reused connection before a request uses it, so a server restart costs no failed request
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DATABASE_CONNECT_TIMEOUT', '5')),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Take the write lock when a transaction starts. A deferred transaction that reads first
+                # and then writes cannot wait for a lock held by another writer and fails at once with
+                # "database is locked", whatever the busy timeout.
+                'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            },
+        }
+    }
 
-DATABASES = {
+# Applied to every new SQLite connection by complaints.db.configure_sqlite
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # readers and one writer no longer block each other
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # with WAL: durable except on power loss, no fsync per commit
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # milliseconds to wait for another writer's lock
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # bytes read through memory mapping (0 = off)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# CACHE_BACKEND picks the default cache: 'locmem' (per process, development only), 'file' (entries under
+# CACHE_LOCATION, shared by the worker processes of one server), 'redis' or 'memcached' (CACHE_LOCATION is
+# the server URL/address, shared by every server). The station cache and hot-location index are
+# invalidated by writing to it, so with DEBUG off it must be shared.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',  # needs the redis package
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',  # needs pymemcache
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem' if DEBUG else 'file')
+if CACHE_BACKEND == 'locmem' and not DEBUG:
+    # Other workers would keep serving stale station statistics and duplicate targets
+    raise ImproperlyConfigured("CACHE_BACKEND='locmem' is private to each process; use 'file', 'redis' or 'memcached'")
+CACHE_LOCATIONS = {
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'redis': 'redis://127.0.0.1:6379/1',
+    'memcached': '127.0.0.1:11211',
+}
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_LOCATIONS.get(CACHE_BACKEND, '')),
     }
 }
 
+# Per-station analytics/dashboard cache (see complaints/station_cache.py)
+STATION_CACHE_ALIAS = os.getenv('STATION_CACHE_ALIAS', 'default')
+# Entries are also dropped on every change; the timeout bounds staleness if an invalidation is lost
+STATION_CACHE_TIMEOUT = int(os.getenv('STATION_CACHE_TIMEOUT', '300'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -127,6 +201,9 @@ LOCALE_PATHS = [
 
 TIME_ZONE = 'UTC'
 
+# Time zone used to count station days and hours in analytics
+STATION_TIME_ZONE = os.getenv('STATION_TIME_ZONE', 'Asia/Kolkata')
+
 USE_I18N = True
 USE_L10N = True
 USE_TZ = True
@@ -149,6 +226,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Complaint photos and QR codes are served only after a permission check (see complaints/media.py).
+# MEDIA_SERVE_MODE: 'django' (FileResponse/sendfile), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+MEDIA_SERVE_MODE = os.getenv('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')  # nginx internal location aliased to MEDIA_ROOT
+MEDIA_MAX_AGE = int(os.getenv('MEDIA_MAX_AGE', '3600'))  # private browser cache lifetime in seconds
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -161,8 +244,64 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 # Theme Color
 THEME_COLOR = '#375BA4'
 
+# Number of complaints per page on the station manager dashboard
+DASHBOARD_PAGE_SIZE = int(os.getenv('DASHBOARD_PAGE_SIZE', '50'))
+
+# Scheme and host encoded in QR location codes; after changing them run regenerate_qr_codes
+QR_CODE_SCHEME = os.getenv('QR_CODE_SCHEME', 'http')
+QR_CODE_DOMAIN = os.getenv('DOMAIN', 'localhost:8000')
+
+# Format new QR location codes are stored in: 'png' (1-bit), 'svg' or 'rgb-png' (24-bit, the original format)
+QR_CODE_FORMAT = os.getenv('QR_CODE_FORMAT', 'png')
+
+# QR code rendering for bulk station setup: worker processes (0 = one per CPU)
+# and the smallest batch worth starting a process pool for
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', '0'))
+QR_RENDER_PARALLEL_THRESHOLD = int(os.getenv('QR_RENDER_PARALLEL_THRESHOLD', '32'))
+
+# Cache for rendered station QR images and the browser max-age they are served with
+QR_CACHE_ALIAS = os.getenv('QR_CACHE_ALIAS', 'default')
+QR_CACHE_MAX_AGE = int(os.getenv('QR_CACHE_MAX_AGE', str(30 * 24 * 60 * 60)))
+
+# Serve station QR code ZIPs from an archive kept in media storage (rebuilt when locations change)
+# instead of streaming a fresh archive for every download
+QR_ARCHIVE_PREBUILT = os.getenv('QR_ARCHIVE_PREBUILT', 'False') == 'True'
+
 # Fast2SMS Settings
 FAST2SMS_API_KEY = os.getenv('FAST2SMS_API_KEY')
+FAST2SMS_URL = os.getenv('FAST2SMS_URL', 'https://www.fast2sms.com/dev/bulkV2')
+
+# SMS gateway client: dotted path of the backend class (complaints.sms_gateway.FakeGateway for tests/benchmarks)
+SMS_BACKEND = os.getenv('SMS_BACKEND', 'complaints.sms_gateway.Fast2SMSGateway')
+SMS_POOL_SIZE = int(os.getenv('SMS_POOL_SIZE', '10'))  # kept-alive connections to the gateway
+SMS_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('SMS_CIRCUIT_FAILURE_THRESHOLD', '5'))  # consecutive failures that open the circuit
+SMS_CIRCUIT_RESET_TIMEOUT = float(os.getenv('SMS_CIRCUIT_RESET_TIMEOUT', '30'))  # seconds before a trial send is allowed
+
+# SMS outbox delivery (dispatch_sms command)
+SMS_CONNECT_TIMEOUT = float(os.getenv('SMS_CONNECT_TIMEOUT', '3.05'))
+SMS_READ_TIMEOUT = float(os.getenv('SMS_READ_TIMEOUT', '10'))
+SMS_MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', '5'))
+SMS_RETRY_BACKOFF = float(os.getenv('SMS_RETRY_BACKOFF', '10'))  # seconds before the first retry, doubled per attempt
+SMS_LOCK_TIMEOUT = int(os.getenv('SMS_LOCK_TIMEOUT', '60'))  # seconds before a crashed dispatcher's messages are retried
+# Gather messages this long to send identical texts in one call (0 = off). OTPs differ per recipient
+# and never coalesce, so only enable it for broadcast-style messages.
+SMS_COALESCE_WINDOW_MS = int(os.getenv('SMS_COALESCE_WINDOW_MS', '0'))
+SMS_BULK_MAX_RECIPIENTS = int(os.getenv('SMS_BULK_MAX_RECIPIENTS', '100'))  # numbers per bulk call
+
+# Complaint photo variants made by the process_photos command (see complaints/photos.py)
+PHOTO_DISPLAY_SIZE = int(os.getenv('PHOTO_DISPLAY_SIZE', '1600'))  # longest side in pixels
+PHOTO_THUMBNAIL_SIZE = int(os.getenv('PHOTO_THUMBNAIL_SIZE', '320'))
+PHOTO_VARIANT_FORMAT = os.getenv('PHOTO_VARIANT_FORMAT', 'jpeg')  # 'jpeg' or 'webp'
+PHOTO_VARIANT_QUALITY = int(os.getenv('PHOTO_VARIANT_QUALITY', '80'))
+PHOTO_WORKERS = int(os.getenv('PHOTO_WORKERS', '0'))  # encoding processes (0 = one per CPU)
+PHOTO_LOCK_TIMEOUT = int(os.getenv('PHOTO_LOCK_TIMEOUT', '300'))
+
+# Resumable photo uploads sent after the complaint is created (see complaints/uploads.py).
+# PHOTO_UPLOAD_DIR holds partial uploads and must be shared by all app servers.
+PHOTO_UPLOAD_DIR = os.getenv('PHOTO_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads'))
+PHOTO_UPLOAD_CHUNK_SIZE = int(os.getenv('PHOTO_UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+PHOTO_UPLOAD_MAX_SIZE = int(os.getenv('PHOTO_UPLOAD_MAX_SIZE', str(20 * 1024 * 1024)))
+PHOTO_UPLOAD_TOKEN_MAX_AGE = int(os.getenv('PHOTO_UPLOAD_TOKEN_MAX_AGE', '3600'))  # seconds
 
 # Login URL - changed from admin to user login
 LOGIN_URL = '/login/'